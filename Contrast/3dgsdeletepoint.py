@@ -1,4 +1,6 @@
 import argparse
+import numpy as np
+from binary_ply import read_ply_header, memmap_vertices, replace_vertex_properties
 
 def remove_points_by_id(ply_file, id_txt_file, output_ply_file):
     """
@@ -50,11 +52,69 @@ def remove_points_by_id(ply_file, id_txt_file, output_ply_file):
     print(f"Processing complete, {len(remove_ids)} points removed. Result saved to: {output_ply_file}")
 
 
+# Function to load the points to remove as a boolean mask over the rows of the PLY file
+def load_removal_mask(removal_file, vertex_count, id_base=1):
+    """
+    Load the points to remove as a boolean mask.
+
+    :param removal_file: Text file with one ID per line (as written by the SOR/ROR/DBSCAN scripts),
+                         .npy file with row indices or a boolean mask, or .bits file with a packed bitmask
+    :param vertex_count: Number of points in the PLY file
+    :param id_base: ID of the first row in text files (the denoise scripts number points from 1)
+    :return: Boolean array, True for the points to remove
+    """
+    if removal_file.endswith('.bits'):
+        packed = np.fromfile(removal_file, dtype=np.uint8)
+        return np.unpackbits(packed, count=vertex_count, bitorder='little').astype(bool)
+
+    if removal_file.endswith('.npy'):
+        removed = np.load(removal_file, mmap_mode='r')
+        if removed.dtype == np.bool_:
+            if len(removed) != vertex_count:
+                raise ValueError(f"Mask has {len(removed)} entries but the PLY file has {vertex_count} points")
+            return np.asarray(removed)
+        rows = np.asarray(removed, dtype=np.int64)
+    else:
+        rows = np.loadtxt(removal_file, dtype=np.int64, ndmin=1) - id_base
+
+    if len(rows) and (rows.min() < 0 or rows.max() >= vertex_count):
+        raise ValueError(f"Point index out of range for a PLY file with {vertex_count} points")
+    mask = np.zeros(vertex_count, dtype=bool)
+    mask[rows] = True
+    return mask
+
+# Function to remove points from a binary 3DGS PLY file by row index
+def remove_points_by_index(ply_file, removal_file, output_ply_file, id_base=1):
+    """
+    Remove points from a binary PLY file with a single boolean-mask gather on the memory-mapped records.
+
+    The row index of a point is its ID, so no ID column is needed in the PLY file.
+
+    :param ply_file: Path to the original binary 3DGS PLY file
+    :param removal_file: Points to remove (see load_removal_mask)
+    :param output_ply_file: Path to save the filtered binary PLY file
+    :param id_base: ID of the first row in text files
+    :return: Number of points removed
+    """
+    header, _, _, properties, _ = read_ply_header(ply_file)
+    vertices, _ = memmap_vertices(ply_file)
+    remove = load_removal_mask(removal_file, len(vertices), id_base)
+
+    retained = vertices[~remove]
+    with open(output_ply_file, 'wb') as f:
+        f.write(replace_vertex_properties(header, properties, len(retained)))
+        retained.tofile(f)
+
+    removed_count = len(vertices) - len(retained)
+    print(f"Processing complete, {removed_count} points removed. Result saved to: {output_ply_file}")
+    return removed_count
+
 # Set up command line arguments
 def parse_args():
     parser = argparse.ArgumentParser(description="Remove points from PLY file based on IDs.")
     parser.add_argument('--ply_file', type=str, required=True, help="Path to the input PLY file")
-    parser.add_argument('--id_txt_file', type=str, required=True, help="Path to the text file containing IDs to remove")
+    parser.add_argument('--id_txt_file', type=str, required=True, help="Points to remove: text file of IDs, .npy row indices or boolean mask, or .bits packed bitmask")
+    parser.add_argument('--id_base', type=int, default=1, help="ID of the first point in text ID files (default is 1, as written by the denoise scripts)")
     parser.add_argument('--output_ply_file', type=str, required=True, help="Path to save the output PLY file")
     return parser.parse_args()
 
@@ -63,8 +123,12 @@ def main():
     # Parse command line arguments
     args = parse_args()
 
-    # Call the function to remove points by ID
-    remove_points_by_id(args.ply_file, args.id_txt_file, args.output_ply_file)
+    # Binary 3DGS files are filtered by row index, ASCII files by their ID column
+    _, file_format, _, _, _ = read_ply_header(args.ply_file)
+    if file_format == 'binary_little_endian':
+        remove_points_by_index(args.ply_file, args.id_txt_file, args.output_ply_file, args.id_base)
+    else:
+        remove_points_by_id(args.ply_file, args.id_txt_file, args.output_ply_file)
 
 if __name__ == "__main__":
     main()
@@ -1,6 +1,8 @@
 import open3d as o3d
 import numpy as np
 import argparse
+from knn_graph import load_or_build, split_by_mask
+from grid_dbscan import grid_dbscan
 
 # Function to read the PLY file and extract x, y, z coordinates, and add IDs
 def read_ply(ply_file):
@@ -16,7 +18,7 @@ def read_ply(ply_file):
     return pcd, points, ids
 
 # Function to denoise the point cloud using DBSCAN and return inliers and outliers with their IDs
-def denoise_and_sort_with_dbscan(pcd, points, ids, eps=0.05, min_points=10):
+def denoise_and_sort_with_dbscan(pcd, points, ids, eps=0.05, min_points=10, graph=None, engine='open3d', memory_mb=1024, workers=4):
     """
     Denoise the point cloud using DBSCAN and return the inlier and outlier IDs.
     
@@ -25,9 +27,20 @@ def denoise_and_sort_with_dbscan(pcd, points, ids, eps=0.05, min_points=10):
     :param ids: The IDs corresponding to the points
     :param eps: DBSCAN epsilon parameter controlling the neighborhood size
     :param min_points: Minimum number of points for a neighborhood
+    :param graph: Optional precomputed KnnGraph; when given, only the noise points are classified
+                  (cluster labels are not needed to remove them)
+    :param engine: 'open3d' for pcd.cluster_dbscan, or 'grid' for the memory-bounded grid DBSCAN (pcd is not used)
+    :param memory_mb: Approximate memory budget of the grid engine in MB
+    :param workers: Number of threads of the grid engine
     :return: Filtered points, filtered IDs, and outlier IDs
     """
-    labels = np.array(pcd.cluster_dbscan(eps=eps, min_points=min_points, print_progress=True))
+    if graph is not None:
+        return split_by_mask(points, ids, graph.dbscan_inliers(eps, min_points))
+
+    if engine == 'grid':
+        labels = grid_dbscan(points, eps, min_points, memory_mb, workers)
+    else:
+        labels = np.array(pcd.cluster_dbscan(eps=eps, min_points=min_points, print_progress=True))
 
     # Inlier indices (non-noise points)
     inlier_indices = np.where(labels != -1)[0]
@@ -78,6 +91,10 @@ def parse_args():
     parser.add_argument('--txt_file_path', type=str, required=True, help="Path to save the removed IDs text file")
     parser.add_argument('--eps', type=float, default=0.05, help="DBSCAN epsilon parameter (neighborhood size)")
     parser.add_argument('--min_points', type=int, default=10, help="DBSCAN minimum points parameter (density)")
+    parser.add_argument('--knn_cache', type=str, default=None, help="Directory of cached neighbour tables shared with the other filters")
+    parser.add_argument('--engine', type=str, choices=['open3d', 'grid'], default='open3d', help="DBSCAN implementation; 'grid' bounds memory for very large point clouds")
+    parser.add_argument('--memory_mb', type=float, default=1024, help="Approximate memory budget of the grid engine in MB (default is 1024)")
+    parser.add_argument('--workers', type=int, default=4, help="Number of threads of the grid engine (default is 4)")
     return parser.parse_args()
 
 # Main function
@@ -88,8 +105,12 @@ def main():
     # Read the point cloud
     pcd, points, ids = read_ply(args.ply_file)
 
+    # Reuse (or build and cache) the neighbour table if a cache directory is given
+    graph = load_or_build(points, args.min_points, args.knn_cache) if args.knn_cache else None
+
     # Denoise using DBSCAN
-    filtered_points, filtered_ids, outlier_ids = denoise_and_sort_with_dbscan(pcd, points, ids, args.eps, args.min_points)
+    filtered_points, filtered_ids, outlier_ids = denoise_and_sort_with_dbscan(pcd, points, ids, args.eps, args.min_points, graph,
+                                                                              args.engine, args.memory_mb, args.workers)
 
     # Save the results
     save_denoised_point_cloud(filtered_points, filtered_ids, outlier_ids, args.output_ply_file, args.txt_file_path)
@@ -2,6 +2,8 @@ import open3d as o3d
 import numpy as np
 import os
 import argparse
+import time
+from knn_graph import load_or_build, split_by_mask, parse_values, print_sweep, save_sweep, ror_inliers_from_critical
 
 # Function to read the PLY file and extract x, y, z coordinates, and add IDs
 def read_ply(ply_file):
@@ -17,7 +19,7 @@ def read_ply(ply_file):
     return points, ids
 
 # Function to denoise the point cloud using Radius Outlier Removal (ROR) and return inliers and outliers with their IDs
-def denoise_and_sort_with_ror(points, ids, radius=0.05, min_neighbors=10):
+def denoise_and_sort_with_ror(points, ids, radius=0.05, min_neighbors=10, graph=None):
     """
     Denoise the point cloud using Radius Outlier Removal (ROR) and return the inlier and outlier IDs.
     
@@ -25,8 +27,12 @@ def denoise_and_sort_with_ror(points, ids, radius=0.05, min_neighbors=10):
     :param ids: The IDs corresponding to the points
     :param radius: The radius used for determining the neighborhood size
     :param min_neighbors: The minimum number of neighbors required to consider a point as an inlier
+    :param graph: Optional precomputed KnnGraph; when given, no neighbour search is run
     :return: Filtered points, filtered IDs, and outlier IDs
     """
+    if graph is not None:
+        return split_by_mask(points, ids, graph.ror_inliers(radius, min_neighbors))
+
     pcd = o3d.geometry.PointCloud()
     pcd.points = o3d.utility.Vector3dVector(points)
 
@@ -43,6 +49,36 @@ def denoise_and_sort_with_ror(points, ids, radius=0.05, min_neighbors=10):
 
     return filtered_points, filtered_ids, outlier_ids
 
+# Function to evaluate a grid of ROR parameters from a single neighbour query
+def sweep_ror(points, radii, neighbor_counts, sweep_dir, knn_cache=None):
+    """
+    Run ROR for every (radius, min_neighbors) combination.
+
+    A point is an inlier when its distance to its min_neighbors-th other neighbour is below the
+    radius, so one sorted neighbour-distance table answers the whole grid. The per-point critical
+    radii are saved as ror_critical_radius.npz, from which any radius can be applied later.
+
+    :param points: The points in the point cloud
+    :param radii: radius values to evaluate
+    :param neighbor_counts: min_neighbors values to evaluate
+    :param sweep_dir: Directory for the removed-count table, the removed masks and the critical radii
+    :param knn_cache: Optional directory of cached neighbour tables
+    :return: Path of the removed-count table
+    """
+    start = time.time()
+    graph = load_or_build(points, max(neighbor_counts) + 1, knn_cache)
+    radii, neighbor_counts, counts, removed, critical = graph.ror_sweep(radii, neighbor_counts)
+    print(f"Evaluated {counts.size} ROR settings in {time.time() - start:.2f}s")
+
+    param_names = ('radius', 'min_neighbors')
+    print_sweep(param_names, (radii, neighbor_counts), counts, len(points))
+    table_path = save_sweep(sweep_dir, 'ror', param_names, (radii, neighbor_counts), counts, removed)
+    critical_path = os.path.join(sweep_dir, 'ror_critical_radius.npz')
+    np.savez(critical_path, min_neighbors=np.asarray(neighbor_counts), critical_radius=critical)
+    print(f"Sweep table saved to {table_path}")
+    print(f"Critical radii saved to {critical_path}")
+    return table_path
+
 # Function to save the denoised point cloud and the removed IDs to separate files
 def save_denoised_point_cloud(filtered_points, filtered_ids, output_ply_file, outlier_ids):
     """
@@ -80,6 +116,11 @@ def parse_args():
     parser.add_argument('--output_ply_file', type=str, required=True, help="Path to save the denoised PLY file")
     parser.add_argument('--radius', type=float, default=0.05, help="Radius parameter for ROR (default is 0.05)")
     parser.add_argument('--min_neighbors', type=int, default=10, help="Minimum number of neighbors for ROR (default is 10)")
+    parser.add_argument('--knn_cache', type=str, default=None, help="Directory of cached neighbour tables shared with the other filters")
+    parser.add_argument('--sweep_dir', type=str, default=None, help="Run a parameter sweep and save its table, removed masks and critical radii here")
+    parser.add_argument('--sweep_radii', type=str, default=None, help="Comma-separated radius values to sweep, e.g. 0.02,0.05,0.1")
+    parser.add_argument('--sweep_min_neighbors', type=str, default=None, help="Comma-separated min_neighbors values to sweep, e.g. 5,10,20")
+    parser.add_argument('--critical_radius', type=str, default=None, help="ror_critical_radius.npz of an earlier sweep; applies --radius/--min_neighbors without a neighbour search")
     return parser.parse_args()
 
 # Main function
@@ -90,8 +131,23 @@ def main():
     # Read the point cloud
     points, ids = read_ply(args.ply_file)
 
-    # Denoise using Radius Outlier Removal (ROR)
-    filtered_points, filtered_ids, outlier_ids = denoise_and_sort_with_ror(points, ids, args.radius, args.min_neighbors)
+    # Evaluate a grid of parameters instead of a single setting
+    if args.sweep_dir:
+        radii = parse_values(args.sweep_radii, float) or [args.radius]
+        neighbor_counts = parse_values(args.sweep_min_neighbors, int) or [args.min_neighbors]
+        sweep_ror(points, radii, neighbor_counts, args.sweep_dir, args.knn_cache)
+        return
+
+    if args.critical_radius:
+        # Apply the setting from the critical radii of an earlier sweep
+        inlier_mask = ror_inliers_from_critical(args.critical_radius, args.radius, args.min_neighbors)
+        filtered_points, filtered_ids, outlier_ids = split_by_mask(points, ids, inlier_mask)
+    else:
+        # Reuse (or build and cache) the neighbour table if a cache directory is given
+        graph = load_or_build(points, args.min_neighbors + 1, args.knn_cache) if args.knn_cache else None
+
+        # Denoise using Radius Outlier Removal (ROR)
+        filtered_points, filtered_ids, outlier_ids = denoise_and_sort_with_ror(points, ids, args.radius, args.min_neighbors, graph)
 
     # Save the results
     save_denoised_point_cloud(filtered_points, filtered_ids, args.output_ply_file, outlier_ids)
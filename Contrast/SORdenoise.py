@@ -2,6 +2,8 @@ import open3d as o3d
 import numpy as np
 import os
 import argparse
+import time
+from knn_graph import load_or_build, split_by_mask, parse_values, print_sweep, save_sweep
 
 # Function to read the PLY file and extract x, y, z coordinates, and add IDs
 def read_ply(ply_file):
@@ -17,7 +19,7 @@ def read_ply(ply_file):
     return points, ids
 
 # Function to denoise the point cloud using Statistical Outlier Removal (SOR) and return inliers and outliers with their IDs
-def denoise_and_sort(points, ids, nb_neighbors=20, std_ratio=2.0):
+def denoise_and_sort(points, ids, nb_neighbors=20, std_ratio=2.0, graph=None):
     """
     Denoise the point cloud using Statistical Outlier Removal (SOR) and return the inlier and outlier IDs.
     
@@ -25,8 +27,12 @@ def denoise_and_sort(points, ids, nb_neighbors=20, std_ratio=2.0):
     :param ids: The IDs corresponding to the points
     :param nb_neighbors: The number of neighbors for the SOR filter (default is 20)
     :param std_ratio: The standard deviation ratio for the SOR filter (default is 2.0)
+    :param graph: Optional precomputed KnnGraph; when given, no neighbour search is run
     :return: Filtered points, filtered IDs, and outlier IDs
     """
+    if graph is not None:
+        return split_by_mask(points, ids, graph.sor_inliers(nb_neighbors, std_ratio))
+
     pcd = o3d.geometry.PointCloud()
     pcd.points = o3d.utility.Vector3dVector(points)
 
@@ -44,6 +50,33 @@ def denoise_and_sort(points, ids, nb_neighbors=20, std_ratio=2.0):
 
     return filtered_points, filtered_ids, outlier_ids
 
+# Function to evaluate a grid of SOR parameters from a single neighbour query
+def sweep_sor(points, neighbor_counts, std_ratios, sweep_dir, knn_cache=None):
+    """
+    Run SOR for every (nb_neighbors, std_ratio) combination.
+
+    The k_max = max(nb_neighbors) neighbours are queried once, the average distances for every
+    nb_neighbors come from a prefix sum over that table and all std_ratio thresholds are applied
+    at once, so a 10x10 grid costs about as much as a single run.
+
+    :param points: The points in the point cloud
+    :param neighbor_counts: nb_neighbors values to evaluate
+    :param std_ratios: std_ratio values to evaluate
+    :param sweep_dir: Directory for the removed-count table and the per-combination removed masks
+    :param knn_cache: Optional directory of cached neighbour tables
+    :return: Path of the removed-count table
+    """
+    start = time.time()
+    graph = load_or_build(points, max(neighbor_counts), knn_cache)
+    neighbor_counts, std_ratios, counts, removed = graph.sor_sweep(neighbor_counts, std_ratios)
+    print(f"Evaluated {counts.size} SOR settings in {time.time() - start:.2f}s")
+
+    param_names = ('nb_neighbors', 'std_ratio')
+    print_sweep(param_names, (neighbor_counts, std_ratios), counts, len(points))
+    table_path = save_sweep(sweep_dir, 'sor', param_names, (neighbor_counts, std_ratios), counts, removed)
+    print(f"Sweep table saved to {table_path}")
+    return table_path
+
 # Function to save the denoised point cloud and the removed IDs to separate files
 def save_denoised_point_cloud(filtered_points, filtered_ids, output_ply_file, outlier_ids):
     """
@@ -81,6 +114,10 @@ def parse_args():
     parser.add_argument('--output_ply_file', type=str, required=True, help="Path to save the denoised PLY file")
     parser.add_argument('--nb_neighbors', type=int, default=20, help="Number of neighbors for SOR filter (default is 20)")
     parser.add_argument('--std_ratio', type=float, default=2.0, help="Standard deviation ratio for SOR filter (default is 2.0)")
+    parser.add_argument('--knn_cache', type=str, default=None, help="Directory of cached neighbour tables shared with the other filters")
+    parser.add_argument('--sweep_dir', type=str, default=None, help="Run a parameter sweep and save its table and removed masks here")
+    parser.add_argument('--sweep_neighbors', type=str, default=None, help="Comma-separated nb_neighbors values to sweep, e.g. 10,20,30")
+    parser.add_argument('--sweep_std_ratios', type=str, default=None, help="Comma-separated std_ratio values to sweep, e.g. 0.5,1.0,2.0")
     return parser.parse_args()
 
 # Main function
@@ -91,8 +128,18 @@ def main():
     # Read the point cloud
     points, ids = read_ply(args.ply_file)
 
+    # Evaluate a grid of parameters instead of a single setting
+    if args.sweep_dir:
+        neighbor_counts = parse_values(args.sweep_neighbors, int) or [args.nb_neighbors]
+        std_ratios = parse_values(args.sweep_std_ratios, float) or [args.std_ratio]
+        sweep_sor(points, neighbor_counts, std_ratios, args.sweep_dir, args.knn_cache)
+        return
+
+    # Reuse (or build and cache) the neighbour table if a cache directory is given
+    graph = load_or_build(points, args.nb_neighbors, args.knn_cache) if args.knn_cache else None
+
     # Denoise using Statistical Outlier Removal (SOR)
-    filtered_points, filtered_ids, outlier_ids = denoise_and_sort(points, ids, args.nb_neighbors, args.std_ratio)
+    filtered_points, filtered_ids, outlier_ids = denoise_and_sort(points, ids, args.nb_neighbors, args.std_ratio, graph)
 
     # Save the results
     save_denoised_point_cloud(filtered_points, filtered_ids, args.output_ply_file, outlier_ids)
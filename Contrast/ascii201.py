@@ -1,6 +1,7 @@
 # 点云文件ASCII转二进制
 import struct
 import os
+import argparse
 
 def convert_ascii_ply_to_binary(ascii_ply_path, binary_ply_path):
     """
@@ -56,8 +57,20 @@ def convert_ascii_ply_to_binary(ascii_ply_path, binary_ply_path):
     print(f"Conversion complete. Binary PLY file saved at: {binary_ply_path}")
 
 
-# Example usage
-ascii_ply_path = "/home/acc/Desktop/sordenoise/airplane1/airplane_denoise_complete.ply"
-binary_ply_path = "/home/acc/Desktop/sordenoise/airplane1/airplane_denoise_complete_binary.ply"
+# Set up command line arguments
+def parse_args():
+    parser = argparse.ArgumentParser(description="Convert ASCII PLY to binary format.")
+    parser.add_argument('--ascii_ply_path', type=str, required=True, help="Path to the ASCII PLY file")
+    parser.add_argument('--binary_ply_path', type=str, required=True, help="Path to save the binary PLY file")
+    return parser.parse_args()
 
-convert_ascii_ply_to_binary(ascii_ply_path, binary_ply_path)
+# Main function
+def main():
+    # Parse command line arguments
+    args = parse_args()
+
+    # Call the function to convert ASCII PLY to binary
+    convert_ascii_ply_to_binary(args.ascii_ply_path, args.binary_ply_path)
+
+if __name__ == "__main__":
+    main()
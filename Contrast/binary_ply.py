@@ -0,0 +1,99 @@
+# Subset of Denoise/binary_ply.py used by the Contrast scripts (keep the two in sync)
+import numpy as np
+
+# PLY property types and their little-endian NumPy equivalents
+PLY_DTYPES = {
+    'char': 'i1', 'int8': 'i1',
+    'uchar': 'u1', 'uint8': 'u1',
+    'short': '<i2', 'int16': '<i2',
+    'ushort': '<u2', 'uint16': '<u2',
+    'int': '<i4', 'int32': '<i4',
+    'uint': '<u4', 'uint32': '<u4',
+    'float': '<f4', 'float32': '<f4',
+    'double': '<f8', 'float64': '<f8'
+}
+
+# Function to read the header of a PLY file
+def read_ply_header(file_path):
+    """
+    Read the header of a PLY file.
+
+    :param file_path: Path to the PLY file
+    :return: Header lines, format name, vertex count, vertex properties as (type, name) pairs
+             and the byte offset where the vertex data starts
+    """
+    header = []
+    file_format = None
+    vertex_count = 0
+    properties = []
+    in_vertex = False
+    with open(file_path, 'rb') as f:
+        while True:
+            raw = f.readline()
+            if not raw:
+                raise ValueError(f"No end_header found in {file_path}")
+            line = raw.decode('utf-8', errors='ignore')
+            header.append(line)
+            parts = line.split()
+            if not parts:
+                continue
+            if parts[0] == 'format':
+                file_format = parts[1]
+            elif parts[0] == 'element':
+                in_vertex = parts[1] == 'vertex'
+                if in_vertex:
+                    vertex_count = int(parts[2])
+            elif parts[0] == 'property' and in_vertex:
+                properties.append((parts[1], parts[-1]))
+            elif parts[0] == 'end_header':
+                data_offset = f.tell()
+                break
+    return header, file_format, vertex_count, properties, data_offset
+
+# Function to build the structured dtype of one vertex record
+def vertex_dtype(properties):
+    """Build a structured NumPy dtype from a list of (type, name) PLY properties."""
+    return np.dtype([(name, PLY_DTYPES[prop_type]) for prop_type, name in properties])
+
+# Function to memory-map the vertices of a binary PLY file
+def memmap_vertices(file_path, mode='r'):
+    """
+    Memory-map the vertex records of a binary little-endian PLY file as a structured array.
+
+    :param file_path: Path to the binary PLY file
+    :param mode: NumPy memmap mode ('r' for read-only, 'r+' for in-place edits)
+    :return: Structured memmap of the vertex records and the (type, name) property list
+    """
+    _, file_format, vertex_count, properties, data_offset = read_ply_header(file_path)
+    if file_format != 'binary_little_endian':
+        raise ValueError(f"{file_path} is not a binary_little_endian PLY file (format: {file_format})")
+    if vertex_count == 0:
+        return np.empty(0, dtype=vertex_dtype(properties)), properties  # np.memmap cannot map zero bytes
+    vertices = np.memmap(file_path, dtype=vertex_dtype(properties), mode=mode,
+                         offset=data_offset, shape=(vertex_count,))
+    return vertices, properties
+
+# Function to rebuild a PLY header with a new vertex property list
+def replace_vertex_properties(header, properties, vertex_count=None):
+    """
+    Rebuild a header with new vertex properties, keeping its other lines (comments, format).
+
+    :param header: Original header lines
+    :param properties: New list of (type, name) vertex properties
+    :param vertex_count: New vertex count, or None to keep the original one
+    :return: Header as bytes
+    """
+    lines = []
+    in_vertex = False
+    for line in header:
+        parts = line.split()
+        if parts and parts[0] == 'element':
+            in_vertex = parts[1] == 'vertex'
+            if in_vertex:
+                lines.append(line if vertex_count is None else f"element vertex {vertex_count}\n")
+                lines += [f"property {prop_type} {name}\n" for prop_type, name in properties]
+                continue
+        if parts and parts[0] == 'property' and in_vertex:
+            continue
+        lines.append(line)
+    return ''.join(lines).encode('ascii')
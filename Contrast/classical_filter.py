@@ -0,0 +1,150 @@
+import os
+import time
+import argparse
+import numpy as np
+import open3d as o3d
+from binary_ply import read_ply_header, memmap_vertices, replace_vertex_properties
+from SORdenoise import denoise_and_sort
+from RORdenoise import denoise_and_sort_with_ror
+from DBSCANdenoise import denoise_and_sort_with_dbscan
+from knn_graph import load_or_build
+
+# Filters run by --method all
+METHODS = ['sor', 'ror', 'dbscan']
+
+# Function to build the (N, 3) coordinate array of a memory-mapped 3DGS point cloud
+def xyz_view(vertices):
+    """Stack the x, y, z columns of the memory-mapped records into an (N, 3) float64 array."""
+    return np.stack([vertices['x'], vertices['y'], vertices['z']], axis=1).astype(np.float64)
+
+# Function to run one of the classical filters and return the indices of the removed points
+def run_filter(points, method, args, graph=None):
+    """
+    Run SOR, ROR or DBSCAN on the coordinates.
+
+    :param points: (N, 3) coordinates
+    :param method: 'sor', 'ror' or 'dbscan'
+    :param args: Parsed command line arguments holding the filter parameters
+    :param graph: Optional shared KnnGraph; when given, no neighbour search is run
+    :return: Sorted 0-based row indices of the removed points
+    """
+    ids = np.arange(len(points))
+    if method == 'sor':
+        _, _, outlier_ids = denoise_and_sort(points, ids, args.nb_neighbors, args.std_ratio, graph)
+    elif method == 'ror':
+        _, _, outlier_ids = denoise_and_sort_with_ror(points, ids, args.radius, args.min_neighbors, graph)
+    elif method == 'dbscan':
+        pcd = None
+        if graph is None and args.dbscan_engine == 'open3d':
+            pcd = o3d.geometry.PointCloud()
+            pcd.points = o3d.utility.Vector3dVector(points)
+        _, _, outlier_ids = denoise_and_sort_with_dbscan(pcd, points, ids, args.eps, args.min_points, graph,
+                                                         args.dbscan_engine, args.memory_mb, args.workers)
+    else:
+        raise ValueError(f"Unknown filter method: {method}")
+    return np.sort(outlier_ids)
+
+# Function to work out how many neighbours the shared table needs for the given filters
+def required_k(methods, args):
+    """Return the neighbour count that answers every listed filter from one table (the point itself included)."""
+    needed = {'sor': args.nb_neighbors, 'ror': args.min_neighbors + 1, 'dbscan': args.min_points}
+    return max(needed[method] for method in methods)
+
+# Function to add the filter name to an output path
+def method_path(path, method):
+    """Insert _<method> before the extension, e.g. filtered.ply -> filtered_sor.ply."""
+    root, ext = os.path.splitext(path)
+    return f"{root}_{method}{ext}"
+
+# Function to save the removed row indices in a compact form
+def save_removed(removed_path, removed, vertex_count):
+    """Save the removed row indices as a .npy index array, or as a packed bitmask for a .bits path."""
+    if removed_path.endswith('.bits'):
+        mask = np.zeros(vertex_count, dtype=bool)
+        mask[removed] = True
+        np.packbits(mask, bitorder='little').tofile(removed_path)
+    else:
+        index_dtype = np.uint32 if vertex_count <= np.iinfo(np.uint32).max else np.int64
+        np.save(removed_path, removed.astype(index_dtype))
+
+# Function to filter a binary 3DGS point cloud in one pass
+def filter_gaussians(ply_file, output_ply_file, removed_path, method, args, points=None, graph=None):
+    """
+    Filter a binary 3DGS PLY file with a classical method, without any ASCII or ID round trip.
+
+    :param ply_file: Path to the binary 3DGS PLY file
+    :param output_ply_file: Path to save the filtered binary PLY file
+    :param removed_path: Path to save the removed row indices (.npy) or bitmask (.bits)
+    :param method: 'sor', 'ror' or 'dbscan'
+    :param args: Parsed command line arguments holding the filter parameters
+    :param points: Optional (N, 3) coordinates already read from ply_file
+    :param graph: Optional shared KnnGraph of the coordinates
+    :return: Number of removed points
+    """
+    header, _, _, properties, _ = read_ply_header(ply_file)
+    vertices, _ = memmap_vertices(ply_file)
+    if points is None:
+        points = xyz_view(vertices)
+
+    start = time.time()
+    removed = run_filter(points, method, args, graph)
+    print(f"{method.upper()} removed {len(removed)} of {len(vertices)} points in {time.time() - start:.2f}s")
+
+    keep = np.ones(len(vertices), dtype=bool)
+    keep[removed] = False
+    retained = vertices[keep]
+    with open(output_ply_file, 'wb') as f:
+        f.write(replace_vertex_properties(header, properties, len(retained)))
+        retained.tofile(f)
+    save_removed(removed_path, removed, len(vertices))
+
+    print(f"Filtered point cloud saved to {output_ply_file}")
+    print(f"Removed indices saved to {removed_path}")
+    return len(removed)
+
+# Set up command line arguments
+def parse_args():
+    parser = argparse.ArgumentParser(description="Filter a binary 3DGS point cloud with SOR, ROR or DBSCAN in one step.")
+    parser.add_argument('--ply_file', type=str, required=True, help="Path to the binary 3DGS PLY file")
+    parser.add_argument('--output_ply_file', type=str, required=True, help="Path to save the filtered binary PLY file")
+    parser.add_argument('--removed_path', type=str, required=True, help="Path to save the removed 0-based row indices (.npy) or bitmask (.bits)")
+    parser.add_argument('--method', type=str, choices=METHODS + ['all'], default='sor',
+                        help="Classical filter to apply; 'all' runs every filter off one shared neighbour table")
+    parser.add_argument('--nb_neighbors', type=int, default=20, help="Number of neighbors for SOR (default is 20)")
+    parser.add_argument('--std_ratio', type=float, default=2.0, help="Standard deviation ratio for SOR (default is 2.0)")
+    parser.add_argument('--radius', type=float, default=0.05, help="Radius for ROR (default is 0.05)")
+    parser.add_argument('--min_neighbors', type=int, default=10, help="Minimum number of neighbors for ROR (default is 10)")
+    parser.add_argument('--eps', type=float, default=0.05, help="DBSCAN epsilon parameter (neighborhood size)")
+    parser.add_argument('--min_points', type=int, default=10, help="DBSCAN minimum points parameter (density)")
+    parser.add_argument('--dbscan_engine', type=str, choices=['open3d', 'grid'], default='open3d', help="DBSCAN implementation when no neighbour table is used")
+    parser.add_argument('--memory_mb', type=float, default=1024, help="Approximate memory budget of the grid DBSCAN in MB (default is 1024)")
+    parser.add_argument('--workers', type=int, default=4, help="Number of threads of the grid DBSCAN (default is 4)")
+    parser.add_argument('--knn_cache', type=str, default=None, help="Directory to cache the neighbour table in, keyed by the coordinates' hash")
+    return parser.parse_args()
+
+# Main function
+def main():
+    # Parse command line arguments
+    args = parse_args()
+
+    if args.method != 'all' and args.knn_cache is None:
+        # Filter the point cloud and save the results
+        filter_gaussians(args.ply_file, args.output_ply_file, args.removed_path, args.method, args)
+        return
+
+    # Build (or load) the neighbour table once and answer every filter from it
+    methods = METHODS if args.method == 'all' else [args.method]
+    vertices, _ = memmap_vertices(args.ply_file)
+    points = xyz_view(vertices)
+    start = time.time()
+    graph = load_or_build(points, required_k(methods, args), args.knn_cache)
+    print(f"Neighbour table with k={graph.k_max} ready in {time.time() - start:.2f}s")
+
+    for method in methods:
+        output_ply_file, removed_path = args.output_ply_file, args.removed_path
+        if args.method == 'all':
+            output_ply_file, removed_path = method_path(output_ply_file, method), method_path(removed_path, method)
+        filter_gaussians(args.ply_file, output_ply_file, removed_path, method, args, points, graph)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+import time
+import itertools
+import argparse
+import numpy as np
+import open3d as o3d
+from concurrent.futures import ThreadPoolExecutor
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+# Approximate bytes of temporaries per candidate point pair in a brute-force block
+BYTES_PER_PAIR = 128
+# Approximate bytes of temporaries per (cell, neighbour offset) candidate
+BYTES_PER_CELL_PAIR = 64
+# Number of core points per cell compared first when linking neighbouring core cells
+LINK_SAMPLE = 16
+# Cells are a little smaller than eps / sqrt(3), so any two points of one cell are closer than eps
+CELL_SHRINK = 1 - 1e-6
+
+# Uniform grid of the points, sorted by cell
+class CellGrid:
+    """
+    Uniform grid with cells of side eps / sqrt(3).
+
+    The points are sorted by cell key, so every cell is a contiguous range of the sorted points.
+    Two points closer than eps are at most two cells apart along each axis.
+    """
+
+    def __init__(self, points, eps):
+        self.eps = eps
+        self.eps2 = eps * eps
+        self.side = eps / np.sqrt(3) * CELL_SHRINK
+
+        # Integer cell coordinates, shifted by 2 so neighbour offsets of +-2 never wrap around
+        coords = np.floor((points - points.min(axis=0)) / self.side).astype(np.int64) + 2
+        dims = coords.max(axis=0) + 3
+        if int(dims[0]) * int(dims[1]) * int(dims[2]) >= np.iinfo(np.int64).max:
+            raise ValueError(f"eps={eps} is too small for the extent of the point cloud")
+        keys = (coords[:, 0] * dims[1] + coords[:, 1]) * dims[2] + coords[:, 2]
+        del coords
+
+        self.order = np.argsort(keys, kind='stable')
+        self.points = points[self.order]
+        self.cell_keys, self.cell_starts, self.cell_counts = np.unique(keys[self.order], return_index=True, return_counts=True)
+        self.point_cell = np.repeat(np.arange(len(self.cell_keys)), self.cell_counts)
+
+        # Offsets of the cells that can hold a point closer than eps
+        offsets = np.array(list(itertools.product(range(-2, 3), repeat=3)), dtype=np.int64)
+        gaps = np.maximum(np.abs(offsets) - 1, 0)
+        offsets = offsets[np.square(gaps).sum(axis=1) * self.side ** 2 < self.eps2]
+        self.offset_deltas = (offsets[:, 0] * dims[1] + offsets[:, 1]) * dims[2] + offsets[:, 2]
+
+    def neighbour_cells(self, cells, forward_only=False):
+        """
+        Pair each cell with its existing neighbour cells (itself included).
+
+        :param cells: Cell indices
+        :param forward_only: Keep only neighbours with a larger key, so each unordered pair appears once
+        :return: Arrays of query cell and neighbour cell indices
+        """
+        deltas = self.offset_deltas[self.offset_deltas > 0] if forward_only else self.offset_deltas
+        keys = (self.cell_keys[cells][:, None] + deltas[None, :]).ravel()
+        found = np.minimum(np.searchsorted(self.cell_keys, keys), len(self.cell_keys) - 1)
+        exists = self.cell_keys[found] == keys
+        return np.repeat(cells, len(deltas))[exists], found[exists]
+
+    def subset(self, mask):
+        """Return the indices (into the sorted points) of a masked subset and its per-cell starts and counts."""
+        index = np.flatnonzero(mask)
+        counts = np.bincount(self.point_cell[index], minlength=len(self.cell_keys))
+        starts = np.cumsum(counts) - counts
+        return index, starts, counts
+
+# Function to expand cell pairs into candidate point pairs
+def expand_pairs(a_starts, a_counts, b_starts, b_counts):
+    """Return the a and b indices of every point combination of the given (start, count) range pairs, and the range pair of each."""
+    sizes = a_counts * b_counts
+    pair = np.repeat(np.arange(len(sizes)), sizes)
+    within = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    b_size = b_counts[pair]
+    return a_starts[pair] + within // b_size, b_starts[pair] + within % b_size, pair
+
+# Function to find all point pairs closer than eps between pairs of cells, block by block
+def close_pairs(a_points, a_starts, a_counts, b_points, b_starts, b_counts, eps2, budget):
+    """
+    Yield the a and b indices of the point pairs closer than eps for the given cell ranges, and
+    the index of the cell pair each of them belongs to.
+
+    Cell pairs are grouped into blocks of about budget candidate pairs; a cell pair larger than
+    the budget is split along b (and a) so the temporaries never exceed the budget.
+    """
+    sizes = a_counts * b_counts
+    small = np.flatnonzero((sizes > 0) & (sizes <= budget))
+    if len(small):
+        block = np.cumsum(sizes[small]) // max(budget // 2, 1)
+        for group in np.split(small, np.flatnonzero(np.diff(block)) + 1):
+            a, b, pair = expand_pairs(a_starts[group], a_counts[group], b_starts[group], b_counts[group])
+            diff = a_points[a] - b_points[b]
+            close = np.einsum('ij,ij->i', diff, diff) < eps2
+            yield a[close], b[close], group[pair[close]]
+
+    for pair in np.flatnonzero(sizes > budget):
+        a_step = int(min(a_counts[pair], budget))
+        b_step = max(budget // a_step, 1)
+        for a0 in range(0, int(a_counts[pair]), a_step):
+            for b0 in range(0, int(b_counts[pair]), b_step):
+                a_count = min(a_step, int(a_counts[pair]) - a0)
+                b_count = min(b_step, int(b_counts[pair]) - b0)
+                a, b, _ = expand_pairs(np.array([a_starts[pair] + a0]), np.array([a_count]),
+                                       np.array([b_starts[pair] + b0]), np.array([b_count]))
+                diff = a_points[a] - b_points[b]
+                close = np.einsum('ij,ij->i', diff, diff) < eps2
+                yield a[close], b[close], np.full(np.count_nonzero(close), pair)
+
+# Function to run a task over slabs of cells in parallel
+def map_slabs(task, cells, slab_cells, workers):
+    """Split the (key-sorted) cells into contiguous slabs and run task on each one in a thread pool."""
+    slabs = [cells[start:start + slab_cells] for start in range(0, len(cells), slab_cells)]
+    if workers == 1 or len(slabs) <= 1:
+        return [task(slab) for slab in slabs]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(task, slabs))
+
+# Function to run DBSCAN on a uniform grid under a memory budget
+def grid_dbscan(points, eps, min_points, memory_mb=1024, workers=4):
+    """
+    DBSCAN with the same noise classification as open3d's cluster_dbscan, without neighbour lists.
+
+    A point is core when at least min_points points (itself included) are closer than eps. Every
+    cell holding min_points points is all core. The other points are counted against their
+    neighbour cells only. Core cells are joined with union-find (connected components) when two of
+    their core points are closer than eps; a few core points per cell are compared first, and all of
+    them only for neighbouring cells that are not connected yet. Each remaining point joins a cluster of a core point
+    closer than eps, or is noise. Cluster numbers of border points reachable from several clusters
+    may differ from open3d, whose result depends on the visiting order.
+
+    :param points: (N, 3) coordinates
+    :param eps: Neighbourhood radius
+    :param min_points: Minimum number of points (itself included) for a core point
+    :param memory_mb: Approximate budget for the temporaries of all workers together
+    :param workers: Number of threads processing slabs of cells
+    :return: (N,) int64 labels, -1 for noise
+    """
+    points = np.asarray(points, dtype=np.float64)
+    labels = np.full(len(points), -1, dtype=np.int64)
+    if len(points) == 0:
+        return labels
+
+    budget = max(int(memory_mb * 2 ** 20 / (max(workers, 1) * BYTES_PER_PAIR)), 1024)
+    grid = CellGrid(points, eps)
+    slab_cells = max(int(memory_mb * 2 ** 20 / (max(workers, 1) * BYTES_PER_CELL_PAIR * len(grid.offset_deltas))), 1)
+
+    # Core points: full cells directly, the points of the other cells by counting their neighbours
+    core = np.repeat(grid.cell_counts >= min_points, grid.cell_counts)
+    sparse_cells = np.flatnonzero(grid.cell_counts < min_points)
+
+    def count_neighbours(slab):
+        query, target = grid.neighbour_cells(slab)
+        first = grid.cell_starts[slab[0]]
+        counts = np.zeros(grid.cell_starts[slab[-1]] + grid.cell_counts[slab[-1]] - first, dtype=np.int64)
+        for a, _, _ in close_pairs(grid.points, grid.cell_starts[query], grid.cell_counts[query],
+                                   grid.points, grid.cell_starts[target], grid.cell_counts[target], grid.eps2, budget):
+            counts += np.bincount(a - first, minlength=len(counts))
+        return first + np.flatnonzero(counts >= min_points)
+
+    for found in map_slabs(count_neighbours, sparse_cells, slab_cells, workers):
+        core[found] = True
+    if not core.any():
+        return labels  # All noise
+
+    # Clusters: connected components of the core cells, joined when two core points are closer than eps
+    core_index, core_starts, core_counts = grid.subset(core)
+    core_points = grid.points[core_index]
+    core_cells = np.flatnonzero(core_counts)
+
+    def link_pairs(query, target):
+        links = []
+
+        # Large cell pairs only need one close pair: ask a k-d tree of one cell for the nearest neighbour
+        large = core_counts[query] * core_counts[target] > budget
+        for cell_a, cell_b in zip(query[large], target[large]):
+            if core_counts[cell_a] > core_counts[cell_b]:
+                cell_a, cell_b = cell_b, cell_a
+            a_points = core_points[core_starts[cell_a]:core_starts[cell_a] + core_counts[cell_a]]
+            b_points = core_points[core_starts[cell_b]:core_starts[cell_b] + core_counts[cell_b]]
+            tree = cKDTree(b_points)
+            for a0 in range(0, len(a_points), budget):
+                chunk = a_points[a0:a0 + budget]
+                _, nearest = tree.query(chunk, k=1, distance_upper_bound=grid.eps * (1 + 1e-9))
+                hit = nearest < len(b_points)
+                diff = chunk[hit] - b_points[nearest[hit]]
+                if np.any(np.einsum('ij,ij->i', diff, diff) < grid.eps2):
+                    links.append(np.array([[cell_a, cell_b]]))
+                    break
+
+        query, target = query[~large], target[~large]
+        linked = np.zeros(len(query), dtype=bool)
+        for _, _, pair in close_pairs(core_points, core_starts[query], core_counts[query],
+                                      core_points, core_starts[target], core_counts[target], grid.eps2, budget):
+            linked[pair] = True
+        links.append(np.stack([query[linked], target[linked]], axis=1))
+        return np.concatenate(links)
+
+    def sample_links(slab):
+        # First compare only the first LINK_SAMPLE core points of both cells, which settles most pairs
+        query, target = grid.neighbour_cells(slab, forward_only=True)
+        keep = core_counts[target] > 0
+        query, target = query[keep], target[keep]
+        linked = np.zeros(len(query), dtype=bool)
+        for _, _, pair in close_pairs(core_points, core_starts[query], np.minimum(core_counts[query], LINK_SAMPLE),
+                                      core_points, core_starts[target], np.minimum(core_counts[target], LINK_SAMPLE),
+                                      grid.eps2, budget):
+            linked[pair] = True
+        undecided = ~linked & ((core_counts[query] > LINK_SAMPLE) | (core_counts[target] > LINK_SAMPLE))
+        return np.stack([query[linked], target[linked]], axis=1), np.stack([query[undecided], target[undecided]], axis=1)
+
+    def components(links):
+        graph = coo_matrix((np.ones(len(links), dtype=np.int8), (node[links[:, 0]], node[links[:, 1]])),
+                           shape=(len(core_cells), len(core_cells)))
+        return connected_components(graph, directed=False)[1]
+
+    node = np.full(len(grid.cell_keys), -1, dtype=np.int64)
+    node[core_cells] = np.arange(len(core_cells))
+    sampled = map_slabs(sample_links, core_cells, slab_cells, workers)
+    links = np.concatenate([found for found, _ in sampled])
+    undecided = np.concatenate([pairs for _, pairs in sampled])
+    del sampled
+
+    # Then compare all core points, but only of the cell pairs that are not yet in the same cluster
+    component = components(links)
+    undecided = undecided[component[node[undecided[:, 0]]] != component[node[undecided[:, 1]]]]
+    if len(undecided):
+        found = map_slabs(lambda pairs: link_pairs(pairs[:, 0], pairs[:, 1]), undecided, slab_cells, workers)
+        links = np.concatenate([links] + found)
+        component = components(links)
+    cell_label = np.full(len(grid.cell_keys), -1, dtype=np.int64)
+    cell_label[core_cells] = component
+
+    sorted_labels = np.where(core, cell_label[grid.point_cell], -1)
+
+    # Border points: the non-core points closer than eps to a core point
+    border_index, border_starts, border_counts = grid.subset(~core)
+    border_points = grid.points[border_index]
+
+    def attach_border(slab):
+        query, target = grid.neighbour_cells(slab)
+        keep = core_counts[target] > 0
+        query, target = query[keep], target[keep]
+        found, found_labels = [], []
+        for a, b, _ in close_pairs(border_points, border_starts[query], border_counts[query],
+                                   core_points, core_starts[target], core_counts[target], grid.eps2, budget):
+            found.append(border_index[a])
+            found_labels.append(sorted_labels[core_index[b]])
+        if not found:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(found), np.concatenate(found_labels)
+
+    for found, found_labels in map_slabs(attach_border, np.flatnonzero(border_counts), slab_cells, workers):
+        sorted_labels[found] = found_labels
+
+    # Back to the input order, with clusters numbered by their first point
+    labels[grid.order] = sorted_labels
+    clustered = labels >= 0
+    _, first, renumbered = np.unique(labels[clustered], return_index=True, return_inverse=True)
+    labels[clustered] = np.argsort(np.argsort(first))[renumbered]
+    return labels
+
+# Function to compare the noise classification with open3d on small edge cases
+def self_check(workers=4):
+    """
+    Run grid_dbscan and open3d's cluster_dbscan on a few small point sets (all noise, one dense
+    cluster, random points) and compare which points are noise.
+
+    :return: True when every case agrees
+    """
+    rng = np.random.default_rng(0)
+    cases = [
+        ('all noise', np.array([[0.0, 0.0, 0.0], [10.0, 0.0, 0.0], [0.0, 10.0, 0.0]]), 0.5, 2),
+        ('single point', np.zeros((1, 3)), 0.5, 1),
+        ('one cluster', rng.normal(0, 0.01, (200, 3)), 0.05, 5),
+        ('random', rng.uniform(0, 1, (2000, 3)), 0.05, 4),
+    ]
+    passed = True
+    for name, points, eps, min_points in cases:
+        labels = grid_dbscan(points, eps, min_points, workers=workers)
+        pcd = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(points))
+        reference = np.asarray(pcd.cluster_dbscan(eps=eps, min_points=min_points))
+        agrees = np.array_equal(labels < 0, reference < 0)
+        passed &= agrees
+        print(f"{name}: {'ok' if agrees else 'noise classification differs from open3d'}")
+    return passed
+
+# Set up command line arguments
+def parse_args():
+    parser = argparse.ArgumentParser(description="Cluster a point cloud with grid-based DBSCAN and save the labels.")
+    parser.add_argument('--ply_file', type=str, default=None, help="Path to the input PLY file")
+    parser.add_argument('--labels_file', type=str, default=None, help="Path to save the labels (.npy, -1 for noise)")
+    parser.add_argument('--eps', type=float, default=0.05, help="DBSCAN epsilon parameter (neighborhood size)")
+    parser.add_argument('--min_points', type=int, default=10, help="DBSCAN minimum points parameter (density)")
+    parser.add_argument('--memory_mb', type=float, default=1024, help="Approximate memory budget for the temporaries in MB (default is 1024)")
+    parser.add_argument('--workers', type=int, default=4, help="Number of threads processing slabs of the grid (default is 4)")
+    parser.add_argument('--self_check', action='store_true', help="Compare with open3d on small edge cases (e.g. all noise) and exit")
+    args = parser.parse_args()
+    if not args.self_check and (args.ply_file is None or args.labels_file is None):
+        parser.error("--ply_file and --labels_file are required")
+    return args
+
+# Main function
+def main():
+    args = parse_args()
+    if args.self_check:
+        raise SystemExit(0 if self_check(args.workers) else 1)
+
+    points = np.asarray(o3d.io.read_point_cloud(args.ply_file, format='ply').points)
+    start = time.time()
+    labels = grid_dbscan(points, args.eps, args.min_points, args.memory_mb, args.workers)
+    print(f"{labels.max() + 1} clusters and {np.count_nonzero(labels < 0)} noise points in {time.time() - start:.2f}s")
+
+    np.save(args.labels_file, labels)
+    print(f"Labels saved to {args.labels_file}")
+
+if __name__ == "__main__":
+    main()
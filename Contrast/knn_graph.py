@@ -0,0 +1,272 @@
+import os
+import glob
+import numpy as np
+from scipy.spatial import cKDTree
+from spatial_index import SpatialIndex, coordinate_hash
+
+# Number of points queried at a time, bounding the float64 temporaries returned by cKDTree
+QUERY_CHUNK = 1 << 20
+
+# Function to compute the k nearest neighbours of every point
+def compute_knn(points, k_max, workers=-1, index=None):
+    """
+    Compute the k_max nearest neighbours of every point, the point itself included.
+
+    :param points: (N, 3) coordinates
+    :param k_max: Number of neighbours per point
+    :param workers: Number of query threads (-1 uses every CPU)
+    :param index: Optional SpatialIndex of the points, used instead of building a new k-d tree
+    :return: (N, k_max) float32 distances and int32 indices, sorted by distance
+    """
+    points = np.asarray(points, dtype=np.float64)
+    k_max = min(k_max, len(points))
+    tree = index if index is not None else cKDTree(points)
+    index_dtype = np.int32 if len(points) <= np.iinfo(np.int32).max else np.int64
+    distances = np.empty((len(points), k_max), dtype=np.float32)
+    indices = np.empty((len(points), k_max), dtype=index_dtype)
+    for start in range(0, len(points), QUERY_CHUNK):
+        stop = min(start + QUERY_CHUNK, len(points))
+        dist, idx = tree.query(points[start:stop], k=k_max, workers=workers)
+        distances[start:stop] = np.asarray(dist).reshape(stop - start, k_max)
+        indices[start:stop] = np.asarray(idx).reshape(stop - start, k_max)
+    return distances, indices
+
+# Function to split points into inliers and outliers from a boolean mask
+def split_by_mask(points, ids, inlier_mask):
+    """Return the filtered points, filtered IDs and outlier IDs, like the denoise_and_sort functions."""
+    return points[inlier_mask], ids[inlier_mask], ids[~inlier_mask]
+
+# k-nearest-neighbour table shared by the SOR, ROR and DBSCAN filters
+class KnnGraph:
+    """
+    Table of the k_max nearest neighbours (distances and indices) of every point.
+
+    Column 0 is the point itself, matching the neighbourhoods Open3D uses, so every filter
+    with a neighbour count up to k_max can be answered from the same table.
+    """
+
+    def __init__(self, distances, indices):
+        self.distances = distances
+        self.indices = indices
+
+    @property
+    def k_max(self):
+        return self.distances.shape[1]
+
+    def _check_k(self, k, name):
+        if k > self.k_max:
+            raise ValueError(f"{name}={k} needs a neighbour table with k_max >= {k} (have {self.k_max})")
+
+    def sor_inliers(self, nb_neighbors, std_ratio):
+        """Statistical Outlier Removal, following open3d's remove_statistical_outlier."""
+        self._check_k(nb_neighbors, 'nb_neighbors')
+        _, avg_distances = next(self.mean_distances([nb_neighbors]))
+        return sor_threshold_mask(avg_distances, std_ratio)
+
+    def mean_distances(self, neighbor_counts):
+        """
+        Yield (k, average distance to the first k neighbours) for every requested k, in increasing order.
+
+        The averages come from one running (prefix) sum over the table columns, so all of them cost
+        about as much as the largest one. Only one (N,) float64 array is alive at a time.
+        """
+        neighbor_counts = sorted(set(neighbor_counts))
+        self._check_k(neighbor_counts[-1], 'nb_neighbors')
+        running = np.zeros(len(self.distances), dtype=np.float64)
+        for column in range(neighbor_counts[-1]):
+            running += self.distances[:, column]
+            if column + 1 in neighbor_counts:
+                yield column + 1, running / (column + 1)
+
+    def sor_sweep(self, neighbor_counts, std_ratios):
+        """
+        Statistical Outlier Removal for every (nb_neighbors, std_ratio) combination.
+
+        :param neighbor_counts: nb_neighbors values, each at most k_max
+        :param std_ratios: std_ratio values
+        :return: Sorted nb_neighbors values, std_ratio values, (K, R) removed counts and
+                 (K, R, ceil(N / 8)) removed masks packed with np.packbits (little bit order)
+        """
+        neighbor_counts = sorted(set(neighbor_counts))
+        std_ratios = np.asarray(std_ratios, dtype=np.float64)
+        counts = np.empty((len(neighbor_counts), len(std_ratios)), dtype=np.int64)
+        removed = np.empty((len(neighbor_counts), len(std_ratios), (len(self.distances) + 7) // 8), dtype=np.uint8)
+        for row, (_, avg_distances) in enumerate(self.mean_distances(neighbor_counts)):
+            outliers = ~sor_threshold_masks(avg_distances, std_ratios)
+            counts[row] = outliers.sum(axis=1)
+            removed[row] = np.packbits(outliers, axis=1, bitorder='little')
+        return neighbor_counts, std_ratios, counts, removed
+
+    def ror_inliers(self, radius, min_neighbors):
+        """Radius Outlier Removal, following open3d: keep points with at least min_neighbors other points closer than radius."""
+        self._check_k(min_neighbors + 1, 'min_neighbors + 1')
+        return self.distances[:, min_neighbors] < radius
+
+    def critical_radii(self, neighbor_counts):
+        """
+        Critical ROR radius of every point for each min_neighbors value.
+
+        A point is an ROR inlier for (radius, min_neighbors) exactly when radius is larger than its
+        distance to its min_neighbors-th other neighbour, so that column of the table answers every radius.
+
+        :param neighbor_counts: min_neighbors values
+        :return: Sorted min_neighbors values and the (N, M) float32 critical radii
+        """
+        neighbor_counts = sorted(set(neighbor_counts))
+        self._check_k(neighbor_counts[-1] + 1, 'min_neighbors + 1')
+        return neighbor_counts, np.ascontiguousarray(self.distances[:, neighbor_counts])
+
+    def ror_sweep(self, radii, neighbor_counts):
+        """
+        Radius Outlier Removal for every (radius, min_neighbors) combination.
+
+        :param radii: radius values
+        :param neighbor_counts: min_neighbors values, each below k_max
+        :return: Sorted radius values, sorted min_neighbors values, (A, M) removed counts,
+                 (A, M, ceil(N / 8)) packed removed masks and the (N, M) critical radii
+        """
+        radii = sorted(set(radii))
+        neighbor_counts, critical = self.critical_radii(neighbor_counts)
+        counts = np.empty((len(radii), len(neighbor_counts)), dtype=np.int64)
+        removed = np.empty((len(radii), len(neighbor_counts), (len(critical) + 7) // 8), dtype=np.uint8)
+        for row, radius in enumerate(radii):
+            outliers = critical >= np.float32(radius)
+            counts[row] = outliers.sum(axis=0)
+            removed[row] = np.packbits(outliers.T, axis=1, bitorder='little')
+        return radii, neighbor_counts, counts, removed, critical
+
+    def dbscan_inliers(self, eps, min_points):
+        """
+        DBSCAN noise classification: keep core points and points closer than eps to a core point.
+
+        A non-core point has fewer than min_points neighbours within eps, so with k_max >= min_points
+        all of them are in its row of the table and the classification is exact.
+        """
+        self._check_k(min_points, 'min_points')
+        within = self.distances < eps
+        core = within[:, min_points - 1] if min_points > 0 else np.ones(len(within), dtype=bool)
+        border = np.any(within & core[self.indices], axis=1)
+        return core | border
+
+    def save(self, prefix):
+        """Save the table as <prefix>_dist.npy and <prefix>_idx.npy."""
+        np.save(f"{prefix}_dist.npy", self.distances)
+        np.save(f"{prefix}_idx.npy", self.indices)
+
+    @classmethod
+    def load(cls, prefix, k=None):
+        """Memory-map a saved table, optionally keeping only its first k columns."""
+        distances = np.load(f"{prefix}_dist.npy", mmap_mode='r')
+        indices = np.load(f"{prefix}_idx.npy", mmap_mode='r')
+        if k is not None:
+            distances, indices = distances[:, :k], indices[:, :k]
+        return cls(distances, indices)
+
+# Function to apply the SOR mean/std threshold to per-point average distances
+def sor_threshold_mask(avg_distances, std_ratio):
+    """Apply the SOR threshold mean + std_ratio * std to the average neighbour distances."""
+    return sor_threshold_masks(avg_distances, [std_ratio])[0]
+
+# Function to apply several SOR thresholds at once
+def sor_threshold_masks(avg_distances, std_ratios):
+    """
+    Apply the SOR thresholds mean + std_ratio * std for every std_ratio, returning (R, N) inlier masks.
+
+    Mirrors open3d: points with a zero average distance are never inliers and are left out of the
+    sums, while the mean and standard deviation are still normalised by the number of points.
+    """
+    valid = avg_distances > 0
+    count = len(avg_distances)
+    cloud_mean = avg_distances[valid].sum() / count
+    sq_sum = np.square(avg_distances[valid] - cloud_mean).sum()
+    std_dev = np.sqrt(sq_sum / (count - 1)) if count > 1 else 0.0
+    thresholds = cloud_mean + np.asarray(std_ratios, dtype=np.float64) * std_dev
+    return valid & (avg_distances < thresholds[:, None])
+
+# Function to apply an ROR setting from saved critical radii
+def ror_inliers_from_critical(critical_path, radius, min_neighbors):
+    """
+    Answer one ROR setting from a saved <prefix>.npz of critical radii, without any neighbour search.
+
+    :param critical_path: File written by a ROR sweep (min_neighbors and critical_radius arrays)
+    :param radius: ROR radius
+    :param min_neighbors: ROR min_neighbors, one of the swept values
+    :return: Boolean inlier mask
+    """
+    saved = np.load(critical_path)
+    columns = list(saved['min_neighbors'])
+    if min_neighbors not in columns:
+        raise ValueError(f"min_neighbors={min_neighbors} is not in {critical_path} (have {columns})")
+    return saved['critical_radius'][:, columns.index(min_neighbors)] < np.float32(radius)
+
+# Function to parse a comma-separated list of parameter values
+def parse_values(text, cast=float):
+    """Parse '10,20,30' into [10, 20, 30] with the given type; None gives an empty list."""
+    return [cast(value) for value in text.split(',') if value.strip()] if text else []
+
+# Function to print a parameter sweep table
+def print_sweep(param_names, param_values, counts, total):
+    """Print the removed counts of a sweep, one row per value of the first parameter."""
+    print(f"Removed points out of {total} ({param_names[0]} rows, {param_names[1]} columns):")
+    print(' ' * 10 + ''.join(f"{value:>10g}" for value in param_values[1]))
+    for first, row in zip(param_values[0], counts):
+        print(f"{first:>10g}" + ''.join(f"{count:>10d}" for count in row))
+
+# Function to save the results of a parameter sweep
+def save_sweep(sweep_dir, method, param_names, param_values, counts, removed):
+    """
+    Save a parameter sweep as <method>_sweep.csv and one packed removed-row bitmask per combination.
+
+    :param sweep_dir: Output directory
+    :param method: Filter name used as file prefix, e.g. 'sor'
+    :param param_names: Names of the two swept parameters
+    :param param_values: Values of the two swept parameters (grid axes)
+    :param counts: (A, B) removed counts
+    :param removed: (A, B, ceil(N / 8)) packed removed masks
+    :return: Path of the CSV table
+    """
+    os.makedirs(sweep_dir, exist_ok=True)
+    table_path = os.path.join(sweep_dir, f"{method}_sweep.csv")
+    with open(table_path, 'w') as f:
+        f.write(f"{param_names[0]},{param_names[1]},removed,mask_file\n")
+        for i, first in enumerate(param_values[0]):
+            for j, second in enumerate(param_values[1]):
+                mask_file = f"{method}_{param_names[0]}{first:g}_{param_names[1]}{second:g}.bits"
+                removed[i, j].tofile(os.path.join(sweep_dir, mask_file))
+                f.write(f"{first:g},{second:g},{counts[i, j]},{mask_file}\n")
+    return table_path
+
+# Function to load a cached neighbour table or build and cache it
+def load_or_build(points, k_max, cache_dir=None, workers=-1):
+    """
+    Return the neighbour table of a point cloud, reusing a cached one when possible.
+
+    Tables are stored as knn_<content hash>_k<k>_*.npy in cache_dir. Any cached table of the same
+    cloud with at least k_max columns is memory-mapped and truncated instead of being recomputed.
+
+    :param points: (N, 3) coordinates
+    :param k_max: Number of neighbours needed
+    :param cache_dir: Directory of cached tables, or None to disable caching
+    :param workers: Number of query threads (-1 uses every CPU)
+    :return: KnnGraph
+    """
+    k_max = min(k_max, len(points))
+    if cache_dir is None:
+        return KnnGraph(*compute_knn(points, k_max, workers))
+
+    os.makedirs(cache_dir, exist_ok=True)
+    key = coordinate_hash(points)
+    for dist_path in glob.glob(os.path.join(cache_dir, f"knn_{key}_k*_dist.npy")):
+        prefix = dist_path[:-len('_dist.npy')]
+        cached_k = int(prefix.rsplit('_k', 1)[1])
+        if cached_k >= k_max and os.path.exists(f"{prefix}_idx.npy"):
+            print(f"Reusing neighbour table {prefix}_*.npy")
+            return KnnGraph.load(prefix, k_max)
+
+    # The spatial index is cached too, so a later run needing more neighbours skips the tree build
+    index = SpatialIndex.load_or_build(points, cache_dir)
+    graph = KnnGraph(*compute_knn(points, k_max, workers, index))
+    prefix = os.path.join(cache_dir, f"knn_{key}_k{k_max}")
+    graph.save(prefix)
+    print(f"Neighbour table saved to {prefix}_*.npy")
+    return graph
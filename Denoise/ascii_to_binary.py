@@ -1,6 +1,7 @@
 import struct
 import os
 import argparse
+from binary_ply import CHUNK_SIZE, read_ply_header, iter_vertex_chunks, write_chunks
 
 # Function to convert an ASCII-encoded PLY file to binary format
 def convert_ascii_ply_to_binary(ascii_ply_path, binary_ply_path):
@@ -56,6 +57,17 @@ def convert_ascii_ply_to_binary(ascii_ply_path, binary_ply_path):
 
     print(f"Conversion complete. Binary PLY file saved at: {binary_ply_path}")
 
+# Function to convert an ASCII PLY file to binary chunk by chunk
+def stream_ascii_to_binary(ascii_ply_path, binary_ply_path, chunk_size=CHUNK_SIZE):
+    """
+    Streaming version of the conversion: text rows are parsed into NumPy chunks
+    (binary_ply.iter_vertex_chunks) and written with binary_ply.BinaryPlyWriter.
+
+    :return: Number of vertices written
+    """
+    _, _, _, properties, _ = read_ply_header(ascii_ply_path)
+    return write_chunks(binary_ply_path, iter_vertex_chunks(ascii_ply_path, chunk_size), properties)
+
 # Set up command line arguments
 def parse_args():
     parser = argparse.ArgumentParser(description="Convert an ASCII PLY file to binary format.")
@@ -0,0 +1,107 @@
+import argparse
+import numpy as np
+import pandas as pd
+from binary_ply import read_ply_header, memmap_vertices, replace_vertex_properties
+
+# Function to read the vertex columns of an ASCII or binary PLY file
+def read_vertices(file_path):
+    """
+    Read the vertices of a 3DGS PLY file.
+
+    :param file_path: ASCII or binary little-endian PLY file
+    :return: Header lines, format name and the columns ({name: array} for ASCII, a structured memmap for binary)
+    """
+    header, file_format, _, properties, _ = read_ply_header(file_path)
+    if file_format == 'ascii':
+        data = pd.read_csv(file_path, skiprows=len(header), sep=' ', header=None)
+        columns = dict((name, data.iloc[:, i].values) for i, (_, name) in enumerate(properties))
+        return header, file_format, columns
+    vertices, _ = memmap_vertices(file_path)
+    return header, file_format, vertices
+
+# Function to compute the opacity after the activation used by 3DGS
+def sigmoid(values):
+    """Logistic sigmoid, as applied to the stored opacity logits."""
+    return 1.0 / (1.0 + np.exp(-values))
+
+# Function to list the column names of a mapping or structured array
+def names_of(columns):
+    """Column names of a dict or a structured array."""
+    return columns.dtype.names if hasattr(columns, 'dtype') else list(columns)
+
+# Function to evaluate the attribute rules
+def attribute_rules(columns, min_opacity=None, max_scale=None, max_radius=None, center=None):
+    """
+    Evaluate the pre-filter rules on the stored 3DGS attributes.
+
+    :param columns: Mapping (or structured array) of column name to values
+    :param min_opacity: Remove points with sigmoid(opacity) below this value
+    :param max_scale: Remove points whose largest exp(scale_i) exceeds this value (world units)
+    :param max_radius: Remove points farther than this from center
+    :param center: (3,) centre of the radius rule; default is the median position
+    :return: Dict of rule name to boolean removal mask, for the enabled rules
+    """
+    rules = {}
+    if min_opacity is not None:
+        rules['opacity'] = sigmoid(np.asarray(columns['opacity'], dtype=np.float64)) < min_opacity
+    if max_scale is not None:
+        scale_columns = [name for name in ('scale_0', 'scale_1', 'scale_2') if name in names_of(columns)]
+        log_scale = np.max(np.stack([np.asarray(columns[name], dtype=np.float64) for name in scale_columns]), axis=0)
+        rules['scale'] = np.exp(log_scale) > max_scale
+    if max_radius is not None:
+        xyz = np.stack([np.asarray(columns[name], dtype=np.float64) for name in ('x', 'y', 'z')], axis=1)
+        center = np.median(xyz, axis=0) if center is None else np.asarray(center, dtype=np.float64)
+        rules['radius'] = np.linalg.norm(xyz - center, axis=1) > max_radius
+    return rules
+
+# Function to write the kept vertices
+def write_kept(input_path, output_path, header, file_format, vertices, keep):
+    """Write the kept vertices with the input's format and header (updated vertex count)."""
+    if file_format == 'ascii':
+        with open(input_path, 'r') as f:
+            lines = f.readlines()[len(header):]
+        with open(output_path, 'w') as f:
+            for line in header:
+                f.write(f"element vertex {int(keep.sum())}\n" if line.startswith("element vertex") else line)
+            f.writelines(line for line, kept in zip(lines, keep) if kept)
+    else:
+        _, _, _, properties, _ = read_ply_header(input_path)
+        with open(output_path, 'wb') as f:
+            f.write(replace_vertex_properties(header, properties, int(keep.sum())))
+            vertices[keep].tofile(f)
+
+# Set up command line arguments
+def parse_args():
+    parser = argparse.ArgumentParser(description="Remove trivially identifiable floaters from a 3DGS point cloud by their own attributes.")
+    parser.add_argument('--input', type=str, required=True, help="Input PLY file (output of binary_to_ascii.py, or the binary point cloud)")
+    parser.add_argument('--output', type=str, required=True, help="Output PLY file, in the same format as the input")
+    parser.add_argument('--removed_ids', type=str, required=True, help="Text file to save the removed IDs (0-based row numbers of the input)")
+    parser.add_argument('--min_opacity', type=float, default=None, help="Remove points with sigmoid(opacity) below this value, e.g. 0.005")
+    parser.add_argument('--max_scale', type=float, default=None, help="Remove points whose largest exp(scale) exceeds this value")
+    parser.add_argument('--max_radius', type=float, default=None, help="Remove points farther than this from --center")
+    parser.add_argument('--center', type=str, default=None, help="Centre of the radius rule as x,y,z (default: median position)")
+    return parser.parse_args()
+
+# Main function
+def main():
+    args = parse_args()
+    center = [float(value) for value in args.center.split(',')] if args.center else None
+
+    header, file_format, vertices = read_vertices(args.input)
+    rules = attribute_rules(vertices, args.min_opacity, args.max_scale, args.max_radius, center)
+    total = len(vertices['x'])
+    removed = np.zeros(total, dtype=bool)
+    for name, mask in rules.items():
+        print(f"Rule {name}: {int(mask.sum())} points")
+        removed |= mask
+
+    write_kept(args.input, args.output, header, file_format, vertices, ~removed)
+    np.savetxt(args.removed_ids, np.flatnonzero(removed), fmt='%d')
+
+    print(f"Removed {int(removed.sum())} of {total} points ({100.0 * removed.sum() / max(total, 1):.1f}%), "
+          f"{total - int(removed.sum())} left for the next stages")
+    print(f"Filtered point cloud saved to: {args.output}")
+    print(f"Removed IDs saved to: {args.removed_ids}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import os
+import json
+from binary_ply import read_ply_header
+
+# Name of the schema file every stage reads from its input directory and copies to its output directory
+SCHEMA_FILE_NAME = 'schema.json'
+
+# Placeholder column used to pad the last group to three columns
+PAD_COLUMN = 'pad'
+
+# Number of columns per group; each group is filtered as an (x, y, z) point cloud
+GROUP_SIZE = 3
+
+POSITION_COLUMNS = ['x', 'y', 'z']
+NORMAL_COLUMNS = ['nx', 'ny', 'nz']
+
+# Abbreviations used in group names, e.g. fdc012, fre345, scale012, rot23
+FAMILY_ABBREVIATIONS = [('f_dc_', 'fdc'), ('f_rest_', 'fre'), ('opacity', 'op'), ('scale_', 'scale'), ('rot_', 'rot')]
+
+# File name suffix of a group at each stage of the Denoise pipeline
+STAGE_SUFFIXES = {
+    'split': '_ascii.ply',                  # attributes_spilt.py
+    'voxel': '_ascii_voxel.ply',            # voxelization.py
+    'dedup': '_ascii_voxel_norp.ply',       # delete_repeat_voxel.py
+    'reconstructed': '_ascii_voxel_re.ply', # repc5.py / repc4.py
+    'devoxel': '_ascii_voxeltopc.ply'       # devoxelization.py
+}
+
+# Function to split a column name into its family and index
+def split_column(column):
+    """Split 'f_rest_12' into ('f_rest_', '12'); columns without an index return (column, '')."""
+    for family, _ in FAMILY_ABBREVIATIONS:
+        if family.endswith('_') and column.startswith(family) and column[len(family):].isdigit():
+            return family, column[len(family):]
+    return column, ''
+
+# Function to build a short group name from its columns
+def group_name(columns):
+    """Build a group name such as 'fre424344' or 'opscale01' from the group's columns."""
+    abbreviations = dict(FAMILY_ABBREVIATIONS)
+    name = ''
+    previous_family = None
+    for column in columns:
+        if column == PAD_COLUMN:
+            continue
+        family, index = split_column(column)
+        if family != previous_family:
+            name += abbreviations.get(family, family)
+            previous_family = family
+        name += index
+    return name
+
+# A group of three attribute columns filtered together as one point cloud
+class AttributeGroup:
+    """Three columns of the original PLY (padded with PAD_COLUMN) filtered as one point cloud."""
+
+    def __init__(self, name, columns):
+        self.name = name
+        self.columns = list(columns)
+
+    @property
+    def attributes(self):
+        """Columns of the group that hold real attributes (padding excluded)."""
+        return [column for column in self.columns if column != PAD_COLUMN]
+
+    def file_name(self, stage):
+        """File name of this group at the given pipeline stage (see STAGE_SUFFIXES)."""
+        return f"{self.name}{STAGE_SUFFIXES[stage]}"
+
+    def __repr__(self):
+        return f"AttributeGroup({self.name!r}, {self.columns!r})"
+
+# The attribute grouping shared by every stage of the Denoise pipeline
+class AttributeSchema:
+    """
+    Grouping of the 3DGS attributes derived from the PLY header.
+
+    The positions form the first group. All remaining attributes except the (always zero) normals
+    are packed three at a time in header order, and the last group is padded instead of overlapping
+    its predecessor. When a lower SH degree is requested, the f_rest_* columns of the higher bands
+    are dropped and the kept ones are renamed to the layout of the lower degree.
+    """
+
+    def __init__(self, properties, groups, output_names, sh_degree):
+        self.properties = [tuple(prop) for prop in properties]
+        self.groups = groups
+        self.output_names = dict(output_names)
+        self.sh_degree = sh_degree
+
+    @classmethod
+    def from_properties(cls, properties, sh_degree=None):
+        """
+        Derive the grouping from the vertex properties of a 3DGS PLY file.
+
+        :param properties: List of (type, name) vertex properties
+        :param sh_degree: SH degree to keep (0-3); None keeps every f_rest_* column of the file
+        :return: AttributeSchema
+        """
+        names = [name for _, name in properties]
+        missing = [column for column in POSITION_COLUMNS if column not in names]
+        if missing:
+            raise ValueError(f"The PLY header has no {', '.join(missing)} property")
+
+        # Each colour channel stores (degree + 1)^2 - 1 rest coefficients
+        rest_columns = [name for name in names if split_column(name)[0] == 'f_rest_']
+        rest_per_channel = len(rest_columns) // 3
+        file_degree = int(round((rest_per_channel + 1) ** 0.5)) - 1
+        if len(rest_columns) % 3 or (file_degree + 1) ** 2 - 1 != rest_per_channel:
+            raise ValueError(f"Unexpected number of f_rest_* properties: {len(rest_columns)}")
+        if sh_degree is None:
+            sh_degree = file_degree
+        if not 0 <= sh_degree <= file_degree:
+            raise ValueError(f"sh_degree must be between 0 and {file_degree} for this file")
+        kept_per_channel = (sh_degree + 1) ** 2 - 1
+
+        output_names = {}
+        for name in names:
+            family, index = split_column(name)
+            if name in NORMAL_COLUMNS:
+                continue
+            if family == 'f_rest_':
+                channel, coefficient = divmod(int(index), rest_per_channel)
+                if coefficient >= kept_per_channel:
+                    continue
+                output_names[name] = f"f_rest_{channel * kept_per_channel + coefficient}"
+            else:
+                output_names[name] = name
+
+        groups = [AttributeGroup('xyz', POSITION_COLUMNS)]
+        attributes = [name for name in output_names if name not in POSITION_COLUMNS]
+        for start in range(0, len(attributes), GROUP_SIZE):
+            columns = attributes[start:start + GROUP_SIZE]
+            columns += [PAD_COLUMN] * (GROUP_SIZE - len(columns))
+            groups.append(AttributeGroup(group_name(columns), columns))
+
+        return cls(properties, groups, output_names, sh_degree)
+
+    @classmethod
+    def from_ply(cls, file_path, sh_degree=None):
+        """Derive the grouping from the header of an ASCII or binary 3DGS PLY file."""
+        _, _, _, properties, _ = read_ply_header(file_path)
+        return cls.from_properties(properties, sh_degree)
+
+    @classmethod
+    def load(cls, file_path):
+        """Load a schema saved by save()."""
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"No attribute schema at {file_path}; run attributes_spilt.py first "
+                                    f"or pass --schema")
+        with open(file_path, 'r') as f:
+            state = json.load(f)
+        groups = [AttributeGroup(group['name'], group['columns']) for group in state['groups']]
+        return cls(state['properties'], groups, state['output_names'], state['sh_degree'])
+
+    @classmethod
+    def locate(cls, directory, schema_path=None):
+        """Load the schema given on the command line, or the one stored in the stage's input directory."""
+        return cls.load(schema_path or os.path.join(directory, SCHEMA_FILE_NAME))
+
+    def save(self, file_path):
+        """Save the schema as JSON; a directory path stores it as SCHEMA_FILE_NAME inside it."""
+        if os.path.isdir(file_path):
+            file_path = os.path.join(file_path, SCHEMA_FILE_NAME)
+        state = {
+            'sh_degree': self.sh_degree,
+            'properties': [list(prop) for prop in self.properties],
+            'groups': [{'name': group.name, 'columns': group.columns} for group in self.groups],
+            'output_names': self.output_names
+        }
+        with open(file_path, 'w') as f:
+            json.dump(state, f, indent=2)
+        return file_path
+
+    def property_type(self, column):
+        """PLY type of a source column; padding columns are float."""
+        return dict((name, prop_type) for prop_type, name in self.properties).get(column, 'float')
+
+    def column_index(self, column):
+        """Index of a source column in the original vertex record."""
+        return [name for _, name in self.properties].index(column)
+
+    def output_name(self, column):
+        """Name of a source column in the fused output, or None for padding."""
+        return None if column == PAD_COLUMN else self.output_names[column]
@@ -3,6 +3,9 @@ import numpy as np
 import pandas as pd
 from tqdm import tqdm  # Import progress bar library
 import argparse
+from itertools import tee
+from attribute_schema import AttributeSchema, PAD_COLUMN
+from binary_ply import vertex_dtype
 
 # Function to read the PLY file and separate the header and data
 def read_ply(file_path):
@@ -34,23 +37,30 @@ def filter_ply_columns(header, data, columns_to_keep):
     Filter specified columns and update the header information.
     :param header: Original header
     :param data: Data part
-    :param columns_to_keep: List of columns to keep
+    :param columns_to_keep: List of columns to keep; None adds a zero padding column
     :return: Updated header and filtered data
     """
     # Add the unique ID column, ensuring ID is the last column
-    data = add_unique_id(data)
-    columns_to_keep = columns_to_keep + [-1]  # Include ID column index
-    filtered_data = data.iloc[:, columns_to_keep]
+    if 'ID' not in data.columns:
+        data = add_unique_id(data)
+    filtered_data = pd.DataFrame({
+        position: (data.iloc[:, column] if column is not None else 0.0)
+        for position, column in enumerate(columns_to_keep)
+    })
+    filtered_data['ID'] = data['ID'].values
 
     # Update the header
     updated_header = []
     property_lines = []
-    keep_index = 0
+    source_properties = [line for line in header if line.startswith("property")]
+    for column in columns_to_keep:
+        if column is not None:
+            property_lines.append(source_properties[column])
+        else:
+            property_lines.append(f"property float {PAD_COLUMN}\n")
     for line in header:
         if line.startswith("property"):
-            if keep_index in columns_to_keep:
-                property_lines.append(line)
-            keep_index += 1
+            continue
         elif line.startswith("element vertex"):
             element_vertex_line = f"element vertex {len(filtered_data)}\n"
             updated_header.append(element_vertex_line)
@@ -65,6 +75,58 @@ def filter_ply_columns(header, data, columns_to_keep):
 
     return updated_header, filtered_data
 
+# Function to list the properties of a group's records in the streaming functions
+def group_properties(schema, group):
+    """(type, name) properties of a group's records: its columns (padding named pad<position>) and the ID."""
+    properties = []
+    for position, column in enumerate(group.columns):
+        if column == PAD_COLUMN:
+            properties.append(('float', f"{PAD_COLUMN}{position}"))
+        else:
+            properties.append((schema.property_type(column), column))
+    return properties + [('int', 'ID')]
+
+# Function to split chunks of vertex records into the attribute groups
+def split_chunks(chunks, schema, first_id=0):
+    """
+    Streaming version of the split: add IDs and cut every chunk into the attribute groups.
+
+    :param chunks: Iterable of structured vertex records (e.g. binary_ply.iter_vertex_chunks)
+    :param schema: AttributeSchema of the vertices
+    :param first_id: ID of the first record
+    :return: Generator of {group name: structured records of the group's columns and ID}
+    """
+    dtypes = dict((group.name, vertex_dtype(group_properties(schema, group))) for group in schema.groups)
+    next_id = first_id
+    for records in chunks:
+        ids = np.arange(next_id, next_id + len(records))
+        next_id += len(records)
+        groups = {}
+        for group in schema.groups:
+            group_records = np.zeros(len(records), dtype=dtypes[group.name])  # Padding columns stay 0
+            for column in group.attributes:
+                group_records[column] = records[column]
+            group_records['ID'] = ids
+            groups[group.name] = group_records
+        yield groups
+
+# Function to select one group from the split stream
+def select_group(split_stream, name):
+    """Generator of the records of one group from a split_chunks stream."""
+    for groups in split_stream:
+        yield groups[name]
+
+# Function to give every group its own stream of the split
+def group_streams(split_stream, schema):
+    """
+    Fan a split_chunks stream out to one independent stream per group.
+
+    The split chunks are buffered until every group stream has consumed them, so the groups
+    should be consumed at similar rates (as the ID merge of fusion does).
+    """
+    copies = tee(split_stream, len(schema.groups))
+    return dict((group.name, select_group(copy, group.name)) for group, copy in zip(schema.groups, copies))
+
 # Function to write the filtered data to a PLY file
 def write_ply(output_path, header, filtered_data):
     """Save the filtered data to a PLY file"""
@@ -79,6 +141,7 @@ def parse_args():
     parser = argparse.ArgumentParser(description="Process PLY files and filter columns.")
     parser.add_argument('--input', type=str, required=True, help="Input PLY file path")
     parser.add_argument('--output_dir', type=str, required=True, help="Output directory path")
+    parser.add_argument('--sh_degree', type=int, default=None, help="SH degree to keep (0-3); lower degrees skip the f_rest_* groups of the higher bands")
     return parser.parse_args()
 
 # Main function
@@ -86,39 +149,22 @@ def main():
     # Get command line arguments
     args = parse_args()
 
-    # Define the columns to keep and their corresponding output file names
-    columns_to_keep_list = [
-        ([0, 1, 2], "xyz_ascii"),  # x, y, z
-        ([3, 4, 5], "nxyz_ascii"),  # nxyz
-        ([6, 7, 8], "fdc012_ascii"),  # fdc012
-        ([9, 10, 11], "fre012_ascii"), # fre012~
-        ([12, 13, 14], "fre345_ascii"),
-        ([15, 16, 17], "fre678_ascii"),
-        ([18, 19, 20], "fre91011_ascii"),
-        ([21, 22, 23], "fre121314_ascii"),
-        ([24, 25, 26], "fre151617_ascii"),
-        ([27, 28, 29], "fre181920_ascii"),
-        ([30, 31, 32], "fre212223_ascii"),
-        ([33, 34, 35], "fre242526_ascii"),
-        ([36, 37, 38], "fre272829_ascii"),
-        ([39, 40, 41], "fre303132_ascii"),
-        ([42, 43, 44], "fre333435_ascii"),
-        ([45, 46, 47], "fre363738_ascii"),
-        ([48, 49, 50], "fre394041_ascii"),
-        ([51, 52, 53], "fre424344_ascii"),  # ~fre424344
-        ([52, 53, 54], "fre4344op_ascii"),  # fre4344opacity
-        ([55, 56, 57], "scale012_ascii"), # scale012
-        ([58, 59, 60], "rot012_ascii"),   # rot012
-        ([59, 60, 61], "rot123_ascii")    # rot123
-    ]
+    # Derive the attribute groups from the header and share them with the later stages
+    schema = AttributeSchema.from_ply(args.input, args.sh_degree)
+    os.makedirs(args.output_dir, exist_ok=True)
+    schema_path = schema.save(args.output_dir)
+    print(f"{len(schema.groups)} attribute groups, schema saved to: {schema_path}")
 
     # Read input PLY file
     header, data = read_ply(args.input)
+    data = add_unique_id(data)
 
     # Process and filter columns, then save them to the output directory
-    for columns_to_keep, name_suffix in tqdm(columns_to_keep_list, desc="Processing columns", ncols=100):
+    for group in tqdm(schema.groups, desc="Processing columns", ncols=100):
+        columns_to_keep = [schema.column_index(column) if column != PAD_COLUMN else None
+                           for column in group.columns]
         updated_header, filtered_data = filter_ply_columns(header, data, columns_to_keep)
-        output_ply = os.path.join(args.output_dir, f"{name_suffix}.ply")  # Output file path with custom name
+        output_ply = os.path.join(args.output_dir, group.file_name('split'))  # Output file path with custom name
         write_ply(output_ply, updated_header, filtered_data)
         print(f"PLY file with ID added saved to: {output_ply}")
 
@@ -0,0 +1,266 @@
+import os
+import sys
+import json
+import glob
+import time
+import hashlib
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from binary_ply import read_ply_header
+
+# Directory of the pipeline scripts
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Name of the job journal in the work directory
+JOURNAL_FILE_NAME = 'journal.jsonl'
+
+# Environment variables that cap the threads of NumPy, SciPy and torch in a child process
+THREAD_VARIABLES = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'NUMEXPR_NUM_THREADS']
+
+# Function to list the input point clouds of a batch
+def collect_inputs(manifest=None, patterns=None):
+    """
+    Collect the scenes of a batch.
+
+    :param manifest: Text file with one 'path' or 'name path' per line ('#' starts a comment)
+    :param patterns: Glob patterns of point_cloud.ply files
+    :return: List of (scene name, absolute path), in a stable order
+    """
+    named, unnamed = [], []
+    if manifest:
+        with open(manifest, 'r') as f:
+            for line in f:
+                parts = line.split('#', 1)[0].split()
+                if len(parts) == 1:
+                    unnamed.append(os.path.abspath(parts[0]))
+                elif len(parts) >= 2:
+                    named.append((parts[0], os.path.abspath(' '.join(parts[1:]))))
+    for pattern in patterns or []:
+        unnamed += sorted(os.path.abspath(path) for path in glob.glob(pattern, recursive=True))
+
+    # Unnamed scenes are named after their directory relative to the common parent of all of them
+    if unnamed:
+        root = os.path.commonpath([os.path.dirname(path) for path in unnamed])
+        for path in unnamed:
+            relative = os.path.relpath(os.path.dirname(path), os.path.dirname(root) if len(unnamed) == 1 else root)
+            named.append((relative.replace(os.sep, '_'), path))
+
+    names = [name for name, _ in named]
+    duplicates = sorted(set(name for name in names if names.count(name) > 1))
+    if duplicates:
+        raise ValueError(f"Duplicate scene names: {', '.join(duplicates)}; name them in the manifest")
+    return named
+
+# Function to build the command lines of the whole-scene pipeline
+def scene_steps(scene_dir, input_path, output_path, args):
+    """
+    Commands of the Denoise steps for one scene, in the folder layout scene_dir/<stage>.
+
+    :return: List of (step name, argv, uses an inference slot, output file or folder)
+    """
+    python = sys.executable
+    layout = dict((stage, os.path.join(scene_dir, stage)) for stage in ('split', 'voxel', 'dedup', 'reconstructed', 'devoxel'))
+    ascii_path = os.path.join(scene_dir, 'ascii.ply')
+    if args.engine == 'model':
+        reconstruct = [python, os.path.join(args.pcgv2_dir or SCRIPT_DIR, 'repc5.py'), '--model_path', args.model_path,
+                       '--input_dir', layout['dedup'], '--output_dir', layout['reconstructed'], '--pipelined']
+    else:
+        reconstruct = [python, os.path.join(SCRIPT_DIR, 'occupancy_filter.py'),
+                       '--input_dir', layout['dedup'], '--output_dir', layout['reconstructed']]
+    return [
+        ('binary_to_ascii', [python, os.path.join(SCRIPT_DIR, 'binary_to_ascii.py'), '--input', input_path, '--output', ascii_path], False, ascii_path),
+        ('split', [python, os.path.join(SCRIPT_DIR, 'attributes_spilt.py'), '--input', ascii_path, '--output_dir', layout['split']], False, layout['split']),
+        ('voxelize', [python, os.path.join(SCRIPT_DIR, 'voxelization.py'), '--input_dir', layout['split'],
+                      '--output_dir', layout['voxel'], '--voxel_resolution', str(args.voxel_resolution)], False, layout['voxel']),
+        ('dedup', [python, os.path.join(SCRIPT_DIR, 'delete_repeat_voxel.py'), '--input_dir', layout['voxel'], '--output_dir', layout['dedup']], False, layout['dedup']),
+        ('reconstruct', reconstruct, args.engine == 'model', layout['reconstructed']),
+        ('devoxelize', [python, os.path.join(SCRIPT_DIR, 'devoxelization.py'), '--input_dir', layout['split'],
+                        '--voxelized_dir', layout['reconstructed'], '--output_dir', layout['devoxel'],
+                        '--voxel_resolution', str(args.voxel_resolution)], False, layout['devoxel']),
+        ('fusion', [python, os.path.join(SCRIPT_DIR, 'fusion.py'), '--input_dir', layout['devoxel'], '--output_path', output_path], False, output_path),
+    ]
+
+# Function to fingerprint one step of a scene
+def step_fingerprint(argv, input_path):
+    """Hash of the step's arguments (without the interpreter) and of the input file's size and modification time."""
+    stat = os.stat(input_path)
+    return hashlib.sha1(json.dumps([argv[1:], stat.st_size, stat.st_mtime_ns]).encode('utf-8')).hexdigest()[:16]
+
+# Append-only journal of the finished steps, used to resume a batch
+class Journal:
+    """
+    JSON-lines record of every step attempt (scene, step, status, seconds, message, fingerprint).
+
+    A step recorded as 'done' is skipped when the batch is run again with the same fingerprint
+    (same arguments and same input file), so an interrupted or partly failed batch resumes where
+    it stopped, while changed settings or a new checkpoint re-run the steps.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = {}  # (scene, step) -> fingerprint of the last successful run
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # A line cut short by a crash
+                    if entry['status'] == 'done':
+                        self.done[(entry['scene'], entry['step'])] = entry.get('fingerprint')
+
+    def is_done(self, scene, step, fingerprint):
+        return self.done.get((scene, step)) == fingerprint
+
+    def record(self, scene, step, status, seconds, message='', fingerprint=None):
+        """Append one entry and flush it to disk."""
+        entry = {'scene': scene, 'step': step, 'status': status, 'seconds': round(seconds, 3),
+                 'message': message, 'fingerprint': fingerprint, 'time': time.strftime('%Y-%m-%d %H:%M:%S')}
+        with self.lock:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            if status == 'done':
+                self.done[(scene, step)] = fingerprint
+
+# Memory budget and inference slots shared by the running scenes
+class ResourceLimits:
+    """
+    Admission control of the batch: a scene starts only when its estimated memory fits in the
+    budget (a scene larger than the whole budget runs alone), and at most inference_slots
+    reconstruction steps run at a time.
+    """
+
+    def __init__(self, memory_budget, inference_slots):
+        self.memory_budget = memory_budget
+        self.memory_used = 0
+        self.condition = threading.Condition()
+        self.inference = threading.Semaphore(inference_slots)
+
+    def acquire_memory(self, amount):
+        with self.condition:
+            while self.memory_used and self.memory_used + amount > self.memory_budget:
+                self.condition.wait()
+            self.memory_used += amount
+
+    def release_memory(self, amount):
+        with self.condition:
+            self.memory_used -= amount
+            self.condition.notify_all()
+
+# Function to run one step as a child process
+def run_step(argv, log_path, threads):
+    """Run a pipeline script with capped threads, logging its output; return its exit code."""
+    env = dict(os.environ)
+    for variable in THREAD_VARIABLES:
+        env[variable] = str(threads)
+    with open(log_path, 'w') as log:
+        log.write(' '.join(argv) + '\n\n')
+        log.flush()
+        return subprocess.call(argv, stdout=log, stderr=subprocess.STDOUT, env=env, cwd=SCRIPT_DIR)
+
+# Function to run the whole pipeline of one scene
+def run_scene(scene, input_path, args, journal, limits):
+    """
+    Run the steps of one scene that the journal does not list as done with the same fingerprint
+    and whose output still exists, and every step after the first one that runs.
+
+    :return: (scene, 'done' or 'failed', failed step or '', seconds)
+    """
+    scene_dir = os.path.join(args.work_dir, scene)
+    output_path = os.path.join(args.output_dir, f"{scene}.ply")
+    os.makedirs(os.path.join(scene_dir, 'logs'), exist_ok=True)
+    try:
+        _, _, vertex_count, _, _ = read_ply_header(input_path)
+    except (OSError, ValueError) as error:
+        journal.record(scene, 'read', 'failed', 0.0, str(error))
+        return scene, 'failed', 'read', 0.0
+    memory = vertex_count * args.memory_per_point
+
+    start_scene = time.time()
+    limits.acquire_memory(memory)
+    try:
+        stale = False
+        for step, argv, uses_inference, step_output in scene_steps(scene_dir, input_path, output_path, args):
+            fingerprint = step_fingerprint(argv, input_path)
+            if not stale and journal.is_done(scene, step, fingerprint) and os.path.exists(step_output):
+                continue
+            if not stale and os.path.exists(output_path):
+                os.remove(output_path)  # A failed re-run must not leave the result of older settings
+            stale = True
+            start = time.time()
+            if uses_inference:
+                with limits.inference:
+                    code = run_step(argv, os.path.join(scene_dir, 'logs', f"{step}.log"), args.cpus_per_job)
+            else:
+                code = run_step(argv, os.path.join(scene_dir, 'logs', f"{step}.log"), args.cpus_per_job)
+            if code != 0:
+                journal.record(scene, step, 'failed', time.time() - start, f"exit code {code}, see logs/{step}.log", fingerprint)
+                return scene, 'failed', step, time.time() - start_scene
+            journal.record(scene, step, 'done', time.time() - start, fingerprint=fingerprint)
+    finally:
+        limits.release_memory(memory)
+    return scene, 'done', '', time.time() - start_scene
+
+# Set up command line arguments
+def parse_args():
+    parser = argparse.ArgumentParser(description="Denoise many scenes with the full pipeline on a local pool, with resource limits and a resumable journal.")
+    parser.add_argument('--manifest', type=str, default=None, help="Text file with one 'path' or 'name path' per line")
+    parser.add_argument('--inputs', type=str, nargs='*', default=[], help="Glob patterns of point_cloud.ply files, e.g. 'output/*/point_cloud/iteration_30000/point_cloud.ply'")
+    parser.add_argument('--work_dir', type=str, required=True, help="Directory for the per-scene intermediate folders, logs and the journal")
+    parser.add_argument('--output_dir', type=str, required=True, help="Directory to save the denoised point clouds as <scene>.ply")
+    parser.add_argument('--engine', type=str, choices=['model', 'occupancy'], default='model', help="Reconstruction step: repc5.py (model) or occupancy_filter.py")
+    parser.add_argument('--model_path', type=str, default=None, help="Path to the trained model file (for --engine model)")
+    parser.add_argument('--pcgv2_dir', type=str, default=None, help="Directory holding repc5.py in the PCGv2 deployment (default: this directory)")
+    parser.add_argument('--voxel_resolution', type=int, default=7168, help="Resolution of the voxel grid")
+    parser.add_argument('--max_jobs', type=int, default=None, help="Scenes running at a time (default: CPU count / --cpus_per_job)")
+    parser.add_argument('--cpus_per_job', type=int, default=2, help="Threads each step may use (default is 2)")
+    parser.add_argument('--memory_gb', type=float, default=None, help="Memory budget of the running scenes in GB (default: unlimited)")
+    parser.add_argument('--memory_per_point', type=float, default=4096, help="Estimated peak bytes per Gaussian of a scene (default is 4096)")
+    parser.add_argument('--inference_slots', type=int, default=1, help="Reconstruction steps running at a time, e.g. one per GPU (default is 1)")
+    return parser.parse_args()
+
+# Main function
+def main():
+    args = parse_args()
+    if args.engine == 'model' and not args.model_path:
+        raise ValueError("--engine model needs --model_path")
+
+    scenes = collect_inputs(args.manifest, args.inputs)
+    if not scenes:
+        raise ValueError("No input point clouds; give --manifest or --inputs")
+    # The steps run in the script directory, so every path they get must be absolute
+    args.work_dir = os.path.abspath(args.work_dir)
+    args.output_dir = os.path.abspath(args.output_dir)
+    args.model_path = args.model_path and os.path.abspath(args.model_path)
+    args.pcgv2_dir = args.pcgv2_dir and os.path.abspath(args.pcgv2_dir)
+    os.makedirs(args.work_dir, exist_ok=True)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    max_jobs = args.max_jobs or max((os.cpu_count() or 1) // args.cpus_per_job, 1)
+    memory_budget = args.memory_gb * 2 ** 30 if args.memory_gb else float('inf')
+    journal = Journal(os.path.join(args.work_dir, JOURNAL_FILE_NAME))
+    limits = ResourceLimits(memory_budget, args.inference_slots)
+    print(f"{len(scenes)} scenes, {max_jobs} at a time with {args.cpus_per_job} threads each, "
+          f"{args.inference_slots} inference slot(s)")
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max_jobs) as executor:
+        futures = [executor.submit(run_scene, scene, path, args, journal, limits) for scene, path in scenes]
+        for future in futures:
+            scene, status, step, seconds = future.result()
+            results.append({'scene': scene, 'status': status, 'failed_step': step, 'seconds': round(seconds, 3)})
+            print(f"{scene}: {status}{' at ' + step if step else ''} ({seconds:.1f}s)")
+
+    summary_path = os.path.join(args.work_dir, 'summary.json')
+    with open(summary_path, 'w') as f:
+        json.dump(results, f, indent=2)
+    failed = sum(result['status'] != 'done' for result in results)
+    print(f"{len(results) - failed} scenes done, {failed} failed; summary saved to: {summary_path}")
+
+if __name__ == "__main__":
+    main()
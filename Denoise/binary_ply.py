@@ -0,0 +1,284 @@
+import numpy as np
+import pandas as pd
+
+# PLY property types and their little-endian NumPy equivalents
+PLY_DTYPES = {
+    'char': 'i1', 'int8': 'i1',
+    'uchar': 'u1', 'uint8': 'u1',
+    'short': '<i2', 'int16': '<i2',
+    'ushort': '<u2', 'uint16': '<u2',
+    'int': '<i4', 'int32': '<i4',
+    'uint': '<u4', 'uint32': '<u4',
+    'float': '<f4', 'float32': '<f4',
+    'double': '<f8', 'float64': '<f8'
+}
+
+# Digits reserved for the vertex count of a stream whose length is unknown until it is closed;
+# the unused digits pad a comment line, so the header keeps its size when the count is patched
+VERTEX_COUNT_WIDTH = 12
+
+# Default number of vertex records per chunk of the streaming functions
+CHUNK_SIZE = 1 << 18
+
+# Function to read the header of a PLY file
+def read_ply_header(file_path):
+    """
+    Read the header of a PLY file.
+
+    :param file_path: Path to the PLY file
+    :return: Header lines, format name, vertex count, vertex properties as (type, name) pairs
+             and the byte offset where the vertex data starts
+    """
+    header = []
+    file_format = None
+    vertex_count = 0
+    properties = []
+    in_vertex = False
+    with open(file_path, 'rb') as f:
+        while True:
+            raw = f.readline()
+            if not raw:
+                raise ValueError(f"No end_header found in {file_path}")
+            line = raw.decode('utf-8', errors='ignore')
+            header.append(line)
+            parts = line.split()
+            if not parts:
+                continue
+            if parts[0] == 'format':
+                file_format = parts[1]
+            elif parts[0] == 'element':
+                in_vertex = parts[1] == 'vertex'
+                if in_vertex:
+                    vertex_count = int(parts[2])
+            elif parts[0] == 'property' and in_vertex:
+                properties.append((parts[1], parts[-1]))
+            elif parts[0] == 'end_header':
+                data_offset = f.tell()
+                break
+    return header, file_format, vertex_count, properties, data_offset
+
+# Function to build the structured dtype of one vertex record
+def vertex_dtype(properties):
+    """Build a structured NumPy dtype from a list of (type, name) PLY properties."""
+    return np.dtype([(name, PLY_DTYPES[prop_type]) for prop_type, name in properties])
+
+# Function to recover the PLY properties of a structured dtype
+def dtype_properties(dtype):
+    """Inverse of vertex_dtype: the (type, name) PLY properties of a structured dtype."""
+    types = {}
+    for prop_type, code in PLY_DTYPES.items():
+        types.setdefault(np.dtype(code), prop_type)  # The first (short) PLY name of each type
+    return [(types[dtype.fields[name][0]], name) for name in dtype.names]
+
+# Function to memory-map the vertices of a binary PLY file
+def memmap_vertices(file_path, mode='r'):
+    """
+    Memory-map the vertex records of a binary little-endian PLY file as a structured array.
+
+    :param file_path: Path to the binary PLY file
+    :param mode: NumPy memmap mode ('r' for read-only, 'r+' for in-place edits)
+    :return: Structured memmap of the vertex records and the (type, name) property list
+    """
+    _, file_format, vertex_count, properties, data_offset = read_ply_header(file_path)
+    if file_format != 'binary_little_endian':
+        raise ValueError(f"{file_path} is not a binary_little_endian PLY file (format: {file_format})")
+    if vertex_count == 0:
+        return np.empty(0, dtype=vertex_dtype(properties)), properties  # np.memmap cannot map zero bytes
+    vertices = np.memmap(file_path, dtype=vertex_dtype(properties), mode=mode,
+                         offset=data_offset, shape=(vertex_count,))
+    return vertices, properties
+
+# Function to iterate over the vertices of a PLY file in chunks
+def iter_vertex_chunks(file_path, chunk_size=CHUNK_SIZE):
+    """
+    Read the vertices of an ASCII or binary little-endian PLY file chunk by chunk.
+
+    :param file_path: Path to the PLY file
+    :param chunk_size: Number of vertex records per chunk
+    :return: Generator of structured arrays with the dtype of vertex_dtype(properties)
+    """
+    header, file_format, vertex_count, properties, _ = read_ply_header(file_path)
+    dtype = vertex_dtype(properties)
+    if file_format == 'binary_little_endian':
+        vertices, _ = memmap_vertices(file_path)
+        for start in range(0, vertex_count, chunk_size):
+            yield np.array(vertices[start:start + chunk_size])
+        return
+    if file_format != 'ascii':
+        raise ValueError(f"Unsupported PLY format {file_format} in {file_path}")
+    reader = pd.read_csv(file_path, skiprows=len(header), sep=' ', header=None, chunksize=chunk_size,
+                         nrows=vertex_count, usecols=range(len(properties)))
+    for frame in reader:
+        records = np.empty(len(frame), dtype=dtype)
+        for i, (_, name) in enumerate(properties):
+            records[name] = frame.iloc[:, i].values
+        yield records
+
+# Function to build the lines of a PLY header
+def build_header_lines(file_format, properties, vertex_count, reserve=False):
+    """
+    Build the lines of a PLY header with a plain 'element vertex <count>' line.
+
+    :param reserve: Add a comment line padded so the header has the same size for any count of
+                    up to VERTEX_COUNT_WIDTH digits (the count can then be patched in place)
+    """
+    header = ["ply\n", f"format {file_format} 1.0\n"]
+    if reserve:
+        padding = VERTEX_COUNT_WIDTH - len(str(vertex_count))
+        if padding < 0:
+            raise ValueError(f"Vertex count {vertex_count} exceeds {VERTEX_COUNT_WIDTH} digits")
+        header.append("comment" + " " * padding + "\n")
+    header.append(f"element vertex {vertex_count}\n")
+    header += [f"property {prop_type} {name}\n" for prop_type, name in properties]
+    header.append("end_header\n")
+    return header
+
+# Function to build the header of a binary PLY file
+def build_binary_header(properties, vertex_count, reserve=False):
+    """Build a binary little-endian PLY header for the given (type, name) properties."""
+    return ''.join(build_header_lines('binary_little_endian', properties, vertex_count, reserve)).encode('ascii')
+
+# Function to rebuild a PLY header with a new vertex property list
+def replace_vertex_properties(header, properties, vertex_count=None):
+    """
+    Rebuild a header with new vertex properties, keeping its other lines (comments, format).
+
+    :param header: Original header lines
+    :param properties: New list of (type, name) vertex properties
+    :param vertex_count: New vertex count, or None to keep the original one
+    :return: Header as bytes
+    """
+    lines = []
+    in_vertex = False
+    for line in header:
+        parts = line.split()
+        if parts and parts[0] == 'element':
+            in_vertex = parts[1] == 'vertex'
+            if in_vertex:
+                lines.append(line if vertex_count is None else f"element vertex {vertex_count}\n")
+                lines += [f"property {prop_type} {name}\n" for prop_type, name in properties]
+                continue
+        if parts and parts[0] == 'property' and in_vertex:
+            continue
+        lines.append(line)
+    return ''.join(lines).encode('ascii')
+
+# Writer that appends vertex records to a binary PLY file chunk by chunk
+class BinaryPlyWriter:
+    """
+    Incrementally write vertex records to a binary little-endian PLY file.
+
+    When vertex_count is given, the header holds it from the start and close() checks it.
+    Otherwise the count is unknown until the last chunk is written: the header reserves room
+    for it (see build_header_lines) and is rewritten in place when the writer is closed.
+    """
+
+    def __init__(self, file_path, properties, vertex_count=None):
+        self.file_path = file_path
+        self.properties = list(properties)
+        self.dtype = vertex_dtype(self.properties)
+        self.count = 0
+        self.vertex_count = vertex_count
+        self._file = open(file_path, 'wb')
+        self._file.write(build_binary_header(self.properties, vertex_count or 0, vertex_count is None))
+
+    def write(self, records):
+        """Append a structured array (or anything convertible to it) of vertex records."""
+        records = np.asarray(records)
+        if records.dtype != self.dtype:
+            records = records.astype(self.dtype)
+        self._file.write(records.tobytes())
+        self.count += len(records)
+
+    def close(self):
+        """Patch the vertex count into the header and close the file."""
+        if self._file.closed:
+            return
+        if self.vertex_count is None:
+            self._file.seek(0)
+            self._file.write(build_binary_header(self.properties, self.count, True))
+        self._file.close()
+        if self.vertex_count is not None and self.count != self.vertex_count:
+            raise ValueError(f"{self.file_path}: {self.count} vertices written, {self.vertex_count} announced")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+# Function to build the header of an ASCII PLY file
+def build_ascii_header(properties, vertex_count, reserve=False):
+    """Build an ASCII PLY header for the given (type, name) properties."""
+    return ''.join(build_header_lines('ascii', properties, vertex_count, reserve))
+
+# Writer that appends vertex records to an ASCII PLY file chunk by chunk
+class AsciiPlyWriter:
+    """
+    Incrementally write vertex records to an ASCII PLY file, like BinaryPlyWriter.
+
+    Integer properties are written as integers and floating-point properties with enough
+    digits to read back the same float32 value.
+    """
+
+    def __init__(self, file_path, properties, vertex_count=None):
+        self.file_path = file_path
+        self.properties = list(properties)
+        self.dtype = vertex_dtype(self.properties)
+        self.count = 0
+        self.vertex_count = vertex_count
+        self._file = open(file_path, 'w')
+        self._file.write(build_ascii_header(self.properties, vertex_count or 0, vertex_count is None))
+
+    def write(self, records):
+        """Append a structured array of vertex records as text lines."""
+        records = np.asarray(records)
+        if len(records) == 0:
+            return
+        frame = pd.DataFrame(dict((name, records[name]) for _, name in self.properties))
+        frame.to_csv(self._file, sep=' ', header=False, index=False, float_format='%.9g')
+        self.count += len(records)
+
+    def close(self):
+        """Patch the vertex count into the header and close the file."""
+        if self._file.closed:
+            return
+        if self.vertex_count is None:
+            self._file.seek(0)
+            self._file.write(build_ascii_header(self.properties, self.count, True))
+        self._file.close()
+        if self.vertex_count is not None and self.count != self.vertex_count:
+            raise ValueError(f"{self.file_path}: {self.count} vertices written, {self.vertex_count} announced")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+# Function to write a stream of vertex chunks to a PLY file
+def write_chunks(file_path, chunks, properties=None, ascii=False):
+    """
+    Write chunks of vertex records with BinaryPlyWriter or AsciiPlyWriter.
+
+    :param file_path: Output PLY file
+    :param chunks: Iterable of structured arrays; for a list or tuple, the header holds the vertex
+                   count from the start instead of reserving room for it
+    :param properties: (type, name) properties; None derives them from the first chunk
+    :param ascii: Write ASCII instead of binary little-endian
+    :return: Number of records written
+    """
+    vertex_count = sum(len(records) for records in chunks) if isinstance(chunks, (list, tuple)) else None
+    chunks = iter(chunks)
+    first = next(chunks, None)
+    if properties is None:
+        if first is None:
+            raise ValueError(f"Cannot derive the properties of {file_path} from an empty stream")
+        properties = dtype_properties(first.dtype)
+    writer_class = AsciiPlyWriter if ascii else BinaryPlyWriter
+    with writer_class(file_path, properties, vertex_count) as writer:
+        if first is not None:
+            writer.write(first)
+        for records in chunks:
+            writer.write(records)
+    return writer.count
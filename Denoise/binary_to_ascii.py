@@ -1,6 +1,7 @@
 import struct
 import os
 import argparse
+from binary_ply import CHUNK_SIZE, read_ply_header, iter_vertex_chunks, write_chunks
 
 # Function to convert a binary-encoded PLY file to ASCII format
 def convert_binary_ply_to_ascii(binary_ply_path, ascii_ply_path):
@@ -56,6 +57,17 @@ def convert_binary_ply_to_ascii(binary_ply_path, ascii_ply_path):
 
     print(f"Conversion complete. ASCII PLY file saved at: {ascii_ply_path}")
 
+# Function to convert a binary PLY file to ASCII chunk by chunk
+def stream_binary_to_ascii(binary_ply_path, ascii_ply_path, chunk_size=CHUNK_SIZE):
+    """
+    Streaming version of the conversion: binary records are read as NumPy chunks
+    (binary_ply.iter_vertex_chunks) and written with binary_ply.AsciiPlyWriter.
+
+    :return: Number of vertices written
+    """
+    _, _, _, properties, _ = read_ply_header(binary_ply_path)
+    return write_chunks(ascii_ply_path, iter_vertex_chunks(binary_ply_path, chunk_size), properties, ascii=True)
+
 # Set up command line arguments
 def parse_args():
     parser = argparse.ArgumentParser(description="Convert a binary PLY file to ASCII format.")
@@ -0,0 +1,365 @@
+import os
+import json
+import argparse
+import subprocess
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from binary_ply import read_ply_header, memmap_vertices, replace_vertex_properties
+
+# Name of the index file of a brick store
+INDEX_FILE_NAME = 'bricks.json'
+
+# Number of vertex records read from the source at a time
+READ_CHUNK = 1 << 20
+
+# Extensions of the per-brick removal files read by merge, in order of preference
+REMOVED_EXTENSIONS = ('.txt', '.npy', '.bits')
+
+# Function to compute the bounds of a binary point cloud chunk by chunk
+def chunked_bounds(vertices, chunk=READ_CHUNK):
+    """Return the (3,) minimum and maximum of x, y, z without loading all vertices at once."""
+    low = np.full(3, np.inf)
+    high = np.full(3, -np.inf)
+    for start in range(0, len(vertices), chunk):
+        part = vertices[start:start + chunk]
+        xyz = np.stack([part['x'], part['y'], part['z']], axis=1)
+        low = np.minimum(low, xyz.min(axis=0))
+        high = np.maximum(high, xyz.max(axis=0))
+    return low, high
+
+# Function to list the bricks a chunk of points belongs to
+def brick_memberships(xyz, origin, brick_size, grid_shape, halo):
+    """
+    Assign every point to its home brick and to the neighbouring bricks whose halo contains it.
+
+    :param xyz: (N, 3) positions
+    :return: Generator of (rows, linear brick index of those rows, is_core) per neighbour offset
+    """
+    grid_shape = np.asarray(grid_shape)
+    relative = (xyz - origin) / brick_size
+    home = np.clip(np.floor(relative).astype(np.int64), 0, grid_shape - 1)
+    within = (relative - home) * brick_size  # Position inside the home brick
+    near_low = within < halo
+    near_high = within > brick_size - halo
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            for dz in (-1, 0, 1):
+                offset = np.array([dx, dy, dz])
+                mask = np.ones(len(xyz), dtype=bool)
+                for axis, step in enumerate(offset):
+                    if step < 0:
+                        mask &= near_low[:, axis]
+                    elif step > 0:
+                        mask &= near_high[:, axis]
+                cells = home[mask] + offset
+                inside = np.all((cells >= 0) & (cells < grid_shape), axis=1)
+                rows = np.flatnonzero(mask)[inside]
+                yield rows, np.ravel_multi_index(cells[inside].T, grid_shape), not (dx or dy or dz)
+
+# Store of spatial bricks of one point cloud, each with a halo of neighbouring points
+class BrickStore:
+    """
+    On-disk spatial partition of a binary 3DGS point cloud.
+
+    Every brick is a binary PLY file with the source's vertex layout, holding its core points
+    (whose home is the brick) first and then its halo points (within `halo` of the brick), and a
+    `<brick>_ids.npy` file with the row numbers of those points in the source. Per-brick results
+    are merged back by these IDs, using the core points only, so each point is decided exactly once.
+    """
+
+    def __init__(self, directory, index):
+        self.directory = directory
+        self.index = index
+
+    @property
+    def bricks(self):
+        return self.index['bricks']
+
+    def brick_path(self, brick):
+        return os.path.join(self.directory, f"{brick['name']}.ply")
+
+    def ids_path(self, brick):
+        return os.path.join(self.directory, f"{brick['name']}_ids.npy")
+
+    @classmethod
+    def open(cls, directory):
+        """Open a brick store built by BrickStore.build."""
+        with open(os.path.join(directory, INDEX_FILE_NAME), 'r') as f:
+            return cls(directory, json.load(f))
+
+    @classmethod
+    def build(cls, source_path, directory, brick_size, halo, chunk=READ_CHUNK):
+        """
+        Partition a binary PLY file into bricks with bounded memory.
+
+        Three passes over the source: the bounds, the number of core and halo points per brick
+        (to pre-size the brick files), and the copy of the records into the brick files.
+
+        :param source_path: Binary 3DGS point cloud
+        :param directory: Directory of the store
+        :param brick_size: Edge length of a brick in world units
+        :param halo: Width of the halo in world units (smaller than brick_size)
+        :param chunk: Number of source records processed at a time
+        :return: BrickStore
+        """
+        if not 0 <= halo < brick_size:
+            raise ValueError(f"The halo ({halo}) must be smaller than the brick size ({brick_size})")
+        os.makedirs(directory, exist_ok=True)
+        header, _, _, properties, _ = read_ply_header(source_path)
+        source, _ = memmap_vertices(source_path)
+
+        low, high = chunked_bounds(source, chunk)
+        grid_shape = tuple(int(n) for n in np.maximum(np.ceil((high - low) / brick_size), 1))
+        num_bricks = int(np.prod(grid_shape))
+
+        # Pass 2: core and halo counts per brick
+        counts = np.zeros((num_bricks, 2), dtype=np.int64)
+        for start in range(0, len(source), chunk):
+            part = source[start:start + chunk]
+            xyz = np.stack([part['x'], part['y'], part['z']], axis=1).astype(np.float64)
+            for _, linear, is_core in brick_memberships(xyz, low, brick_size, grid_shape, halo):
+                counts[:, 0 if is_core else 1] += np.bincount(linear, minlength=num_bricks)
+
+        # Pre-size the files of the non-empty bricks; the halo section follows the core section
+        bricks = []
+        positions = np.zeros((num_bricks, 2), dtype=np.int64)
+        offsets = {}  # Linear brick index -> data offsets of its PLY and ID files
+        for linear in np.flatnonzero(counts[:, 0]):
+            cell = np.unravel_index(linear, grid_shape)
+            brick = {
+                'name': 'brick_' + '_'.join(str(int(c)) for c in cell),
+                'cell': [int(c) for c in cell],
+                'min': (low + np.asarray(cell) * brick_size).tolist(),
+                'max': (low + (np.asarray(cell) + 1) * brick_size).tolist(),
+                'core': int(counts[linear, 0]),
+                'halo': int(counts[linear, 1]),
+            }
+            total = brick['core'] + brick['halo']
+            header_bytes = replace_vertex_properties(header, properties, total)
+            with open(os.path.join(directory, f"{brick['name']}.ply"), 'wb') as f:
+                f.write(header_bytes)
+                f.truncate(len(header_bytes) + total * source.dtype.itemsize)
+            ids_path = os.path.join(directory, f"{brick['name']}_ids.npy")
+            np.lib.format.open_memmap(ids_path, mode='w+', dtype=np.int64, shape=(total,)).flush()
+            offsets[int(linear)] = (brick, len(header_bytes), os.path.getsize(ids_path) - total * 8)
+            positions[linear, 1] = brick['core']
+            bricks.append(brick)
+
+        # Pass 3: copy the records and their source row numbers into the bricks, one write per brick
+        # and section for every chunk
+        for start in range(0, len(source), chunk):
+            part = np.asarray(source[start:start + chunk])
+            xyz = np.stack([part['x'], part['y'], part['z']], axis=1).astype(np.float64)
+            memberships = list(brick_memberships(xyz, low, brick_size, grid_shape, halo))
+            rows = np.concatenate([rows for rows, _, _ in memberships])
+            linear = np.concatenate([linear for _, linear, _ in memberships])
+            sections = np.concatenate([np.full(len(rows), 0 if is_core else 1) for rows, _, is_core in memberships])
+            order = np.lexsort((sections, linear))
+            keys, starts = np.unique(linear[order] * 2 + sections[order], return_index=True)
+            for key, begin, end in zip(keys, starts, np.append(starts[1:], len(order))):
+                brick_index, section = divmod(int(key), 2)
+                if brick_index not in offsets:
+                    continue  # Halo of an empty brick
+                brick, ply_offset, ids_offset = offsets[brick_index]
+                selected = rows[order[begin:end]]
+                at = positions[brick_index, section]
+                with open(os.path.join(directory, f"{brick['name']}.ply"), 'r+b') as f:
+                    f.seek(ply_offset + at * source.dtype.itemsize)
+                    f.write(part[selected].tobytes())
+                with open(os.path.join(directory, f"{brick['name']}_ids.npy"), 'r+b') as f:
+                    f.seek(ids_offset + at * 8)
+                    f.write((start + selected).astype('<i8').tobytes())
+                positions[brick_index, section] += len(selected)
+
+        index = {
+            'source': os.path.abspath(source_path),
+            'vertex_count': int(len(source)),
+            'origin': low.tolist(),
+            'brick_size': brick_size,
+            'halo': halo,
+            'grid_shape': list(grid_shape),
+            'bricks': bricks,
+        }
+        with open(os.path.join(directory, INDEX_FILE_NAME), 'w') as f:
+            json.dump(index, f, indent=2)
+        return cls(directory, index)
+
+    def iter_bricks(self):
+        """Yield (brick, memory-mapped vertices, source IDs) for every brick."""
+        for brick in self.bricks:
+            vertices, _ = memmap_vertices(self.brick_path(brick))
+            yield brick, vertices, np.load(self.ids_path(brick), mmap_mode='r')
+
+    def merge_removed(self, removed_by_brick):
+        """
+        Merge per-brick removals into one removal mask of the source, by ID.
+
+        :param removed_by_brick: Dict of brick name to removed rows of that brick (0-based), or to a
+                                 boolean mask over the brick's rows; halo rows are ignored
+        :return: Boolean removal mask over the source rows
+        """
+        removed = np.zeros(self.index['vertex_count'], dtype=bool)
+        for brick in self.bricks:
+            if brick['name'] not in removed_by_brick:
+                continue
+            rows = np.asarray(removed_by_brick[brick['name']])
+            rows = np.flatnonzero(rows) if rows.dtype == bool else rows.astype(np.int64)
+            rows = rows[rows < brick['core']]
+            removed[np.load(self.ids_path(brick), mmap_mode='r')[rows]] = True
+        return removed
+
+    def map(self, brick_function, workers=4):
+        """
+        Run a filter on every brick in parallel processes and merge the removals by ID.
+
+        :param brick_function: Picklable function of the brick's vertices returning a boolean removal mask
+        :param workers: Number of processes
+        :return: Boolean removal mask over the source rows
+        """
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            masks = executor.map(run_on_brick, [self.brick_path(brick) for brick in self.bricks],
+                                 [brick_function] * len(self.bricks))
+            return self.merge_removed(dict((brick['name'], mask) for brick, mask in zip(self.bricks, masks)))
+
+    def write_filtered(self, output_path, removed, chunk=READ_CHUNK):
+        """Write the source without the removed rows, streaming it chunk by chunk."""
+        header, _, _, properties, _ = read_ply_header(self.index['source'])
+        source, _ = memmap_vertices(self.index['source'])
+        with open(output_path, 'wb') as f:
+            f.write(replace_vertex_properties(header, properties, int((~removed).sum())))
+            for start in range(0, len(source), chunk):
+                source[start:start + chunk][~removed[start:start + chunk]].tofile(f)
+
+# Function to load the removed rows of one brick
+def load_removed_rows(removed_path, row_count, id_base=0):
+    """
+    Load the rows of a brick removed by a stage.
+
+    :param removed_path: Text file with one ID per line, .npy file with row indices or a boolean
+                         mask (classical_filter.py), or .bits file with a packed bitmask
+    :param row_count: Number of rows (core and halo) of the brick file
+    :param id_base: ID of the first row in text files (0 for the Denoise scripts, 1 for the
+                    SOR/ROR/DBSCAN scripts of Contrast, which number the points from 1)
+    :return: Sorted 0-based rows of the brick file
+    """
+    if removed_path.endswith('.bits'):
+        packed = np.fromfile(removed_path, dtype=np.uint8)
+        return np.flatnonzero(np.unpackbits(packed, count=row_count, bitorder='little'))
+    if removed_path.endswith('.npy'):
+        rows = np.load(removed_path)
+        if rows.dtype == np.bool_:
+            return np.flatnonzero(rows)
+        rows = rows.astype(np.int64)
+    elif os.path.getsize(removed_path) == 0:
+        return np.empty(0, dtype=np.int64)  # A clean brick; loadtxt would warn about the empty file
+    else:
+        rows = np.loadtxt(removed_path, dtype=np.int64, ndmin=1) - id_base
+    if len(rows) and (rows.min() < 0 or rows.max() >= row_count):
+        raise ValueError(f"{removed_path}: row out of range for a brick of {row_count} points (check --id_base)")
+    return np.sort(rows)
+
+# Function to find the removal file of a brick
+def find_removed_file(removed_dir, brick):
+    """Path of <brick>_removed.txt/.npy/.bits in removed_dir, or None."""
+    for extension in REMOVED_EXTENSIONS:
+        removed_path = os.path.join(removed_dir, f"{brick['name']}_removed{extension}")
+        if os.path.exists(removed_path):
+            return removed_path
+    return None
+
+# Function to run a stage command on one brick (in a worker thread)
+def run_stage_on_brick(store, brick, command, removed_dir, extension):
+    """
+    Run a command line with {brick}, {removed} and {output} replaced by the brick file, the removal
+    file to write in removed_dir, and a path for the filtered brick (for stages that also write one).
+
+    :return: (brick name, exit code)
+    """
+    paths = {
+        'brick': store.brick_path(brick),
+        'removed': os.path.join(removed_dir, f"{brick['name']}_removed{extension}"),
+        'output': os.path.join(removed_dir, f"{brick['name']}_filtered.ply"),
+    }
+    argv = [argument.format(**paths) for argument in command]
+    with open(os.path.join(removed_dir, f"{brick['name']}.log"), 'w') as log:
+        return brick['name'], subprocess.call(argv, stdout=log, stderr=subprocess.STDOUT)
+
+# Function to run a filter on one brick file (in a worker process)
+def run_on_brick(brick_path, brick_function):
+    """Memory-map one brick and return the removal mask of brick_function."""
+    vertices, _ = memmap_vertices(brick_path)
+    return np.asarray(brick_function(vertices), dtype=bool)
+
+# Set up command line arguments
+def parse_args():
+    parser = argparse.ArgumentParser(description="Partition a point cloud into on-disk bricks with halos, run a stage on every brick, and merge per-brick removals back by ID.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help="Partition a binary 3DGS point cloud into bricks")
+    build.add_argument('--input', type=str, required=True, help="Binary 3DGS point cloud")
+    build.add_argument('--store_dir', type=str, required=True, help="Directory to save the bricks and bricks.json")
+    build.add_argument('--brick_size', type=float, required=True, help="Edge length of a brick in world units")
+    build.add_argument('--halo', type=float, default=0.0, help="Width of the halo around every brick in world units (default is 0)")
+    build.add_argument('--chunk_size', type=int, default=READ_CHUNK, help="Records read from the input at a time")
+
+    run = subparsers.add_parser('run', help="Run a stage command on every brick, e.g. classical_filter.py or density_filter.py")
+    run.add_argument('--store_dir', type=str, required=True, help="Directory of the brick store")
+    run.add_argument('--removed_dir', type=str, required=True, help="Directory for the removal files and logs of the bricks")
+    run.add_argument('--extension', type=str, choices=REMOVED_EXTENSIONS, default='.txt', help="Extension of the removal files the stage writes (default is .txt)")
+    run.add_argument('--workers', type=int, default=1, help="Bricks processed at a time (default is 1)")
+    run.add_argument('stage', nargs=argparse.REMAINDER, help="Stage command after --, with {brick}, {removed} and {output} placeholders")
+
+    merge = subparsers.add_parser('merge', help="Merge the removed IDs of every brick and write the filtered point cloud")
+    merge.add_argument('--store_dir', type=str, required=True, help="Directory of the brick store")
+    merge.add_argument('--removed_dir', type=str, required=True, help="Directory with one <brick>_removed.txt, .npy or .bits per brick (rows of the brick file)")
+    merge.add_argument('--id_base', type=int, default=0, help="ID of the first row in the .txt files: 0 for the Denoise scripts, 1 for SORdenoise/RORdenoise/DBSCANdenoise (default is 0)")
+    merge.add_argument('--output', type=str, required=True, help="Output binary PLY file")
+    merge.add_argument('--removed_ids', type=str, default=None, help="Text file to save the merged removed IDs (0-based rows of the source)")
+    return parser.parse_args()
+
+# Main function
+def main():
+    args = parse_args()
+
+    if args.command == 'build':
+        store = BrickStore.build(args.input, args.store_dir, args.brick_size, args.halo, args.chunk_size)
+        grid = 'x'.join(str(n) for n in store.index['grid_shape'])
+        halo_points = sum(brick['halo'] for brick in store.bricks)
+        print(f"{store.index['vertex_count']} points partitioned into {len(store.bricks)} non-empty bricks "
+              f"of a {grid} grid, with {halo_points} halo copies")
+        print(f"Brick index saved to: {os.path.join(args.store_dir, INDEX_FILE_NAME)}")
+        return
+
+    store = BrickStore.open(args.store_dir)
+    if args.command == 'run':
+        command = args.stage[1:] if args.stage[:1] == ['--'] else args.stage
+        if not command:
+            raise SystemExit("No stage command; give it after --")
+        os.makedirs(args.removed_dir, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            results = list(executor.map(lambda brick: run_stage_on_brick(store, brick, command, args.removed_dir, args.extension),
+                                        store.bricks))
+        failed = [name for name, code in results if code != 0]
+        for name in failed:
+            print(f"{name}: failed, see {os.path.join(args.removed_dir, name + '.log')}")
+        print(f"Stage run on {len(results) - len(failed)} of {len(results)} bricks; removal files saved to: {args.removed_dir}")
+        if failed:
+            raise SystemExit(1)
+        return
+
+    removed_by_brick = {}
+    for brick in store.bricks:
+        removed_path = find_removed_file(args.removed_dir, brick)
+        if removed_path:
+            removed_by_brick[brick['name']] = load_removed_rows(removed_path, brick['core'] + brick['halo'], args.id_base)
+        else:
+            print(f"No removed IDs for {brick['name']}; all its points are kept")
+    removed = store.merge_removed(removed_by_brick)
+    store.write_filtered(args.output, removed)
+    print(f"Removed {int(removed.sum())} of {len(removed)} points; filtered point cloud saved to: {args.output}")
+    if args.removed_ids:
+        np.savetxt(args.removed_ids, np.flatnonzero(removed), fmt='%d')
+        print(f"Removed IDs saved to: {args.removed_ids}")
+
+if __name__ == "__main__":
+    main()
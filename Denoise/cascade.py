@@ -0,0 +1,136 @@
+import os
+import time
+import argparse
+import numpy as np
+from attribute_schema import AttributeSchema, POSITION_COLUMNS
+from voxelization import read_ply, normalize_and_voxelize, write_ply
+from occupancy_filter import occupancy_scores
+
+# Function to write voxel coordinates as an ASCII point cloud with IDs, the format repc5.py reads
+def write_voxel_ply(output_path, voxel_coords, ids):
+    """Write integer voxel coordinates and IDs as an ASCII 'x y z ID' PLY file."""
+    with open(output_path, 'w') as f:
+        f.write("ply\nformat ascii 1.0\n")
+        f.write(f"element vertex {len(voxel_coords)}\n")
+        f.write("property float x\nproperty float y\nproperty float z\nproperty int ID\nend_header\n")
+        for (x, y, z), point_id in zip(voxel_coords, ids):
+            f.write(f"{x} {y} {z} {point_id}\n")
+
+# Function to filter coarse voxels with the pretrained encoder/decoder
+def model_filter(voxel_coords, work_dir, args):
+    """
+    Run the encoder/decoder of repc5.py on the coarse voxels.
+
+    A voxel is kept when the decoder reconstructs a voxel within --margin voxels (Chebyshev
+    distance) of it; voxels the decoder moves further away are clearly rejected.
+
+    :param voxel_coords: (V, 3) unique integer voxel coordinates
+    :param work_dir: Directory for the intermediate files
+    :param args: Parsed command line arguments (model_path, margin)
+    :return: Boolean mask of the kept voxels
+    """
+    # The model stack (torch, MinkowskiEngine) is only needed for this filter
+    from repc5 import encoder_process, decoder_process
+
+    input_ply_path = os.path.join(work_dir, 'coarse_xyz.ply')
+    output_ply_path = os.path.join(work_dir, 'coarse_xyz_re.ply')
+    write_voxel_ply(input_ply_path, voxel_coords, np.arange(len(voxel_coords)))
+
+    compressed_data_prefix = encoder_process(args.model_path, input_ply_path, work_dir)
+    decoder_process(args.model_path, compressed_data_prefix, input_ply_path, output_ply_path, rho=1.0)
+
+    _, reconstructed = read_ply(output_ply_path)
+    matched = np.empty((len(voxel_coords), 3))
+    matched[reconstructed.iloc[:, 3].values.astype(np.int64)] = reconstructed.iloc[:, :3].values
+    return np.abs(matched - voxel_coords).max(axis=1) <= args.margin
+
+# Function to filter coarse voxels with the CPU occupancy pyramid
+def occupancy_filter(voxel_coords, work_dir, args):
+    """Keep the coarse voxels whose occupancy score (see occupancy_filter.py) reaches --threshold."""
+    strides = tuple(int(value) for value in args.strides.split(','))
+    return occupancy_scores(voxel_coords, strides) >= args.threshold
+
+# Coarse-level filters; each takes (voxel_coords, work_dir, args) and returns a kept-voxel mask
+FILTERS = {
+    'model': model_filter,
+    'occupancy': occupancy_filter,
+}
+
+# Function to find the surviving points with a coarse-resolution pass
+def coarse_pass(xyz, bounds, coarse_resolution, filter_fn, work_dir, args):
+    """
+    Voxelize the positions at a coarse resolution, filter the unique voxels and map the result back.
+
+    :param xyz: (N, 3) point positions
+    :param bounds: (xyz_min, xyz_max) of the full point cloud
+    :param coarse_resolution: Voxel resolution of the coarse level
+    :param filter_fn: Filter from FILTERS
+    :param work_dir: Directory for the intermediate files
+    :param args: Parsed command line arguments passed on to the filter
+    :return: Boolean mask of the surviving points and the number of coarse voxels
+    """
+    xyz_min, xyz_max = bounds
+    extent = np.where(xyz_max > xyz_min, xyz_max - xyz_min, 1.0)
+    voxel_coords = ((xyz - xyz_min) / extent * coarse_resolution).astype(int)
+    unique_voxels, point_voxel = np.unique(voxel_coords, axis=0, return_inverse=True)
+    kept_voxels = filter_fn(unique_voxels, work_dir, args)
+    return kept_voxels[point_voxel.ravel()], len(unique_voxels)
+
+# Set up command line arguments
+def parse_args():
+    parser = argparse.ArgumentParser(description="Coarse-to-fine cascade: reject clear background at a low resolution, then voxelize the rest at full resolution.")
+    parser.add_argument('--input_dir', type=str, required=True, help="Directory containing the split PLY files (output of attributes_spilt.py)")
+    parser.add_argument('--output_dir', type=str, required=True, help="Directory to save the full-resolution voxelized PLY files")
+    parser.add_argument('--work_dir', type=str, required=True, help="Directory for the coarse-level intermediate files")
+    parser.add_argument('--model_path', type=str, default=None, help="Path to the trained model file (for --filter model)")
+    parser.add_argument('--filter', type=str, choices=sorted(FILTERS), default='model', help="Filter used at the coarse level")
+    parser.add_argument('--coarse_resolution', type=int, default=512, help="Voxel resolution of the coarse level (default is 512)")
+    parser.add_argument('--voxel_resolution', type=int, default=7168, help="Voxel resolution of the full-resolution level")
+    parser.add_argument('--margin', type=int, default=2, help="Largest displacement, in coarse voxels per axis (Chebyshev distance), between a coarse voxel and its reconstruction for the voxel to be accepted (default is 2)")
+    parser.add_argument('--strides', type=str, default='2,4,8', help="Pyramid strides of --filter occupancy (default is 2,4,8)")
+    parser.add_argument('--threshold', type=float, default=0.1, help="Minimum occupancy score of --filter occupancy (default is 0.1)")
+    parser.add_argument('--schema', type=str, default=None, help="Attribute schema file (default: schema.json in the input directory)")
+    return parser.parse_args()
+
+# Main function
+def main():
+    args = parse_args()
+
+    schema = AttributeSchema.locate(args.input_dir, args.schema)
+    os.makedirs(args.output_dir, exist_ok=True)
+    os.makedirs(args.work_dir, exist_ok=True)
+    schema.save(args.output_dir)
+
+    # The positions decide which points survive; they are the group holding x, y, z
+    position_group = next(group for group in schema.groups if group.columns == POSITION_COLUMNS)
+    _, position_data = read_ply(os.path.join(args.input_dir, position_group.file_name('split')))
+    xyz = position_data.iloc[:, :3].values
+    ids = position_data.iloc[:, -1].values.astype(int)
+
+    # Level 1: coarse voxels through the filter
+    start = time.time()
+    survivors, coarse_voxels = coarse_pass(xyz, (xyz.min(axis=0), xyz.max(axis=0)), args.coarse_resolution,
+                                           FILTERS[args.filter], args.work_dir, args)
+    surviving_ids = ids[survivors]
+    coarse_time = time.time() - start
+    print(f"Level 1 ({args.coarse_resolution}^3): {coarse_voxels} voxels filtered, "
+          f"{len(ids) - len(surviving_ids)} of {len(ids)} points rejected in {coarse_time:.2f}s")
+
+    # Level 2: the surviving points of every group at full resolution, normalized with the original bounds
+    # so their voxel coordinates (and devoxelization against the original split files) are unchanged
+    start = time.time()
+    for group in schema.groups:
+        header, data = read_ply(os.path.join(args.input_dir, group.file_name('split')))
+        bounds = (data.iloc[:, :3].values.min(axis=0), data.iloc[:, :3].values.max(axis=0))
+        data = data[np.isin(data.iloc[:, -1].values.astype(int), surviving_ids)]
+        header = [f"element vertex {len(data)}\n" if line.startswith("element vertex") else line for line in header]
+
+        output_ply_path = os.path.join(args.output_dir, group.file_name('voxel'))
+        write_ply(output_ply_path, header, normalize_and_voxelize(data, args.voxel_resolution, bounds))
+    full_time = time.time() - start
+    print(f"Level 2 ({args.voxel_resolution}^3): {len(surviving_ids)} points per group voxelized in {full_time:.2f}s")
+    print(f"Full-resolution inference volume: {len(surviving_ids)} of {len(ids)} points "
+          f"({100.0 * len(surviving_ids) / max(len(ids), 1):.1f}%)")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,10 @@
 import re
 import os
 import argparse
+import numpy as np
 from collections import defaultdict
+from attribute_schema import AttributeSchema
+from occupancy_filter import pack_cells
 
 # Function to read the PLY file and separate the header and data parts
 def read_ply(file_path):
@@ -65,11 +68,42 @@ def detect_and_remove_duplicates(ply_file, output_txt, output_ply):
     print(f"Deduplicated PLY file saved as {output_ply}")
     print(f"Duplicate point statistics saved to: {output_txt}")
 
+# Function to remove duplicate voxels from a stream of records
+def dedup_chunks(chunks):
+    """
+    Streaming version of detect_and_remove_duplicates: keep the first record of every voxel.
+
+    Only the packed keys of the voxels seen so far are kept in memory, so the output (in the
+    order of first occurrence) is the same as the file-based deduplication.
+
+    :param chunks: Iterable of structured records whose first three fields are voxel coordinates
+    :return: Generator of the records of the voxels not seen in earlier records
+    """
+    # Sorted runs of the keys already written, merged like a binary counter (each run at least
+    # twice the next), so every key is merged O(log N) times and looked up in O(log N) runs
+    runs = []
+    for records in chunks:
+        keys = pack_cells(np.stack([records[name] for name in records.dtype.names[:3]], axis=1))
+        _, first = np.unique(keys, return_index=True)
+        first = np.sort(first)
+        new = np.ones(len(first), dtype=bool)
+        for run in runs:
+            positions = np.minimum(np.searchsorted(run, keys[first]), len(run) - 1)
+            new &= run[positions] != keys[first]
+        new = first[new]
+        run = np.sort(keys[new])
+        while runs and len(runs[-1]) <= 2 * len(run):
+            run = np.sort(np.concatenate((runs.pop(), run)))
+        if len(run):
+            runs.append(run)
+        yield records[new]
+
 # Set up command line arguments
 def parse_args():
     parser = argparse.ArgumentParser(description="Remove duplicate points from a PLY file after voxelization.")
     parser.add_argument('--input_dir', type=str, required=True, help="Input directory path containing the PLY files")
     parser.add_argument('--output_dir', type=str, required=True, help="Output directory path to save the deduplicated PLY files")
+    parser.add_argument('--schema', type=str, default=None, help="Attribute schema file (default: schema.json in the input directory)")
     return parser.parse_args()
 
 # Main function
@@ -77,37 +111,16 @@ def main():
     # Get command line arguments
     args = parse_args()
 
-    # List of file suffixes to be appended to the common input directory
-    input_files = [
-        'xyz_ascii_voxel.ply',
-        'fdc012_ascii_voxel.ply',
-        'fre012_ascii_voxel.ply',
-        'fre345_ascii_voxel.ply',
-        'fre678_ascii_voxel.ply',
-        'fre91011_ascii_voxel.ply',
-        'fre121314_ascii_voxel.ply',
-        'fre151617_ascii_voxel.ply',
-        'fre181920_ascii_voxel.ply',
-        'fre212223_ascii_voxel.ply',
-        'fre242526_ascii_voxel.ply',
-        'fre272829_ascii_voxel.ply',
-        'fre303132_ascii_voxel.ply',
-        'fre333435_ascii_voxel.ply',
-        'fre363738_ascii_voxel.ply',
-        'fre394041_ascii_voxel.ply',
-        'fre424344_ascii_voxel.ply',
-        'fre4344op_ascii_voxel.ply',
-        'scale012_ascii_voxel.ply',
-        'rot012_ascii_voxel.ply',
-        'rot123_ascii_voxel.ply'
-    ]
+    # Attribute groups written by attributes_spilt.py
+    schema = AttributeSchema.locate(args.input_dir, args.schema)
+    os.makedirs(args.output_dir, exist_ok=True)
+    schema.save(args.output_dir)
 
     # Process the files
-    for file_suffix in input_files:
-        input_ply = os.path.join(args.input_dir, file_suffix)
-        file_name = file_suffix.replace('.ply', '')
-        output_txt_path = os.path.join(args.output_dir, f"{file_name}_rp.txt")
-        output_ply_path = os.path.join(args.output_dir, f"{file_name}_norp.ply")
+    for group in schema.groups:
+        input_ply = os.path.join(args.input_dir, group.file_name('voxel'))
+        output_ply_path = os.path.join(args.output_dir, group.file_name('dedup'))
+        output_txt_path = output_ply_path.replace('_norp.ply', '_rp.txt')
 
         detect_and_remove_duplicates(input_ply, output_txt_path, output_ply_path)
 
@@ -1,4 +1,3 @@
-"The script is not perfect. Remember to manually remove the rot12 and fre4344 of the header in the output file."
 import os
 import argparse
 
@@ -11,8 +10,14 @@ def delete_columns(file_path, output_path):
     # Find the line where the header ends
     header_end_index = lines.index('end_header\n') + 1
 
-    # Process the data part
-    processed_lines = lines[:header_end_index]  # Keep the header unchanged
+    # Process the header: drop the declarations of the two removed columns
+    processed_lines = []
+    removed_properties = 0
+    for line in lines[:header_end_index]:
+        if line.startswith("property") and removed_properties < 2:
+            removed_properties += 1
+            continue
+        processed_lines.append(line)
 
     # Iterate over the vertex data and remove the first two columns
     for line in lines[header_end_index:]:
@@ -0,0 +1,121 @@
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from scipy import fft
+from attribute_prefilter import read_vertices, sigmoid, write_kept
+from voxelization import normalize_and_voxelize
+
+# Function to build a normalized 1D Gaussian kernel
+def gaussian_kernel(sigma):
+    """Gaussian kernel of standard deviation sigma (in cells), truncated at 3 sigma and summing to 1."""
+    radius = max(int(np.ceil(3 * sigma)), 1)
+    offsets = np.arange(-radius, radius + 1)
+    kernel = np.exp(-0.5 * (offsets / sigma) ** 2)
+    return (kernel / kernel.sum()).astype(np.float32)
+
+# Function to convolve one axis of a grid with a 1D kernel through the FFT
+def convolve_axis(grid, kernel, axis, workers):
+    """
+    'Same'-size linear convolution of a grid with a symmetric 1D kernel along one axis.
+
+    The axis is zero-padded to the full convolution length, so nothing wraps around.
+    """
+    size = grid.shape[axis]
+    length = fft.next_fast_len(size + len(kernel) - 1, real=True)
+    spectrum = fft.rfft(grid, n=length, axis=axis, workers=workers)
+    shape = [1] * grid.ndim
+    shape[axis] = -1
+    spectrum *= fft.rfft(kernel, n=length).reshape(shape)
+    full = fft.irfft(spectrum, n=length, axis=axis, workers=workers)
+    radius = len(kernel) // 2
+    return np.take(full, np.arange(radius, radius + size), axis=axis).astype(np.float32)
+
+# Function to compute the smoothed density at every point, slab by slab
+def point_densities(cells, weights, resolution, sigma, slab=64, workers=4):
+    """
+    Splat the weights into a density grid, smooth it with a separable Gaussian and sample it at the points.
+
+    The grid is processed in slabs along x, each with a halo of the kernel radius, so only
+    (slab + 2 x radius) x (resolution + 1)^2 cells are held at a time.
+
+    :param cells: (N, 3) integer grid cells in [0, resolution] (voxelization.py coordinates)
+    :param weights: (N,) splatted weight of every point (e.g. its opacity)
+    :param resolution: Resolution of the density grid
+    :param sigma: Standard deviation of the Gaussian kernel in cells
+    :param slab: Number of x cells per slab
+    :param workers: Number of FFT threads
+    :return: (N,) density at the cell of every point
+    """
+    kernel = gaussian_kernel(sigma)
+    radius = len(kernel) // 2
+    side = resolution + 1
+    order = np.argsort(cells[:, 0], kind='stable')
+    sorted_x = cells[order, 0]
+    densities = np.empty(len(cells), dtype=np.float32)
+
+    for x0 in range(0, side, slab):
+        x1 = min(x0 + slab, side)
+        lo, hi = x0 - radius, x1 + radius
+        splat = order[np.searchsorted(sorted_x, lo):np.searchsorted(sorted_x, hi)]
+        targets = order[np.searchsorted(sorted_x, x0):np.searchsorted(sorted_x, x1)]
+        if len(targets) == 0:
+            continue
+
+        # Splat the points of the slab and its halo into a dense block
+        flat = ((cells[splat, 0] - lo) * side + cells[splat, 1]) * side + cells[splat, 2]
+        block = np.bincount(flat, weights=weights[splat], minlength=(hi - lo) * side * side)
+        block = block.astype(np.float32).reshape(hi - lo, side, side)
+        for axis in range(3):
+            block = convolve_axis(block, kernel, axis, workers)
+
+        densities[targets] = block[cells[targets, 0] - lo, cells[targets, 1], cells[targets, 2]]
+    return densities
+
+# Set up command line arguments
+def parse_args():
+    parser = argparse.ArgumentParser(description="Remove Gaussians in low-density regions of a smoothed opacity field.")
+    parser.add_argument('--input', type=str, required=True, help="Input PLY file (binary 3DGS point cloud or the output of binary_to_ascii.py)")
+    parser.add_argument('--output', type=str, default=None, help="Output PLY file without the removed points, in the same format as the input")
+    parser.add_argument('--removed_ids', type=str, default=None, help="Text file to save the removed IDs (0-based row numbers of the input)")
+    parser.add_argument('--densities', type=str, default=None, help="Path to save the per-point densities (.npy, indexed by row/ID)")
+    parser.add_argument('--grid_resolution', type=int, default=512, help="Resolution of the density grid, normalized as in voxelization.py (default is 512)")
+    parser.add_argument('--sigma', type=float, default=1.5, help="Standard deviation of the Gaussian kernel in grid cells (default is 1.5)")
+    parser.add_argument('--percentile', type=float, default=2.0, help="Remove the points whose density is below this percentile (default is 2)")
+    parser.add_argument('--slab', type=int, default=64, help="Grid cells along x per block; bounds the memory (default is 64)")
+    parser.add_argument('--workers', type=int, default=4, help="Number of FFT threads (default is 4)")
+    return parser.parse_args()
+
+# Main function
+def main():
+    args = parse_args()
+
+    header, file_format, vertices = read_vertices(args.input)
+    total = len(vertices['x'])
+    # Same normalization and ID bookkeeping as voxelization.py, at the density grid resolution
+    data = pd.DataFrame({'x': vertices['x'], 'y': vertices['y'], 'z': vertices['z'], 'ID': np.arange(total)})
+    voxelized = normalize_and_voxelize(data, args.grid_resolution)
+    cells = voxelized[:, :3].astype(np.int64)
+    ids = voxelized[:, -1].astype(np.int64)
+    opacities = sigmoid(np.asarray(vertices['opacity'], dtype=np.float64))[ids]
+
+    start = time.time()
+    densities = np.empty(total, dtype=np.float32)
+    densities[ids] = point_densities(cells, opacities, args.grid_resolution, args.sigma, args.slab, args.workers)
+    cutoff = np.percentile(densities, args.percentile)
+    removed = densities < cutoff
+    print(f"Density field of {total} points ({args.grid_resolution}^3 grid) computed in {time.time() - start:.2f}s")
+    print(f"Removed {int(removed.sum())} of {total} points below the {args.percentile} percentile (density {cutoff:.4g})")
+
+    if args.densities:
+        np.save(args.densities, densities)
+        print(f"Densities saved to: {args.densities}")
+    if args.output:
+        write_kept(args.input, args.output, header, file_format, vertices, ~removed)
+        print(f"Filtered point cloud saved to: {args.output}")
+    if args.removed_ids:
+        np.savetxt(args.removed_ids, np.flatnonzero(removed), fmt='%d')
+        print(f"Removed IDs saved to: {args.removed_ids}")
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ import os
 import numpy as np
 import pandas as pd
 import argparse
+from attribute_schema import AttributeSchema
 
 # Function to get the min and max coordinates from the point cloud file
 def get_min_max_coordinates(file_path):
@@ -47,7 +48,32 @@ def devoxelize(data, voxel_resolution, original_min, original_max):
 
     # Concatenate the restored coordinates, attributes, and IDs
     restored_data = np.hstack((original_coords, attributes, ids.reshape(-1, 1)))
-    return restored_data
+
+    # Write the points in ID order (a no-op unless morton_sort.py reordered them), as fusion --streaming expects
+    return restored_data[np.argsort(ids, kind='stable')]
+
+# Function to devoxelize a stream of records
+def devoxelize_chunks(chunks, voxel_resolution, bounds):
+    """
+    Streaming version of devoxelize; the records keep their order.
+
+    :param chunks: Iterable of structured records whose first three fields are voxel coordinates
+    :param voxel_resolution: Resolution of the voxel grid used by voxelization.py
+    :param bounds: (xyz_min, xyz_max) of the original (split) records, from voxelization.chunk_bounds
+    :return: Generator of records with the first three fields as float32 coordinates
+    """
+    original_min, original_max = bounds
+    for records in chunks:
+        names = records.dtype.names
+        dtype = np.dtype([(name, '<f4' if i < 3 else records.dtype.fields[name][0]) for i, name in enumerate(names)])
+        restored = np.empty(len(records), dtype=dtype)
+        for i, name in enumerate(names):
+            if i < 3:
+                normalized = records[name].astype(np.float64) / voxel_resolution
+                restored[name] = normalized * (original_max[i] - original_min[i]) + original_min[i]
+            else:
+                restored[name] = records[name]
+        yield restored
 
 # Function to save the devoxelized data back to a PLY file
 def write_devoxelized_ply(output_path, header, restored_data):
@@ -86,6 +112,8 @@ def parse_args():
     parser.add_argument('--input_dir', type=str, required=True, help="Input directory path containing the original point cloud files")
     parser.add_argument('--voxelized_dir', type=str, required=True, help="Input directory path containing the voxelized point cloud files")
     parser.add_argument('--output_dir', type=str, required=True, help="Output directory path to save the devoxelized point cloud files")
+    parser.add_argument('--voxel_resolution', type=int, default=7168, help="Resolution of the voxel grid used by voxelization.py")
+    parser.add_argument('--schema', type=str, default=None, help="Attribute schema file (default: schema.json in the input directory)")
     return parser.parse_args()
 
 # Main function
@@ -98,23 +126,19 @@ def main():
     voxelized_prefix = args.voxelized_dir
     output_prefix = args.output_dir
 
-    # List of file suffixes for original, voxelized, and output files
-    file_suffixes = [
-        'xyz_ascii.ply', 'fdc012_ascii.ply', 'fre012_ascii.ply', 'fre345_ascii.ply', 'fre678_ascii.ply',
-        'fre91011_ascii.ply', 'fre121314_ascii.ply', 'fre151617_ascii.ply', 'fre181920_ascii.ply', 'fre212223_ascii.ply',
-        'fre242526_ascii.ply', 'fre272829_ascii.ply', 'fre303132_ascii.ply', 'fre333435_ascii.ply', 'fre363738_ascii.ply',
-        'fre394041_ascii.ply', 'fre424344_ascii.ply', 'fre4344op_ascii.ply', 'rot012_ascii.ply', 'rot123_ascii.ply',
-        'scale012_ascii.ply'
-    ]
+    # Attribute groups written by attributes_spilt.py
+    schema = AttributeSchema.locate(input_prefix, args.schema)
+    os.makedirs(output_prefix, exist_ok=True)
+    schema.save(output_prefix)
 
     # Voxel grid resolution
-    voxel_resolution = 7168
+    voxel_resolution = args.voxel_resolution
 
     # Process each file pair
-    for file_suffix in file_suffixes:
-        original_ply_path = os.path.join(input_prefix, file_suffix)
-        voxelized_ply_path = os.path.join(voxelized_prefix, file_suffix.replace('.ply', '_voxel_re.ply'))
-        output_ply_path = os.path.join(output_prefix, file_suffix.replace('.ply', '_voxeltopc.ply'))
+    for group in schema.groups:
+        original_ply_path = os.path.join(input_prefix, group.file_name('split'))
+        voxelized_ply_path = os.path.join(voxelized_prefix, group.file_name('reconstructed'))
+        output_ply_path = os.path.join(output_prefix, group.file_name('devoxel'))
 
         process_files(original_ply_path, voxelized_ply_path, output_ply_path, voxel_resolution)
 
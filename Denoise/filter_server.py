@@ -0,0 +1,307 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+import threading
+import collections
+import numpy as np
+from socketserver import ThreadingMixIn, UnixStreamServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from attribute_schema import AttributeSchema
+from binary_ply import read_ply_header, iter_vertex_chunks, write_chunks
+from attributes_spilt import split_chunks, group_streams
+from voxelization import split_bounds, voxelize_chunks
+from delete_repeat_voxel import dedup_chunks
+from devoxelization import devoxelize_chunks
+from fusion import fuse_chunks
+from occupancy_filter import occupancy_scores
+
+# Default parameters of a filter request; each can be overridden in the query string or the JSON body
+DEFAULT_PARAMS = {'result': 'removed_ids', 'engine': None, 'voxel_resolution': 7168, 'sh_degree': None,
+                  'strides': '2,4,8', 'threshold': 0.1, 'rho': 1.0, 'output_path': None}
+
+# Number of recent requests the latency percentiles are computed over
+METRICS_WINDOW = 1000
+
+# Reconstruction engines kept loaded for the lifetime of the server
+class FilterEngines:
+    """
+    The reconstruction step of the pipeline with everything loaded once: the occupancy filter
+    (CPU) is always available, the model of repc5.py when a model path is given.
+    """
+
+    def __init__(self, model_path=None, index_cache=None):
+        self.model = None
+        self.index_cache = index_cache
+        if model_path:
+            import torch
+            from repc5 import load_model
+            self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+            self.model = load_model(model_path, self.device)
+
+    def names(self):
+        return ['model', 'occupancy'] if self.model is not None else ['occupancy']
+
+    def reconstruct(self, engine, coords, ids, params):
+        """
+        Reconstruct one deduplicated group.
+
+        :param coords: (N, 3) int32 voxel coordinates
+        :param ids: (N,) IDs
+        :return: Reconstructed coordinates and IDs (the kept points, or every point moved to its
+                 nearest reconstructed voxel for the model)
+        """
+        if engine == 'occupancy':
+            strides = tuple(int(value) for value in str(params['strides']).split(','))
+            kept = occupancy_scores(coords.astype(np.int64), strides) >= float(params['threshold'])
+            return coords[kept], ids[kept]
+        import torch
+        from repc5 import infer_group, match_reconstruction
+        loaded = (None, None, torch.from_numpy(coords.astype(np.float32)), ids)
+        reconstructed_coords = infer_group(self.model, self.device, loaded, float(params['rho']))[-1]
+        return match_reconstruction(reconstructed_coords, coords.astype(np.float32), self.index_cache), ids
+
+# Function to run the whole Denoise pipeline on one point cloud in memory
+def filter_cloud(input_path, engines, params):
+    """
+    Split, voxelize, deduplicate, reconstruct, devoxelize and fuse a point cloud without writing
+    the intermediate files, using the streaming functions of every stage.
+
+    :return: Total vertex count, sorted kept IDs and the fused records (3DGS layout)
+    """
+    engine = params['engine'] or engines.names()[0]
+    if engine not in engines.names():
+        raise ValueError(f"Engine '{engine}' is not loaded; available: {', '.join(engines.names())}")
+    resolution = int(params['voxel_resolution'])
+    sh_degree = None if params['sh_degree'] is None else int(params['sh_degree'])
+    schema = AttributeSchema.from_ply(input_path, sh_degree)
+
+    def split():
+        return split_chunks(iter_vertex_chunks(input_path), schema)
+
+    bounds = split_bounds(split())
+    devoxelized = {}
+    kept_ids = None
+    for name, stream in group_streams(split(), schema).items():
+        records = np.concatenate(list(dedup_chunks(voxelize_chunks(stream, resolution, bounds[name]))))
+        names = records.dtype.names
+        coords = np.stack([records[column] for column in names[:3]], axis=1)
+        coords, ids = engines.reconstruct(engine, coords, records['ID'].astype(np.int64), params)
+
+        # Back to group records in ID order, as devoxelization.py writes them for fusion
+        order = np.argsort(ids, kind='stable')
+        reconstructed = np.zeros(len(ids), dtype=[(column, '<f8') for column in names[:3]] + [('ID', '<i8')])
+        for i, column in enumerate(names[:3]):
+            reconstructed[column] = coords[order, i]
+        reconstructed['ID'] = ids[order]
+        devoxelized[name] = list(devoxelize_chunks([reconstructed], resolution, bounds[name]))
+        kept_ids = reconstructed['ID'] if kept_ids is None else np.intersect1d(kept_ids, reconstructed['ID'], assume_unique=True)
+    return read_ply_header(input_path)[2], kept_ids, fuse_chunks(devoxelized, schema)
+
+# Latency statistics of the served requests
+class LatencyMetrics:
+    """Counters and queue-wait / compute / total latency percentiles over the last METRICS_WINDOW requests."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = dict((kind, collections.deque(maxlen=METRICS_WINDOW)) for kind in ('wait', 'compute', 'total'))
+        self.counts = {'served': 0, 'failed': 0, 'rejected': 0, 'queued': 0, 'running': 0}
+
+    def add(self, counter, amount=1):
+        with self.lock:
+            self.counts[counter] += amount
+
+    def record(self, wait, compute):
+        with self.lock:
+            self.latencies['wait'].append(wait)
+            self.latencies['compute'].append(compute)
+            self.latencies['total'].append(wait + compute)
+
+    def snapshot(self):
+        with self.lock:
+            state = dict(self.counts)
+            for kind, values in self.latencies.items():
+                if values:
+                    values = np.array(values)
+                    state[kind] = {'mean': float(values.mean()), 'p50': float(np.percentile(values, 50)),
+                                   'p90': float(np.percentile(values, 90)), 'p99': float(np.percentile(values, 99))}
+        return state
+
+# HTTP handler of the filter server
+class FilterRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET /health, GET /metrics, and POST /filter with either a JSON body {"path": ..., parameters}
+    or the raw bytes of a PLY file (parameters in the query string).
+    """
+
+    def send_json(self, status, state):
+        body = json.dumps(state).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        print(f"{self.address_string()} {format % args}")
+
+    def do_GET(self):
+        route = urlparse(self.path).path
+        if route == '/health':
+            self.send_json(200, {'status': 'ok', 'engines': self.server.engines.names()})
+        elif route == '/metrics':
+            self.send_json(200, self.server.metrics.snapshot())
+        else:
+            self.send_json(404, {'error': f"Unknown path {route}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/filter':
+            self.send_json(404, {'error': f"Unknown path {url.path}"})
+            return
+        params = dict(DEFAULT_PARAMS)
+        params.update((key, values[-1]) for key, values in parse_qs(url.query).items())
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        upload = None
+        try:
+            if self.headers.get('Content-Type', '').startswith('application/json'):
+                try:
+                    params.update(json.loads(body))
+                    input_path = params['path']
+                except (ValueError, KeyError):
+                    self.send_json(400, {'error': "The JSON body needs a 'path' of a PLY file"})
+                    return
+            else:
+                # An uploaded buffer is parsed from a temporary file like any other input
+                upload = tempfile.NamedTemporaryFile(suffix='.ply', delete=False)
+                upload.write(body)
+                upload.close()
+                input_path = upload.name
+            status, state, payload = self.server.run_filter(input_path, params)
+        finally:
+            if upload is not None:
+                os.remove(upload.name)
+
+        if payload is None:
+            self.send_json(status, state)
+            return
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(payload)))
+        self.send_header('X-Filter-Timing', json.dumps(state))
+        self.end_headers()
+        self.wfile.write(payload)
+
+# Request queue and warm engines shared by the TCP and Unix socket servers
+class FilterServerMixin:
+    """Admission control: at most max_concurrent requests compute, at most max_queue wait for a slot."""
+
+    daemon_threads = True
+
+    def setup_filter(self, engines, max_concurrent, max_queue):
+        self.engines = engines
+        self.metrics = LatencyMetrics()
+        self.slots = threading.Semaphore(max_concurrent)
+        self.max_queue = max_queue
+
+    def run_filter(self, input_path, params):
+        """
+        Wait for a compute slot, run the pipeline and build the response.
+
+        :return: HTTP status, JSON state, and the PLY bytes of the cloud (or None)
+        """
+        with self.metrics.lock:
+            if self.metrics.counts['queued'] >= self.max_queue:
+                self.metrics.counts['rejected'] += 1
+                return 503, {'error': f"Queue is full ({self.max_queue} requests waiting)"}, None
+            self.metrics.counts['queued'] += 1
+
+        arrival = time.time()
+        with self.slots:
+            self.metrics.add('queued', -1)
+            self.metrics.add('running')
+            start = time.time()
+            try:
+                total, kept_ids, records = filter_cloud(input_path, self.engines, params)
+                output_path = params['output_path']
+                payload = None
+                if params['result'] == 'cloud':
+                    if output_path:
+                        write_chunks(output_path, records)
+                    else:
+                        with tempfile.TemporaryDirectory() as directory:
+                            write_chunks(os.path.join(directory, 'filtered.ply'), records)
+                            with open(os.path.join(directory, 'filtered.ply'), 'rb') as f:
+                                payload = f.read()
+            except Exception as error:
+                self.metrics.add('failed')
+                return 400, {'error': f"{type(error).__name__}: {error}"}, None
+            finally:
+                self.metrics.add('running', -1)
+            compute = time.time() - start
+
+        self.metrics.add('served')
+        self.metrics.record(start - arrival, compute)
+        state = {'vertex_count': total, 'kept': len(kept_ids), 'removed': total - len(kept_ids),
+                 'wait_seconds': round(start - arrival, 4), 'compute_seconds': round(compute, 4)}
+        if params['result'] == 'removed_ids':
+            removed = np.ones(total, dtype=bool)
+            removed[kept_ids] = False
+            state['removed_ids'] = np.flatnonzero(removed).tolist()
+        elif output_path:
+            state['output_path'] = output_path
+        return 200, state, payload
+
+class FilterHTTPServer(FilterServerMixin, ThreadingHTTPServer):
+    pass
+
+class FilterUnixServer(FilterServerMixin, ThreadingMixIn, UnixStreamServer):
+    pass
+
+# Set up command line arguments
+def parse_args():
+    parser = argparse.ArgumentParser(description="Long-lived Denoise filter server that keeps the model loaded between requests.")
+    parser.add_argument('--model_path', type=str, default=None, help="Trained model file to keep loaded (default: occupancy engine only)")
+    parser.add_argument('--host', type=str, default='127.0.0.1', help="Address to listen on (default is 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8765, help="Port to listen on (default is 8765)")
+    parser.add_argument('--socket', type=str, default=None, help="Listen on this Unix socket path instead of TCP")
+    parser.add_argument('--max_concurrent', type=int, default=1, help="Requests computed at a time (default is 1)")
+    parser.add_argument('--max_queue', type=int, default=16, help="Requests that may wait for a slot; more are rejected with 503 (default is 16)")
+    parser.add_argument('--index_cache', type=str, default=None, help="Directory of cached spatial indexes of the model engine")
+    return parser.parse_args()
+
+# Main function
+def main():
+    args = parse_args()
+
+    start = time.time()
+    engines = FilterEngines(args.model_path, args.index_cache)
+    print(f"Engines {', '.join(engines.names())} loaded in {time.time() - start:.2f}s")
+
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = FilterUnixServer(args.socket, FilterRequestHandler)
+        address = args.socket
+    else:
+        server = FilterHTTPServer((args.host, args.port), FilterRequestHandler)
+        address = f"http://{args.host}:{args.port}"
+    server.setup_filter(engines, args.max_concurrent, args.max_queue)
+    print(f"Listening on {address} ({args.max_concurrent} concurrent, {args.max_queue} queued)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+if __name__ == "__main__":
+    main()
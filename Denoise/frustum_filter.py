@@ -0,0 +1,195 @@
+import os
+import time
+import struct
+import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from attribute_prefilter import read_vertices, write_kept
+
+# Number of intrinsic parameters of each COLMAP camera model, by model id
+CAMERA_MODEL_PARAMS = {
+    0: 3,   # SIMPLE_PINHOLE: f, cx, cy
+    1: 4,   # PINHOLE: fx, fy, cx, cy
+    2: 4,   # SIMPLE_RADIAL: f, cx, cy, k
+    3: 5,   # RADIAL: f, cx, cy, k1, k2
+    4: 8,   # OPENCV: fx, fy, cx, cy, k1, k2, p1, p2
+    5: 8,   # OPENCV_FISHEYE: fx, fy, cx, cy, k1, k2, k3, k4
+    6: 12,  # FULL_OPENCV
+    7: 5,   # FOV: fx, fy, cx, cy, omega
+    8: 4,   # SIMPLE_RADIAL_FISHEYE: f, cx, cy, k
+    9: 5,   # RADIAL_FISHEYE: f, cx, cy, k1, k2
+    10: 12  # THIN_PRISM_FISHEYE
+}
+
+# Camera models whose first parameter is a single focal length
+SINGLE_FOCAL_MODELS = {0, 2, 3, 8, 9}
+
+# Approximate bytes of temporaries per (point, camera) pair in one projection block
+BYTES_PER_PROJECTION = 24
+
+# Function to read COLMAP's cameras.bin
+def read_cameras_binary(path):
+    """
+    Read the cameras of a COLMAP sparse model.
+
+    :param path: Path to cameras.bin
+    :return: Dict of camera id to (width, height, fx, fy, cx, cy); lens distortion is ignored
+    """
+    cameras = {}
+    with open(path, 'rb') as f:
+        num_cameras = struct.unpack('<Q', f.read(8))[0]
+        for _ in range(num_cameras):
+            camera_id, model_id, width, height = struct.unpack('<iiQQ', f.read(24))
+            if model_id not in CAMERA_MODEL_PARAMS:
+                raise ValueError(f"Unknown COLMAP camera model id {model_id} in {path}")
+            params = struct.unpack(f'<{CAMERA_MODEL_PARAMS[model_id]}d', f.read(8 * CAMERA_MODEL_PARAMS[model_id]))
+            if model_id in SINGLE_FOCAL_MODELS:
+                fx = fy = params[0]
+                cx, cy = params[1], params[2]
+            else:
+                fx, fy, cx, cy = params[:4]
+            cameras[camera_id] = (width, height, fx, fy, cx, cy)
+    return cameras
+
+# Function to read COLMAP's images.bin
+def read_images_binary(path):
+    """
+    Read the registered images of a COLMAP sparse model.
+
+    :param path: Path to images.bin
+    :return: List of (name, camera id, qvec (w, x, y, z), tvec) world-to-camera poses
+    """
+    images = []
+    with open(path, 'rb') as f:
+        num_images = struct.unpack('<Q', f.read(8))[0]
+        for _ in range(num_images):
+            properties = struct.unpack('<idddddddi', f.read(64))
+            name = b''
+            while True:
+                char = f.read(1)
+                if char in (b'\x00', b''):
+                    break
+                name += char
+            num_points2d = struct.unpack('<Q', f.read(8))[0]
+            f.seek(24 * num_points2d, os.SEEK_CUR)  # Skip the 2D observations (x, y, point3D id)
+            images.append((name.decode('utf-8'), properties[8], np.array(properties[1:5]), np.array(properties[5:8])))
+    return images
+
+# Function to convert a COLMAP quaternion to a rotation matrix
+def qvec_to_rotmat(qvec):
+    """Rotation matrix of a unit quaternion (w, x, y, z)."""
+    w, x, y, z = qvec
+    return np.array([
+        [1 - 2 * y * y - 2 * z * z, 2 * x * y - 2 * w * z, 2 * z * x + 2 * w * y],
+        [2 * x * y + 2 * w * z, 1 - 2 * x * x - 2 * z * z, 2 * y * z - 2 * w * x],
+        [2 * z * x - 2 * w * y, 2 * y * z + 2 * w * x, 1 - 2 * x * x - 2 * y * y]
+    ])
+
+# Function to stack the poses and intrinsics of all training views
+def load_views(sparse_dir):
+    """
+    Load every registered view of a COLMAP sparse model as stacked arrays.
+
+    :param sparse_dir: Directory holding cameras.bin and images.bin (e.g. data/sparse/0)
+    :return: (C, 3, 3) rotations, (C, 3) translations and (C, 6) width, height, fx, fy, cx, cy
+    """
+    cameras = read_cameras_binary(os.path.join(sparse_dir, 'cameras.bin'))
+    images = read_images_binary(os.path.join(sparse_dir, 'images.bin'))
+    rotations = np.stack([qvec_to_rotmat(qvec) for _, _, qvec, _ in images])
+    translations = np.stack([tvec for _, _, _, tvec in images])
+    intrinsics = np.array([cameras[camera_id] for _, camera_id, _, _ in images], dtype=np.float64)
+    return rotations, translations, intrinsics
+
+# Function to count in how many training views each point is visible
+def visibility_counts(xyz, rotations, translations, intrinsics, near=0.01, margin=0.0, memory_mb=16, workers=4):
+    """
+    Project every point into every view and count the views that see it.
+
+    A point is visible in a view when it lies in front of the camera (depth > near) and projects
+    inside the image, extended by margin pixels. All views are projected at once with one
+    matrix product per block of points, and the blocks are spread over worker threads.
+
+    :param xyz: (N, 3) point positions in the COLMAP world frame
+    :param rotations: (C, 3, 3) world-to-camera rotations
+    :param translations: (C, 3) world-to-camera translations
+    :param intrinsics: (C, 6) width, height, fx, fy, cx, cy
+    :param near: Minimum depth in front of the camera
+    :param margin: Extra pixels accepted around the image border
+    :param memory_mb: Approximate budget for the temporaries of one block
+    :param workers: Number of threads
+    :return: (N,) int32 visibility counts
+    """
+    num_views = len(rotations)
+    width, height, fx, fy, cx, cy = intrinsics.T
+    # Fold the intrinsics into the poses: columns [u*z | v*z | z] of every view come out of one
+    # matrix product, and the image bounds are tested as lo*z <= u*z < hi*z without a division
+    rows = np.concatenate([fx[:, None] * rotations[:, 0] + cx[:, None] * rotations[:, 2],
+                           fy[:, None] * rotations[:, 1] + cy[:, None] * rotations[:, 2],
+                           rotations[:, 2]], axis=0)
+    projection = rows.T.astype(np.float32)
+    offsets = np.concatenate([fx * translations[:, 0] + cx * translations[:, 2],
+                              fy * translations[:, 1] + cy * translations[:, 2],
+                              translations[:, 2]]).astype(np.float32)
+    u_low, v_low = np.float32(-margin), np.float32(-margin)
+    u_high, v_high = (width + margin).astype(np.float32), (height + margin).astype(np.float32)
+    block = max(int(memory_mb * 2 ** 20 / (BYTES_PER_PROJECTION * max(num_views, 1))), 1)
+
+    def count_block(start):
+        points = np.asarray(xyz[start:start + block], dtype=np.float32)
+        homogeneous = points @ projection + offsets
+        uz, vz, z = homogeneous[:, :num_views], homogeneous[:, num_views:2 * num_views], homogeneous[:, 2 * num_views:]
+        visible = z > near
+        visible &= uz >= u_low * z
+        visible &= uz < u_high * z
+        visible &= vz >= v_low * z
+        visible &= vz < v_high * z
+        return np.count_nonzero(visible, axis=1)
+
+    counts = np.empty(len(xyz), dtype=np.int32)
+    starts = range(0, len(xyz), block)
+    # NumPy releases the GIL in the matrix product and the comparisons, so blocks run in parallel threads
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start, block_counts in zip(starts, executor.map(count_block, starts)):
+            counts[start:start + len(block_counts)] = block_counts
+    return counts
+
+# Set up command line arguments
+def parse_args():
+    parser = argparse.ArgumentParser(description="Remove Gaussians that no training camera sees, using the local COLMAP reconstruction.")
+    parser.add_argument('--input', type=str, required=True, help="Input PLY file (binary 3DGS point cloud or the output of binary_to_ascii.py)")
+    parser.add_argument('--sparse_dir', type=str, required=True, help="COLMAP sparse model directory with cameras.bin and images.bin (e.g. data/sparse/0)")
+    parser.add_argument('--counts', type=str, required=True, help="Path to save the per-point visibility counts (.npy, indexed by row/ID)")
+    parser.add_argument('--output', type=str, default=None, help="Output PLY file without the removed points, in the same format as the input")
+    parser.add_argument('--removed_ids', type=str, default=None, help="Text file to save the removed IDs (0-based row numbers of the input)")
+    parser.add_argument('--min_views', type=int, default=1, help="Minimum number of views a point must be visible in (default is 1)")
+    parser.add_argument('--near', type=float, default=0.01, help="Minimum depth in front of a camera (default is 0.01)")
+    parser.add_argument('--margin', type=float, default=0.0, help="Extra pixels accepted around the image border (default is 0)")
+    parser.add_argument('--memory_mb', type=float, default=16, help="Approximate memory budget of one projection block in MB; small blocks stay in cache (default is 16)")
+    parser.add_argument('--workers', type=int, default=4, help="Number of threads projecting blocks in parallel (default is 4)")
+    return parser.parse_args()
+
+# Main function
+def main():
+    args = parse_args()
+
+    rotations, translations, intrinsics = load_views(args.sparse_dir)
+    header, file_format, vertices = read_vertices(args.input)
+    xyz = np.stack([np.asarray(vertices[name]) for name in ('x', 'y', 'z')], axis=1)
+
+    start = time.time()
+    counts = visibility_counts(xyz, rotations, translations, intrinsics, args.near, args.margin, args.memory_mb, args.workers)
+    removed = counts < args.min_views
+    print(f"Projected {len(xyz)} points into {len(rotations)} views in {time.time() - start:.2f}s")
+    print(f"{int(removed.sum())} of {len(xyz)} points are visible in fewer than {args.min_views} views")
+
+    np.save(args.counts, counts)
+    print(f"Visibility counts saved to: {args.counts}")
+    if args.output:
+        write_kept(args.input, args.output, header, file_format, vertices, ~removed)
+        print(f"Filtered point cloud saved to: {args.output}")
+    if args.removed_ids:
+        np.savetxt(args.removed_ids, np.flatnonzero(removed), fmt='%d')
+        print(f"Removed IDs saved to: {args.removed_ids}")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,15 @@
 import os
+import numpy as np
 import pandas as pd
 from functools import reduce
 import argparse
+from binary_ply import BinaryPlyWriter
+from attribute_schema import AttributeSchema, NORMAL_COLUMNS
+from spatial_index import morton_order
+from morton_sort import sort_binary_ply
+
+# Order of the attribute families in a 3DGS point cloud
+LAYOUT_ORDER = ['x', 'y', 'z', 'nx', 'ny', 'nz', 'f_dc_', 'f_rest_', 'opacity', 'scale_', 'rot_']
 
 # Function to read PLY file and separate header and data
 def read_ply(file_path):
@@ -26,11 +34,166 @@ def write_ply(file_path, header, data):
         for row in data.itertuples(index=False):
             f.write(' '.join(map(str, row)) + '\n')
 
+# Function to sort column names into the 3DGS vertex layout
+def gaussian_layout(columns):
+    """
+    Order merged columns as x y z nx ny nz f_dc_* f_rest_* opacity scale_* rot_*.
+
+    :param columns: Merged attribute column names (without ID and normals)
+    :return: Column names of the output vertex, including the synthesized normals
+    """
+    def sort_key(col):
+        for rank, family in enumerate(LAYOUT_ORDER):
+            if col == family:
+                return rank, 0
+            if family.endswith('_') and col.startswith(family) and col[len(family):].isdigit():
+                return rank, int(col[len(family):])
+        return len(LAYOUT_ORDER), 0  # Unknown columns keep their relative order at the end
+
+    columns = [col for col in columns if col not in NORMAL_COLUMNS]
+    return sorted(columns + NORMAL_COLUMNS, key=sort_key)
+
+# Function to find where the vertex data of an ASCII PLY file starts
+def find_data_start(file_path):
+    """Return the number of header lines (including end_header) of an ASCII PLY file."""
+    with open(file_path, 'r') as f:
+        for i, line in enumerate(f):
+            if line.strip() == "end_header":
+                return i + 1
+    raise ValueError(f"No end_header found in {file_path}")
+
+# Function to iterate over an ID-sorted group file in chunks
+def iter_group_chunks(file_path, chunk_size):
+    """
+    Read a group PLY file in chunks of rows.
+
+    :param file_path: Path to the ASCII group file (attribute columns followed by the ID column)
+    :param chunk_size: Number of rows per chunk
+    :return: Generator of (ids, values) pairs, ids being int64 and values a float32 2D array
+    """
+    data_start = find_data_start(file_path)
+    last_id = None
+    for chunk in pd.read_csv(file_path, skiprows=data_start, sep=' ', header=None, chunksize=chunk_size):
+        values = chunk.values
+        ids = values[:, -1].astype(np.int64)
+        # The merge-join relies on every group file being sorted by ID
+        if np.any(np.diff(ids) <= 0) or (last_id is not None and len(ids) and ids[0] <= last_id):
+            raise ValueError(f"{file_path} is not sorted by ID; use the in-memory fusion instead of --streaming")
+        if len(ids):
+            last_id = ids[-1]
+        yield ids, values[:, :-1].astype(np.float32)
+
+# Function to merge-join ID-sorted streams of (ids, values) chunks
+def merge_id_streams(streams, columns_list, out_columns, keep=None):
+    """
+    K-way merge-join of ID-sorted chunk streams, keeping only IDs present in every stream.
+
+    Each stream keeps at most one chunk buffered, so memory is O(chunk size x groups).
+
+    :param streams: Iterators of (ids, values) pairs, ids ascending within and across chunks
+    :param columns_list: Column names of each stream (the last one is 'ID'); None marks a padding column
+    :param out_columns: Column names of the output records; columns no group provides stay zero
+    :param keep: Optional boolean mask indexed by ID; IDs where it is False are dropped
+    :return: Generator of structured float32 arrays in the output layout
+    """
+    out_dtype = np.dtype([(col, '<f4') for col in out_columns])
+    iterators = [iter(stream) for stream in streams]
+    buffers = [None] * len(iterators)
+
+    while True:
+        # Refill the groups whose buffered chunk has been fully consumed
+        for i, it in enumerate(iterators):
+            while buffers[i] is None or len(buffers[i][0]) == 0:
+                buffers[i] = next(it, None)
+                if buffers[i] is None:
+                    return  # Inner join: one exhausted group ends the merge
+
+        # Every ID up to the smallest buffered maximum is final in all groups
+        bound = min(ids[-1] for ids, _ in buffers)
+        heads = []
+        for i, (ids, values) in enumerate(buffers):
+            split = np.searchsorted(ids, bound, side='right')
+            heads.append((ids[:split], values[:split]))
+            buffers[i] = (ids[split:], values[split:])
+
+        common_ids = reduce(lambda left, right: np.intersect1d(left, right, assume_unique=True),
+                            [ids for ids, _ in heads])
+        if keep is not None:
+            common_ids = common_ids[keep[common_ids]]
+        merged = np.zeros(len(common_ids), dtype=out_dtype)
+        for (ids, values), columns in zip(heads, columns_list):
+            rows = np.searchsorted(ids, common_ids)
+            for j, col in enumerate(columns[:-1]):
+                if col is not None:
+                    merged[col] = values[rows, j]
+        yield merged
+
+# Function to merge-join ID-sorted group files chunk by chunk
+def stream_merge(file_paths, columns_list, out_columns, chunk_size, keep=None):
+    """Merge-join of ID-sorted group files (see merge_id_streams), reading chunk_size rows per file at a time."""
+    return merge_id_streams([iter_group_chunks(path, chunk_size) for path in file_paths],
+                            columns_list, out_columns, keep)
+
+# Function to turn structured group records into (ids, values) chunks
+def id_value_chunks(chunks):
+    """Generator of (int64 ids, float32 values) pairs from structured records whose last field is the ID."""
+    for records in chunks:
+        names = records.dtype.names
+        values = np.stack([records[name] for name in names[:-1]], axis=1).astype(np.float32)
+        yield records[names[-1]].astype(np.int64), values
+
+# Function to fuse streams of group records into 3DGS records
+def fuse_chunks(group_chunks, schema, keep=None):
+    """
+    Streaming version of the fusion: merge-join the records of every group by ID.
+
+    :param group_chunks: Dict of group name to an ID-sorted iterable of structured records
+                         (columns followed by the ID, e.g. from devoxelization.devoxelize_chunks)
+    :param schema: AttributeSchema of the groups
+    :param keep: Optional boolean mask indexed by ID; IDs where it is False are dropped
+    :return: Generator of structured float32 records in the 3DGS layout (zero normals)
+    """
+    columns_list = [[schema.output_name(col) for col in group.columns] + ['ID'] for group in schema.groups]
+    out_columns = gaussian_layout([col for columns in columns_list for col in columns[:-1] if col is not None])
+    streams = [id_value_chunks(group_chunks[group.name]) for group in schema.groups]
+    return merge_id_streams(streams, columns_list, out_columns, keep)
+
+# Function to fuse the group files into a binary PLY without loading them into memory
+def stream_fusion(file_paths, columns_list, output_path, chunk_size, keep=None):
+    """Fuse ID-sorted group files with a streaming merge-join and write 3DGS binary vertices incrementally."""
+    out_columns = gaussian_layout([col for columns in columns_list for col in columns[:-1] if col is not None])
+    with BinaryPlyWriter(output_path, [('float', col) for col in out_columns]) as writer:
+        for merged in stream_merge(file_paths, columns_list, out_columns, chunk_size, keep):
+            writer.write(merged)
+    return writer.count
+
+# Function to turn per-ID visibility counts into a keep mask
+def visibility_keep_mask(counts_path, min_views):
+    """Load the counts saved by frustum_filter.py and keep the IDs seen by at least min_views cameras."""
+    return np.load(counts_path) >= min_views
+
+# Function to write the merged data as a 3DGS binary PLY
+def write_gaussian_ply(output_path, merged_data):
+    """Write merged columns in the 3DGS binary layout; the normals are zero-filled in the record buffer."""
+    out_columns = gaussian_layout(list(merged_data.columns))
+    records = np.zeros(len(merged_data), dtype=[(col, '<f4') for col in out_columns])
+    for col in merged_data.columns:
+        records[col] = merged_data[col].values
+    with BinaryPlyWriter(output_path, [('float', col) for col in out_columns], len(records)) as writer:
+        writer.write(records)
+
 # Set up command line arguments
 def parse_args():
     parser = argparse.ArgumentParser(description="Merge point cloud files based on ID.")
     parser.add_argument('--input_dir', type=str, required=True, help="Input directory path containing the PLY files")
     parser.add_argument('--output_path', type=str, required=True, help="Output file path to save the merged point cloud")
+    parser.add_argument('--schema', type=str, default=None, help="Attribute schema file (default: schema.json in the input directory)")
+    parser.add_argument('--streaming', action='store_true', help="Merge the ID-sorted files chunk by chunk")
+    parser.add_argument('--ascii', action='store_true', help="Write the merged columns as ASCII without normals (legacy output for addnxyz.py)")
+    parser.add_argument('--chunk_size', type=int, default=1000000, help="Rows read from each file at a time in streaming mode")
+    parser.add_argument('--morton_order', action='store_true', help="Write the points in Morton (Z-order) order of x, y, z for better locality")
+    parser.add_argument('--visibility', type=str, default=None, help="Visibility counts from frustum_filter.py (computed on the point cloud that was split); drop IDs seen by too few views")
+    parser.add_argument('--min_views', type=int, default=1, help="Minimum number of views for --visibility (default is 1)")
     return parser.parse_args()
 
 # Main function
@@ -41,52 +204,54 @@ def main():
     # Common input directory prefix
     input_prefix = args.input_dir
 
-    # List of file suffixes for original PLY files
-    file_suffixes = [
-        'xyz_ascii_voxeltopc.ply', 'fdc012_ascii_voxeltopc.ply', 'fre012_ascii_voxeltopc.ply', 
-        'fre345_ascii_voxeltopc.ply', 'fre678_ascii_voxeltopc.ply', 'fre91011_ascii_voxeltopc.ply',
-        'fre121314_ascii_voxeltopc.ply', 'fre151617_ascii_voxeltopc.ply', 'fre181920_ascii_voxeltopc.ply',
-        'fre212223_ascii_voxeltopc.ply', 'fre242526_ascii_voxeltopc.ply', 'fre272829_ascii_voxeltopc.ply',
-        'fre303132_ascii_voxeltopc.ply', 'fre333435_ascii_voxeltopc.ply', 'fre363738_ascii_voxeltopc.ply',
-        'fre394041_ascii_voxeltopc.ply', 'fre424344_ascii_voxeltopc.ply', 'opacity_ascii_voxeltopc.ply',
-        'scale012_ascii_voxeltopc.ply', 'rot012_ascii_voxeltopc.ply', 'rot3_ascii_voxeltopc.ply'
-    ]
-    
-    # Columns for each file, corresponding to the files in `file_suffixes`
-    columns_list = [
-        ['x', 'y', 'z', 'ID'], ['f_dc_0', 'f_dc_1', 'f_dc_2', 'ID'], ['f_rest_0', 'f_rest_1', 'f_rest_2', 'ID'],
-        ['f_rest_3', 'f_rest_4', 'f_rest_5', 'ID'], ['f_rest_6', 'f_rest_7', 'f_rest_8', 'ID'], 
-        ['f_rest_9', 'f_rest_10', 'f_rest_11', 'ID'], ['f_rest_12', 'f_rest_13', 'f_rest_14', 'ID'],
-        ['f_rest_15', 'f_rest_16', 'f_rest_17', 'ID'], ['f_rest_18', 'f_rest_19', 'f_rest_20', 'ID'],
-        ['f_rest_21', 'f_rest_22', 'f_rest_23', 'ID'], ['f_rest_24', 'f_rest_25', 'f_rest_26', 'ID'],
-        ['f_rest_27', 'f_rest_28', 'f_rest_29', 'ID'], ['f_rest_30', 'f_rest_31', 'f_rest_32', 'ID'],
-        ['f_rest_33', 'f_rest_34', 'f_rest_35', 'ID'], ['f_rest_36', 'f_rest_37', 'f_rest_38', 'ID'],
-        ['f_rest_39', 'f_rest_40', 'f_rest_41', 'ID'], ['f_rest_42', 'f_rest_43', 'f_rest_44', 'ID'],
-        ['opacity', 'ID'], ['scale_0', 'scale_1', 'scale_2', 'ID'], ['rot_0', 'rot_1', 'rot_2', 'ID'],
-        ['rot_3', 'ID']
-    ]
+    # Attribute groups written by attributes_spilt.py and their column names in the output
+    schema = AttributeSchema.locate(input_prefix, args.schema)
+    file_suffixes = [group.file_name('devoxel') for group in schema.groups]
+    columns_list = [[schema.output_name(col) for col in group.columns] + ['ID'] for group in schema.groups]
+    keep = visibility_keep_mask(args.visibility, args.min_views) if args.visibility else None
+
+    if args.streaming:
+        if args.ascii:
+            raise ValueError("--streaming always writes the binary 3DGS layout; drop --ascii")
+        file_paths = [os.path.join(input_prefix, file_suffix) for file_suffix in file_suffixes]
+        count = stream_fusion(file_paths, columns_list, args.output_path, args.chunk_size, keep)
+        if args.morton_order:
+            sort_binary_ply(args.output_path)
+        print(f"Merged point cloud ({count} points) saved to: {args.output_path}")
+        return
 
     # Read all files and set column names
     dataframes = []
     for file_suffix, columns in zip(file_suffixes, columns_list):
         file_path = os.path.join(input_prefix, file_suffix)
         _, data = read_ply(file_path)
-        data.columns = columns
+        data.columns = [col if col is not None else f"pad_{j}" for j, col in enumerate(columns)]
+        data = data[[col for col in columns if col is not None]]  # Drop the padding columns
         dataframes.append(data)
 
     # Merge all dataframes based on 'ID'
     merged_data = reduce(lambda left, right: pd.merge(left, right, on='ID', how='inner'), dataframes)
 
+    if keep is not None:
+        merged_data = merged_data[keep[merged_data['ID'].values.astype(np.int64)]]
+
     # Drop the 'ID' column
     merged_data = merged_data.drop(columns=['ID'])
 
-    # Update header information
-    updated_header = [
-        "ply\n", "format ascii 1.0\n", f"element vertex {len(merged_data)}\n"
-    ] + [f"property float {col}\n" for col in merged_data.columns] + ["end_header\n"]
+    if args.morton_order:
+        merged_data = merged_data.iloc[morton_order(merged_data[['x', 'y', 'z']].values)].reset_index(drop=True)
+
+    if args.ascii:
+        # Update header information
+        updated_header = [
+            "ply\n", "format ascii 1.0\n", f"element vertex {len(merged_data)}\n"
+        ] + [f"property float {col}\n" for col in merged_data.columns] + ["end_header\n"]
 
-    # Write the merged data to the output file
-    write_ply(args.output_path, updated_header, merged_data)
+        # Write the merged data to the output file
+        write_ply(args.output_path, updated_header, merged_data)
+    else:
+        # Write the final 3DGS binary layout, normals included
+        write_gaussian_ply(args.output_path, merged_data)
 
     print(f"Merged point cloud saved to: {args.output_path}")
 
@@ -0,0 +1,212 @@
+import os
+import time
+import argparse
+import numpy as np
+from attribute_prefilter import read_vertices, attribute_rules, write_kept
+from occupancy_filter import KEY_BITS, pack_cells, occupancy_supports, occupancy_scores
+
+# Multiplier of the FNV-1a hash used for the position and record hashes
+FNV_PRIME = np.uint64(0x100000001b3)
+FNV_OFFSET = np.uint64(0xcbf29ce484222325)
+
+# Voxel coordinates are stored around the centre of the first run, in [0, 2^KEY_BITS)
+GRID_OFFSET = 1 << (KEY_BITS - 1)
+
+# Key differences of the 27 bricks around (and including) a brick (see occupancy_filter.pack_cells)
+BRICK_OFFSETS = np.array([(dx << (2 * KEY_BITS)) + (dy << KEY_BITS) + dz
+                          for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)], dtype=np.int64)
+
+# Function to hash rows of 32-bit words
+def hash_words(words):
+    """FNV-1a hash of every row of a (N, W) uint32 array."""
+    hashes = np.full(len(words), FNV_OFFSET, dtype=np.uint64)
+    for column in range(words.shape[1]):
+        hashes ^= words[:, column].astype(np.uint64)
+        hashes *= FNV_PRIME
+    return hashes
+
+# Function to hash the positions and the full records of the vertices
+def vertex_hashes(columns):
+    """
+    Hash the float32 bits of x, y, z and of all attributes of every vertex.
+
+    :return: (N,) position hashes and (N,) record hashes
+    """
+    names = columns.dtype.names if hasattr(columns, 'dtype') else list(columns)
+    words = np.stack([np.asarray(columns[name], dtype=np.float32).view(np.uint32) for name in names], axis=1)
+    positions = [names.index(name) for name in ('x', 'y', 'z')]
+    return hash_words(words[:, positions]), hash_words(words)
+
+# Function to sort and deduplicate keys
+def sorted_unique(values):
+    """Sorted unique values through a plain sort (np.unique may take a much slower hash path on large random keys)."""
+    values = np.sort(values)
+    return values[np.concatenate(([True], values[1:] != values[:-1]))] if len(values) else values
+
+# Function to look values up in a sorted array
+def sorted_contains(sorted_values, values):
+    """Whether every value is in sorted_values, and its position there."""
+    positions = np.searchsorted(sorted_values, values)
+    found = positions < len(sorted_values)
+    found[found] = sorted_values[positions[found]] == values[found]
+    return found, positions
+
+# Function to unpack keys made by occupancy_filter.pack_cells
+def unpack_cells(keys):
+    mask = (1 << KEY_BITS) - 1
+    return np.stack([(keys >> (2 * KEY_BITS)) & mask, (keys >> KEY_BITS) & mask, keys & mask], axis=1) - 1
+
+# Function to map positions to the fixed voxel grid of a state
+def voxel_cells(xyz, center, voxel_size):
+    """Voxel coordinates on a world-space grid that stays the same for every checkpoint of a scene."""
+    cells = np.floor((xyz - center) / voxel_size).astype(np.int64) + GRID_OFFSET
+    return np.clip(cells, 0, 2 * GRID_OFFSET - 2)  # Far outliers are folded onto the border
+
+# Function to flag the occupied bricks next to a set of bricks
+def near_bricks(brick_keys, occupied):
+    """
+    Flag the bricks of occupied (sorted unique brick keys) within one brick of brick_keys.
+
+    The neighbours are enumerated by adding key offsets, which never carry between the axes
+    (the brick coordinates stay well inside the key range).
+    """
+    found, positions = sorted_contains(occupied, sorted_unique((brick_keys[:, None] + BRICK_OFFSETS[None, :]).ravel()))
+    flags = np.zeros(len(occupied), dtype=bool)
+    flags[positions[found]] = True
+    return flags
+
+# Function to score every occupied voxel of a full run
+def full_scores(voxel_keys, strides):
+    """Occupancy scores of all voxels and the median support of every level (saved for the incremental runs)."""
+    supports = occupancy_supports(unpack_cells(voxel_keys), strides)
+    medians = np.array([np.median(support) for support in supports])
+    return np.min([support / median for support, median in zip(supports, medians)], axis=0), medians
+
+# Function to re-score only the voxels near occupancy changes
+def incremental_scores(voxel_keys, changed, state, strides):
+    """
+    Scores of the new voxels, recomputed only where the occupancy changed.
+
+    A voxel's score depends on the occupied voxels in the 3x3x3 cells around it at every level,
+    which all lie in the 3x3x3 bricks (cells of the coarsest stride) around its brick. So the
+    voxels in the bricks around an added or removed voxel ('dirty' bricks) are re-scored, with
+    one more ring of bricks as context; the medians of the base run are kept. Every other voxel
+    was occupied before, with the same neighbourhood, and keeps its cached score.
+
+    :param changed: Keys of the voxels occupied in only one of the two runs
+    :return: Scores aligned with voxel_keys, and the number of re-scored voxels
+    """
+    brick_size = strides[-1]
+    scores = np.empty(len(voxel_keys), dtype=np.float64)
+    dirty = np.zeros(len(voxel_keys), dtype=bool)
+    if len(changed):
+        occupied, voxel_brick = np.unique(pack_cells(unpack_cells(voxel_keys) // brick_size), return_inverse=True)
+        voxel_brick = voxel_brick.ravel()
+        dirty_bricks = near_bricks(sorted_unique(pack_cells(unpack_cells(changed) // brick_size)), occupied)
+        context_bricks = near_bricks(occupied[dirty_bricks], occupied)
+        dirty = dirty_bricks[voxel_brick]
+        context = context_bricks[voxel_brick]
+        context_scores = occupancy_scores(unpack_cells(voxel_keys[context]), strides, state['medians'])
+        scores[dirty] = context_scores[dirty[context]]
+    cached = np.searchsorted(state['voxel_keys'], voxel_keys[~dirty])
+    scores[~dirty] = state['voxel_scores'][cached]
+    return scores, int(dirty.sum())
+
+# Set up command line arguments
+def parse_args():
+    parser = argparse.ArgumentParser(description="Re-filter a new checkpoint of a scene, reusing the decisions of the previous run where nothing changed.")
+    parser.add_argument('--input', type=str, required=True, help="Input PLY file (binary 3DGS point cloud or the output of binary_to_ascii.py)")
+    parser.add_argument('--state', type=str, required=True, help="State file of the scene (.npz is appended if missing); created by the first run and updated by every run")
+    parser.add_argument('--output', type=str, default=None, help="Output PLY file without the removed points, in the same format as the input")
+    parser.add_argument('--removed_ids', type=str, default=None, help="Text file to save the removed IDs (0-based row numbers of the input)")
+    parser.add_argument('--voxel_resolution', type=int, default=7168, help="Voxels along the largest extent of the first checkpoint (default is 7168)")
+    parser.add_argument('--strides', type=str, default='2,4,8', help="Strides of the pyramid levels; the last one is the brick size (default is 2,4,8)")
+    parser.add_argument('--threshold', type=float, default=0.1, help="Minimum occupancy score of a kept point (default is 0.1)")
+    parser.add_argument('--min_opacity', type=float, default=None, help="Also remove points with sigmoid(opacity) below this value")
+    parser.add_argument('--max_scale', type=float, default=None, help="Also remove points whose largest exp(scale) exceeds this value")
+    parser.add_argument('--full', action='store_true', help="Ignore the cached state: new grid, new medians, every point re-filtered")
+    parser.add_argument('--max_changed', type=float, default=0.5, help="Run in full when more than this fraction of the voxels changed (default is 0.5)")
+    return parser.parse_args()
+
+# Main function
+def main():
+    args = parse_args()
+    if not args.state.endswith('.npz'):
+        args.state += '.npz'  # np.savez would add it, and the next run would not find the state
+    strides = tuple(int(value) for value in args.strides.split(','))
+    settings = np.array([args.voxel_resolution, args.threshold, np.nan if args.min_opacity is None else args.min_opacity,
+                         np.nan if args.max_scale is None else args.max_scale] + list(strides), dtype=np.float64)
+
+    start = time.time()
+    header, file_format, vertices = read_vertices(args.input)
+    xyz = np.stack([np.asarray(vertices[name], dtype=np.float64) for name in ('x', 'y', 'z')], axis=1)
+    position_hashes, record_hashes = vertex_hashes(vertices)
+
+    state = None
+    if not args.full and os.path.exists(args.state):
+        state = dict(np.load(args.state))
+        if not np.array_equal(state['settings'], settings, equal_nan=True):
+            print("Settings differ from the cached state; running in full")
+            state = None
+    if state is None:
+        center = (xyz.min(axis=0) + xyz.max(axis=0)) / 2
+        voxel_size = max((xyz.max(axis=0) - xyz.min(axis=0)).max(), 1e-12) / args.voxel_resolution
+    else:
+        center, voxel_size = state['center'], float(state['voxel_size'])
+
+    # Occupied voxels on the fixed grid; every point takes the score of its voxel
+    keys = pack_cells(voxel_cells(xyz, center, voxel_size))
+    voxel_keys, point_voxel = np.unique(keys, return_inverse=True)
+    point_voxel = point_voxel.ravel()
+
+    if state is not None:
+        # Diff against the previous checkpoint by position and by the full record (the state keeps them sorted)
+        known_position, _ = sorted_contains(state['position_hashes'], position_hashes)
+        same_record, rows = sorted_contains(state['record_hashes'], record_hashes)
+        deleted = len(state['position_hashes']) - int(sorted_contains(sorted_unique(position_hashes), state['position_hashes'])[0].sum())
+        print(f"{int(same_record.sum())} unchanged, {int((known_position & ~same_record).sum())} with new attributes, "
+              f"{int((~known_position).sum())} moved or new, {deleted} gone since the previous run")
+        changed = np.setxor1d(state['voxel_keys'], voxel_keys, assume_unique=True)
+        if len(changed) > args.max_changed * len(voxel_keys):
+            print(f"{len(changed)} of {len(voxel_keys)} voxels changed; running in full")
+            state = None
+
+    if state is None:
+        voxel_scores, medians = full_scores(voxel_keys, strides)
+        rules_removed = np.zeros(len(xyz), dtype=bool)
+        for mask in attribute_rules(vertices, args.min_opacity, args.max_scale).values():
+            rules_removed |= mask
+        print(f"Full run: {len(voxel_keys)} voxels scored")
+    else:
+        voxel_scores, rescored = incremental_scores(voxel_keys, changed, state, strides)
+        medians = state['medians']
+
+        # The attribute rules only depend on the record itself; reuse them for identical records
+        rules_removed = np.zeros(len(xyz), dtype=bool)
+        rules_removed[same_record] = state['rules_removed'][rows[same_record]]
+        new_rows = np.flatnonzero(~same_record)
+        subset = dict((name, np.asarray(vertices[name])[new_rows]) for name in
+                      (vertices.dtype.names if hasattr(vertices, 'dtype') else vertices))
+        for mask in attribute_rules(subset, args.min_opacity, args.max_scale).values():
+            rules_removed[new_rows] |= mask
+        print(f"Incremental run: {len(changed)} voxels changed, {rescored} of {len(voxel_keys)} voxels re-scored "
+              f"({100.0 * rescored / max(len(voxel_keys), 1):.1f}%), {len(new_rows)} records re-checked")
+
+    removed = (voxel_scores[point_voxel] < args.threshold) | rules_removed
+    print(f"Removed {int(removed.sum())} of {len(xyz)} points in {time.time() - start:.2f}s")
+
+    order = np.argsort(record_hashes, kind='stable')
+    np.savez(args.state, settings=settings, center=center, voxel_size=voxel_size, medians=medians,
+             voxel_keys=voxel_keys, voxel_scores=voxel_scores, position_hashes=sorted_unique(position_hashes),
+             record_hashes=record_hashes[order], rules_removed=rules_removed[order])
+    print(f"State saved to: {args.state}")
+
+    if args.output:
+        write_kept(args.input, args.output, header, file_format, vertices, ~removed)
+        print(f"Filtered point cloud saved to: {args.output}")
+    if args.removed_ids:
+        np.savetxt(args.removed_ids, np.flatnonzero(removed), fmt='%d')
+        print(f"Removed IDs saved to: {args.removed_ids}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import os
+import argparse
+import numpy as np
+from binary_ply import read_ply_header, memmap_vertices
+from attribute_schema import AttributeSchema
+from spatial_index import morton_order
+
+# Number of vertex records gathered at a time when sorting a binary PLY file
+GATHER_CHUNK = 1 << 20
+
+# Function to sort the rows of an ASCII group file by the Morton code of their first three columns
+def sort_group_file(input_path, output_path):
+    """
+    Reorder the points of an ASCII group file (x y z ... ID) along the Z-order curve.
+
+    The data lines are moved unchanged, so the ID column keeps every point's identity and the
+    file stays readable by every later stage. The sort is stable, so duplicate voxels keep their
+    relative order and delete_repeat_voxel.py keeps the same IDs.
+
+    :param input_path: Path to the input group file
+    :param output_path: Path to save the sorted group file
+    :return: Number of points
+    """
+    with open(input_path, 'r') as f:
+        header = []
+        for line in f:
+            header.append(line)
+            if line.strip() == "end_header":
+                break
+        lines = [line for line in f if line.strip()]
+
+    coords = np.array([line.split()[:3] for line in lines], dtype=np.float64).reshape(-1, 3)
+    order = morton_order(coords)
+
+    with open(output_path, 'w') as f:
+        f.writelines(header)
+        f.writelines(lines[i] for i in order)
+    return len(lines)
+
+# Function to sort the vertices of a binary PLY file by the Morton code of x, y, z
+def sort_binary_ply(input_path, output_path=None):
+    """
+    Reorder the vertices of a binary little-endian PLY file along the Z-order curve.
+
+    Only x, y, z are read to compute the order; the records are then gathered chunk by chunk
+    into the output file, so the whole point cloud is never held in memory.
+
+    :param input_path: Binary PLY file with x, y, z vertex properties
+    :param output_path: Output file, or None to sort the input file
+    :return: Number of points
+    """
+    header, _, vertex_count, _, data_offset = read_ply_header(input_path)
+    source, _ = memmap_vertices(input_path)
+    order = morton_order(np.stack([source['x'], source['y'], source['z']], axis=1))
+
+    in_place = output_path is None or os.path.abspath(output_path) == os.path.abspath(input_path)
+    target_path = input_path + '.tmp' if in_place else output_path
+    with open(target_path, 'wb') as f:
+        f.write(''.join(header).encode('ascii'))
+        f.truncate(data_offset + vertex_count * source.dtype.itemsize)
+    if vertex_count:
+        target = np.memmap(target_path, dtype=source.dtype, mode='r+', offset=data_offset, shape=(vertex_count,))
+        for start in range(0, vertex_count, GATHER_CHUNK):
+            target[start:start + GATHER_CHUNK] = source[order[start:start + GATHER_CHUNK]]
+        target.flush()
+        del target
+    del source
+
+    if in_place:
+        os.replace(target_path, input_path)
+    return vertex_count
+
+# Set up command line arguments
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sort point cloud files along the Morton (Z-order) curve, keeping the IDs.")
+    parser.add_argument('--input_dir', type=str, default=None, help="Directory containing the voxelized group files")
+    parser.add_argument('--output_dir', type=str, default=None, help="Directory to save the sorted group files")
+    parser.add_argument('--schema', type=str, default=None, help="Attribute schema file (default: schema.json in the input directory)")
+    parser.add_argument('--input_ply', type=str, default=None, help="Binary 3DGS PLY file to sort instead of the group files")
+    parser.add_argument('--output_ply', type=str, default=None, help="Sorted binary PLY file (default: sort --input_ply in place)")
+    return parser.parse_args()
+
+# Main function
+def main():
+    args = parse_args()
+
+    if args.input_ply:
+        count = sort_binary_ply(args.input_ply, args.output_ply)
+        print(f"Sorted point cloud ({count} points) saved to: {args.output_ply or args.input_ply}")
+        return
+
+    if not (args.input_dir and args.output_dir):
+        raise ValueError("Give --input_dir and --output_dir, or --input_ply")
+
+    # Attribute groups written by attributes_spilt.py
+    schema = AttributeSchema.locate(args.input_dir, args.schema)
+    os.makedirs(args.output_dir, exist_ok=True)
+    schema.save(args.output_dir)
+
+    for group in schema.groups:
+        input_ply_path = os.path.join(args.input_dir, group.file_name('voxel'))
+        output_ply_path = os.path.join(args.output_dir, group.file_name('voxel'))
+        count = sort_group_file(input_ply_path, output_ply_path)
+        print(f"Sorted point cloud ({count} points) saved to: {output_ply_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from attribute_schema import AttributeSchema
+
+# Bits per axis when packing cell coordinates into one int64 key
+KEY_BITS = 21
+
+# Function to pack integer cell coordinates into sortable int64 keys
+def pack_cells(cells):
+    """
+    Pack (N, 3) non-negative cell coordinates into int64 keys.
+
+    The coordinates are shifted by one, so adding the key of a -1/0/+1 offset to a key gives the
+    key of the neighbouring cell without any carry between the axes.
+    """
+    cells = cells.astype(np.int64) + 1
+    return (cells[:, 0] << (2 * KEY_BITS)) | (cells[:, 1] << KEY_BITS) | cells[:, 2]
+
+# Key differences of the 9 cell columns (dx, dy) of a 3x3x3 neighbourhood, starting at dz = -1
+COLUMN_OFFSETS = np.array([(dx << (2 * KEY_BITS)) + (dy << KEY_BITS) - 1
+                           for dx in (-1, 0, 1) for dy in (-1, 0, 1)], dtype=np.int64)
+
+# Function to build the occupancy pyramid of a voxel grid
+def occupancy_pyramid(voxel_coords, strides=(2, 4, 8)):
+    """
+    Down-sample the occupied voxels level by level.
+
+    Every level is built from the previous one: its cells are the parent cells of the previous
+    level's occupied cells, and its counts (occupied voxels per cell) are the summed child counts.
+
+    :param voxel_coords: (N, 3) non-negative integer voxel coordinates
+    :param strides: Increasing strides, each a multiple of the previous one
+    :return: List of (stride, cell coordinates, occupied voxel counts, cell index of every point)
+    """
+    levels = []
+    cells = np.asarray(voxel_coords, dtype=np.int64)
+    counts = np.ones(len(cells), dtype=np.int64)
+    point_cell = np.arange(len(cells))
+    previous = 1
+    for stride in strides:
+        if stride % previous:
+            raise ValueError(f"Stride {stride} is not a multiple of the previous stride {previous}")
+        keys, first, inverse = np.unique(pack_cells(cells // (stride // previous)), return_index=True, return_inverse=True)
+        inverse = inverse.ravel()
+        cells = cells[first] // (stride // previous)
+        counts = np.bincount(inverse, weights=counts, minlength=len(keys)).astype(np.int64)
+        point_cell = inverse[point_cell]
+        levels.append((stride, cells, counts, point_cell))
+        previous = stride
+    return levels
+
+# Function to sum the occupancy of the 3x3x3 cell neighbourhood of every cell
+def neighbourhood_support(cells, counts):
+    """Occupied voxels in the 27 cells around (and including) every occupied cell."""
+    keys = pack_cells(cells)  # Sorted, since the cells come from np.unique of the same keys
+    support = np.zeros(len(keys), dtype=np.int64)
+    padded_keys = np.append(keys, -1)
+    padded_counts = np.append(counts, 0)
+    # One binary search per column; the cells dz = -1, 0, +1 of a column are consecutive keys
+    for offset in COLUMN_OFFSETS:
+        lowest = keys + offset
+        positions = np.searchsorted(keys, lowest)
+        for dz in range(3):
+            found = padded_keys[positions] == lowest + dz
+            support += np.where(found, padded_counts[positions], 0)
+            positions += found  # The next cell of the column, if present, follows a found one
+    return support
+
+# Function to compute the occupancy support of every point at every pyramid level
+def occupancy_supports(voxel_coords, strides=(2, 4, 8)):
+    """Per level, the occupied voxels in the 3x3x3 cells around the cell of every point."""
+    return [neighbourhood_support(cells, counts)[point_cell]
+            for _, cells, counts, point_cell in occupancy_pyramid(voxel_coords, strides)]
+
+# Function to score every point by its occupancy support in the pyramid
+def occupancy_scores(voxel_coords, strides=(2, 4, 8), medians=None):
+    """
+    Score every point by the occupancy around it at the coarse levels.
+
+    At each level, the support of a point is the number of occupied voxels in the 3x3x3 cells
+    around its cell, divided by the median support of all points at that level, so the score
+    adapts to the density of the group. The score is the smallest ratio over the levels:
+    isolated outliers find almost no occupancy around them once down-sampled.
+
+    :param voxel_coords: (N, 3) non-negative integer voxel coordinates
+    :param strides: Strides of the pyramid levels
+    :param medians: Median support of every level; default is the median over these points
+                    (pass the medians of the whole cloud to score a part of it, as incremental_filter.py does)
+    :return: (N,) float scores, about 1 for typical points and close to 0 for isolated points
+    """
+    scores = np.full(len(voxel_coords), np.inf)
+    if len(voxel_coords) == 0:
+        return scores
+    for level, support in enumerate(occupancy_supports(voxel_coords, strides)):
+        median = np.median(support) if medians is None else medians[level]
+        np.minimum(scores, support / median, out=scores)
+    return scores
+
+# Function to read a group file of voxel coordinates and IDs
+def read_voxel_ids(file_path):
+    """Read an 'x y z ID' group file; return the header lines, voxel coordinates and IDs."""
+    with open(file_path, 'r') as f:
+        header = []
+        for line in f:
+            header.append(line)
+            if line.strip() == "end_header":
+                break
+    data = pd.read_csv(file_path, skiprows=len(header), sep=' ', header=None).values
+    return header, data[:, :3].astype(np.int64), data[:, -1].astype(np.int64)
+
+# Function to filter one group in place of the encoder/decoder
+def filter_process(input_ply_path, output_ply_path, strides=(2, 4, 8), threshold=0.1):
+    """
+    Keep the points of one group whose occupancy score reaches the threshold.
+
+    The output has the format of the decoder output of repc5.py (x y z ID with the input header),
+    so devoxelization.py reads it unchanged; the rejected IDs are dropped by fusion.
+
+    :param input_ply_path: Deduplicated group file
+    :param output_ply_path: Reconstructed group file
+    :param strides: Strides of the pyramid levels
+    :param threshold: Minimum score of a kept point
+    :return: Boolean mask of the kept points, their voxel coordinates and IDs
+    """
+    header, coords, ids = read_voxel_ids(input_ply_path)
+    kept = occupancy_scores(coords, strides) >= threshold
+
+    # The kept data lines are copied unchanged, which is much faster than formatting them again
+    with open(input_ply_path, 'r') as f:
+        lines = [line for line in f.readlines()[len(header):] if line.strip()]
+    with open(output_ply_path, 'w') as f:
+        for line in header:
+            f.write(f"element vertex {int(kept.sum())}\n" if line.startswith("element vertex") else line)
+        f.writelines(line for line, keep in zip(lines, kept) if keep)
+    return kept, coords, ids
+
+# Function to compare the kept points with the decoder output of the network
+def compare_with_network(kept, input_coords, ids, network_ply_path, margin):
+    """
+    Compare with the network: a point counts as rejected by the network when the decoder moved it
+    by more than margin voxels (Chebyshev distance), the criterion cascade.py also uses.
+
+    :return: Agreement, and precision and recall of the occupancy rejections w.r.t. the network's
+    """
+    _, network_coords, network_ids = read_voxel_ids(network_ply_path)
+    order = np.argsort(network_ids)
+    rows = order[np.searchsorted(network_ids, ids, sorter=order)]
+    moved = np.abs(network_coords[rows] - input_coords).max(axis=1) > margin
+    rejected = ~kept
+    agreement = np.mean(rejected == moved)
+    precision = (rejected & moved).sum() / max(rejected.sum(), 1)
+    recall = (rejected & moved).sum() / max(moved.sum(), 1)
+    return agreement, precision, recall
+
+# Set up command line arguments
+def parse_args():
+    parser = argparse.ArgumentParser(description="CPU occupancy-pyramid filter, a drop-in replacement of the encoder/decoder step (repc5.py).")
+    parser.add_argument('--input_dir', type=str, required=True, help="Directory containing the deduplicated PLY files")
+    parser.add_argument('--output_dir', type=str, required=True, help="Directory to save the filtered files (named like the reconstructed files)")
+    parser.add_argument('--schema', type=str, default=None, help="Attribute schema file (default: schema.json in the input directory)")
+    parser.add_argument('--strides', type=str, default='2,4,8', help="Strides of the pyramid levels (default is 2,4,8)")
+    parser.add_argument('--threshold', type=float, default=0.1, help="Minimum occupancy score (support relative to the median) of a kept point (default is 0.1)")
+    parser.add_argument('--reference_dir', type=str, default=None, help="Output directory of repc5.py on the same input, to benchmark against the network")
+    parser.add_argument('--margin', type=int, default=2, help="Decoder displacement (voxels) counted as a network rejection in the benchmark (default is 2)")
+    return parser.parse_args()
+
+# Main function
+def main():
+    args = parse_args()
+    strides = tuple(int(value) for value in args.strides.split(','))
+
+    # Attribute groups written by attributes_spilt.py
+    schema = AttributeSchema.locate(args.input_dir, args.schema)
+    os.makedirs(args.output_dir, exist_ok=True)
+    schema.save(args.output_dir)
+
+    for group in schema.groups:
+        input_ply_path = os.path.join(args.input_dir, group.file_name('dedup'))
+        output_ply_path = os.path.join(args.output_dir, group.file_name('reconstructed'))
+
+        start = time.time()
+        kept, coords, ids = filter_process(input_ply_path, output_ply_path, strides, args.threshold)
+        print(f"{group.name}: kept {int(kept.sum())} of {len(kept)} points in {time.time() - start:.2f}s, saved to: {output_ply_path}")
+
+        if args.reference_dir:
+            network_ply_path = os.path.join(args.reference_dir, group.file_name('reconstructed'))
+            agreement, precision, recall = compare_with_network(kept, coords, ids, network_ply_path, args.margin)
+            print(f"{group.name}: agreement with the network {100.0 * agreement:.1f}%, "
+                  f"precision {100.0 * precision:.1f}%, recall {100.0 * recall:.1f}%")
+
+if __name__ == "__main__":
+    main()
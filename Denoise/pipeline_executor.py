@@ -0,0 +1,112 @@
+import time
+import queue
+import threading
+
+# Marks the end of the items in a stage queue
+END_OF_ITEMS = object()
+
+# Seconds between checks for a failed stage while a queue is full or empty
+POLL_INTERVAL = 0.1
+
+# Function to put an item into a bounded queue unless the pipeline has stopped
+def put_unless_stopped(target, item, stop):
+    """Block until the item fits into the queue; return False if the pipeline stopped meanwhile."""
+    while not stop.is_set():
+        try:
+            target.put(item, timeout=POLL_INTERVAL)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+# Function to get an item from a queue unless the pipeline has stopped
+def get_unless_stopped(source, stop):
+    """Block until an item arrives; return END_OF_ITEMS if the pipeline stopped meanwhile."""
+    while not stop.is_set():
+        try:
+            return source.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            continue
+    return END_OF_ITEMS
+
+# Function to run load, compute and store stages over a list of items with overlapping I/O
+def run_pipelined(items, load, compute, store, queue_slots=2):
+    """
+    Run load(item) -> compute(loaded) -> store(result) for every item as a three-stage pipeline.
+
+    Loading runs in a reader thread and storing in a writer thread, while compute runs in the
+    calling thread (where the model lives). While item i is computed, item i+1 is loaded and
+    item i-1 is stored. Each queue holds at most queue_slots entries, which bounds the memory of
+    loaded items and results waiting for their stage. The first exception of any stage stops the
+    pipeline and is raised again in the caller.
+
+    :param items: Items to process, in order
+    :param load: Function of an item, run in the reader thread
+    :param compute: Function of a loaded item, run in the calling thread
+    :param store: Function of a computed result, run in the writer thread
+    :param queue_slots: Capacity of each of the two queues
+    :return: Dict of the busy seconds of 'load', 'compute' and 'store', and the 'wall' time
+    """
+    loaded_queue = queue.Queue(maxsize=queue_slots)
+    result_queue = queue.Queue(maxsize=queue_slots)
+    stop = threading.Event()
+    errors = []
+    busy = {'load': 0.0, 'compute': 0.0, 'store': 0.0}
+
+    def reader():
+        try:
+            for item in items:
+                start = time.time()
+                loaded = load(item)
+                busy['load'] += time.time() - start
+                if not put_unless_stopped(loaded_queue, loaded, stop):
+                    return
+        except BaseException as error:
+            errors.append(error)
+            stop.set()
+        put_unless_stopped(loaded_queue, END_OF_ITEMS, stop)
+
+    def writer():
+        try:
+            while True:
+                result = get_unless_stopped(result_queue, stop)
+                if result is END_OF_ITEMS:
+                    return
+                start = time.time()
+                store(result)
+                busy['store'] += time.time() - start
+        except BaseException as error:
+            errors.append(error)
+            stop.set()
+
+    wall_start = time.time()
+    threads = [threading.Thread(target=reader, daemon=True), threading.Thread(target=writer, daemon=True)]
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            loaded = get_unless_stopped(loaded_queue, stop)
+            if loaded is END_OF_ITEMS:
+                break
+            start = time.time()
+            result = compute(loaded)
+            busy['compute'] += time.time() - start
+            if not put_unless_stopped(result_queue, result, stop):
+                break
+        put_unless_stopped(result_queue, END_OF_ITEMS, stop)
+    except BaseException as error:
+        errors.append(error)
+        stop.set()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+    busy['wall'] = time.time() - wall_start
+    return busy
+
+# Function to print the stage times of a pipelined run
+def print_stage_times(times):
+    """Print the busy time of every stage and the end-to-end time."""
+    print(f"Load {times['load']:.2f}s, compute {times['compute']:.2f}s, store {times['store']:.2f}s "
+          f"(sequential {times['load'] + times['compute'] + times['store']:.2f}s), end-to-end {times['wall']:.2f}s")
@@ -0,0 +1,145 @@
+import os
+import argparse
+import numpy as np
+from binary_ply import read_ply_header, memmap_vertices, replace_vertex_properties, vertex_dtype
+
+# Number of vertex records copied at a time when the column layout changes
+COPY_CHUNK = 1 << 20
+
+# Function to parse a comma-separated list of column names
+def parse_columns(text):
+    """Parse 'a,b,c' into ['a', 'b', 'c']; None or an empty string gives an empty list."""
+    return [name.strip() for name in text.split(',') if name.strip()] if text else []
+
+# Function to parse a comma-separated list of renames
+def parse_renames(text):
+    """Parse 'old:new,old2:new2' into {'old': 'new', 'old2': 'new2'}."""
+    renames = {}
+    for pair in parse_columns(text):
+        old, sep, new = pair.partition(':')
+        if not sep or not new:
+            raise ValueError(f"Invalid rename '{pair}', expected old:new")
+        renames[old] = new
+    return renames
+
+# Function to work out which columns the output keeps and how they are named
+def plan_columns(properties, keep=None, drop=None, rename=None):
+    """
+    Plan the output columns of a column edit.
+
+    :param properties: (type, name) vertex properties of the input file
+    :param keep: Columns to keep, in output order (None keeps every column)
+    :param drop: Columns to drop
+    :param rename: Mapping of old to new column names
+    :return: List of (type, source name, output name) triples
+    """
+    keep, drop, rename = keep or [], drop or [], rename or {}
+    types = dict((name, prop_type) for prop_type, name in properties)
+    unknown = [name for name in keep + drop + list(rename) if name not in types]
+    if unknown:
+        raise ValueError(f"Unknown column(s): {', '.join(unknown)}")
+
+    selected = keep if keep else [name for _, name in properties]
+    plan = [(types[name], name, rename.get(name, name)) for name in selected if name not in drop]
+    output_names = [output for _, _, output in plan]
+    if len(set(output_names)) != len(output_names):
+        raise ValueError("The edit would produce duplicate column names")
+    return plan
+
+# Function to project, drop, rename and zero columns of a binary PLY file
+def edit_columns(input_path, output_path=None, keep=None, drop=None, rename=None, zero=None):
+    """
+    Edit the vertex columns of a binary PLY file.
+
+    When the record layout is unchanged (zeroing, or renaming with a header of the same length),
+    the memory-mapped file is edited in place. Otherwise the new layout is written with a single
+    strided copy of the kept columns and a correct header.
+
+    :param input_path: Binary little-endian PLY file
+    :param output_path: Output file, or None to edit the input file
+    :param keep: Columns to keep, in output order
+    :param drop: Columns to drop
+    :param rename: Mapping of old to new column names
+    :param zero: Columns (original names) to set to zero
+    :return: True if the file was edited in place, False if a new file was written
+    """
+    header, file_format, vertex_count, properties, data_offset = read_ply_header(input_path)
+    if file_format != 'binary_little_endian':
+        raise ValueError(f"{input_path} is not a binary_little_endian PLY file (format: {file_format})")
+
+    plan = plan_columns(properties, keep, drop, rename)
+    zero = zero or []
+    kept_sources = [source for _, source, _ in plan]
+    missing = [name for name in zero if name not in kept_sources]
+    if missing:
+        raise ValueError(f"Cannot zero column(s) that are not kept: {', '.join(missing)}")
+
+    new_properties = [(prop_type, output) for prop_type, _, output in plan]
+    new_header = replace_vertex_properties(header, new_properties)
+    same_layout = kept_sources == [name for _, name in properties]
+    in_place = output_path is None or os.path.abspath(output_path) == os.path.abspath(input_path)
+
+    if same_layout and in_place and len(new_header) == data_offset:
+        vertices, _ = memmap_vertices(input_path, mode='r+')
+        for name in zero:
+            vertices[name] = 0
+        if len(vertices):
+            vertices.flush()
+        del vertices
+        if new_header != ''.join(header).encode('ascii'):
+            with open(input_path, 'r+b') as f:
+                f.write(new_header)
+        return True
+
+    source, _ = memmap_vertices(input_path)
+    view = source[kept_sources]  # Multi-field view into the memmap, nothing is copied yet
+    zero_outputs = [output for _, name, output in plan if name in zero]
+    target_path = input_path + '.tmp' if in_place else output_path
+    dtype = vertex_dtype(new_properties)
+
+    with open(target_path, 'wb') as f:
+        f.write(new_header)
+        f.truncate(len(new_header) + vertex_count * dtype.itemsize)
+    if vertex_count:
+        target = np.memmap(target_path, dtype=dtype, mode='r+', offset=len(new_header), shape=(vertex_count,))
+        for start in range(0, vertex_count, COPY_CHUNK):
+            chunk = target[start:start + COPY_CHUNK]
+            chunk[...] = view[start:start + COPY_CHUNK]  # Structured assignment copies by position
+            for name in zero_outputs:
+                chunk[name] = 0
+        target.flush()
+        del target
+    del view, source
+
+    if in_place:
+        os.replace(target_path, input_path)
+    return False
+
+# Set up command line arguments
+def parse_args():
+    parser = argparse.ArgumentParser(description="Project, drop, rename or zero columns of a binary PLY file.")
+    parser.add_argument('--input', type=str, required=True, help="Input binary PLY file path")
+    parser.add_argument('--output', type=str, default=None, help="Output PLY file path (default: edit the input file)")
+    parser.add_argument('--keep', type=str, default=None, help="Comma-separated columns to keep, in output order")
+    parser.add_argument('--drop', type=str, default=None, help="Comma-separated columns to drop, e.g. id")
+    parser.add_argument('--rename', type=str, default=None, help="Comma-separated renames, e.g. rot_0:rot_w")
+    parser.add_argument('--zero', type=str, default=None, help="Comma-separated columns to set to zero, e.g. nx,ny,nz")
+    return parser.parse_args()
+
+# Main function
+def main():
+    args = parse_args()
+
+    in_place = edit_columns(args.input, args.output,
+                            keep=parse_columns(args.keep),
+                            drop=parse_columns(args.drop),
+                            rename=parse_renames(args.rename),
+                            zero=parse_columns(args.zero))
+
+    if in_place:
+        print(f"Columns edited in place: {args.input}")
+    else:
+        print(f"Edited point cloud saved to: {args.output or args.input}")
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,11 @@
 import torch
 import MinkowskiEngine as ME
 from pcc_model import PCCModel
-from scipy.spatial import cKDTree
 import numpy as np
 import os
 import argparse
+from attribute_schema import AttributeSchema
+from spatial_index import SpatialIndex
 
 # Function to read PLY file with ID, extracting coordinates and IDs
 def read_ply_with_id(file_path):
@@ -80,7 +81,7 @@ def load_compressed_data(filename, device):
     return sparse_tensor, num_points
 
 # Function for encoding process
-def encoder_process(model_path, input_ply_path, output_dir):
+def encoder_process(model_path, input_ply_path, output_dir, index_cache=None):
     """Encoder process to compress point cloud data."""
     os.makedirs(output_dir, exist_ok=True)  # Ensure output directory exists
 
@@ -108,7 +109,7 @@ def encoder_process(model_path, input_ply_path, output_dir):
 
     out2_coords = out2.C.cpu().numpy()[:, 1:]  # Remove batch_id
     input_coords = coords.numpy()
-    kdtree = cKDTree(input_coords)
+    kdtree = SpatialIndex.load_or_build(input_coords, index_cache)
 
     k = 10
     used_ids = set()
@@ -139,7 +140,7 @@ def encoder_process(model_path, input_ply_path, output_dir):
     return filename_base
 
 # Function for decoding process
-def decoder_process(model_path, compressed_data_prefix, input_ply_path, output_ply_path, rho=1.0):
+def decoder_process(model_path, compressed_data_prefix, input_ply_path, output_ply_path, rho=1.0, index_cache=None):
     """Decoder process to reconstruct point cloud from compressed data."""
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     model = PCCModel().to(device)
@@ -161,7 +162,7 @@ def decoder_process(model_path, compressed_data_prefix, input_ply_path, output_p
     reconstructed_coords = out.C.cpu().numpy()[:, 1:]
 
     input_coords = coords.numpy()
-    kdtree = cKDTree(reconstructed_coords)
+    kdtree = SpatialIndex.load_or_build(reconstructed_coords, index_cache)
     distances, indices = kdtree.query(input_coords, k=1)
 
     matched_coords = reconstructed_coords[indices]
@@ -176,6 +177,8 @@ def parse_args():
     parser.add_argument('--model_path', type=str, required=True, help="Path to the trained model file")
     parser.add_argument('--input_dir', type=str, required=True, help="Directory containing the input PLY files")
     parser.add_argument('--output_dir', type=str, required=True, help="Directory to save the processed files")
+    parser.add_argument('--schema', type=str, default=None, help="Attribute schema file (default: schema.json in the input directory)")
+    parser.add_argument('--index_cache', type=str, default=None, help="Directory of cached spatial indexes, reused by repeated runs on the same scene")
     return parser.parse_args()
 
 # Main function
@@ -186,22 +189,18 @@ def main():
     output_dir = args.output_dir
     model_path = args.model_path
 
-    file_suffixes = [
-        'xyz_ascii_voxeltopc.ply', 'fdc012_ascii_voxeltopc.ply', 'fre012_ascii_voxeltopc.ply', 
-        'fre345_ascii_voxeltopc.ply', 'fre678_ascii_voxeltopc.ply', 'fre91011_ascii_voxeltopc.ply',
-        'fre121314_ascii_voxeltopc.ply', 'fre151617_ascii_voxeltopc.ply', 'fre181920_ascii_voxeltopc.ply',
-        'fre212223_ascii_voxeltopc.ply', 'fre242526_ascii_voxeltopc.ply', 'fre272829_ascii_voxeltopc.ply',
-        'fre303132_ascii_voxeltopc.ply', 'fre333435_ascii_voxeltopc.ply', 'fre363738_ascii_voxeltopc.ply',
-        'fre394041_ascii_voxeltopc.ply', 'fre424344_ascii_voxeltopc.ply', 'opacity_ascii_voxeltopc.ply',
-        'scale012_ascii_voxeltopc.ply', 'rot012_ascii_voxeltopc.ply', 'rot3_ascii_voxeltopc.ply'
-    ]
-
-    for file_suffix in file_suffixes:
-        input_ply_path = os.path.join(input_prefix, file_suffix)
-        compressed_data_prefix = encoder_process(model_path, input_ply_path, output_dir)
-
-        output_ply_path = os.path.join(output_dir, f"{file_suffix.replace('.ply', '_reconstructed.ply')}")
-        decoder_process(model_path, compressed_data_prefix, input_ply_path, output_ply_path, rho=1.0)
+    # Attribute groups written by attributes_spilt.py
+    schema = AttributeSchema.locate(input_prefix, args.schema)
+    os.makedirs(output_dir, exist_ok=True)
+    schema.save(output_dir)
+
+    for group in schema.groups:
+        input_ply_path = os.path.join(input_prefix, group.file_name('dedup'))
+        compressed_data_prefix = encoder_process(model_path, input_ply_path, output_dir, args.index_cache)
+
+        output_ply_path = os.path.join(output_dir, group.file_name('reconstructed'))
+        decoder_process(model_path, compressed_data_prefix, input_ply_path, output_ply_path, rho=1.0,
+                        index_cache=args.index_cache)
 
 if __name__ == "__main__":
     main()
@@ -1,10 +1,12 @@
 import torch
 import MinkowskiEngine as ME
 from pcc_model import PCCModel
-from scipy.spatial import cKDTree
 import numpy as np
 import os
 import argparse
+from attribute_schema import AttributeSchema
+from spatial_index import SpatialIndex
+from pipeline_executor import run_pipelined, print_stage_times
 
 # Function to read PLY file with ID, extracting coordinates and IDs
 def read_ply_with_id(file_path):
@@ -79,36 +81,31 @@ def load_compressed_data(filename, device):
 
     return sparse_tensor, num_points
 
-# Function for encoding process
-def encoder_process(model_path, input_ply_path, output_dir):
-    """Encoder process to compress point cloud data."""
-    os.makedirs(output_dir, exist_ok=True)  # Ensure output directory exists
-
-    filename_base = os.path.join(output_dir, os.path.basename(input_ply_path).split('.')[0])
-    encoder_output_ply_path = f"{filename_base}_encoder.ply"
-
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+# Function to load the trained model
+def load_model(model_path, device):
+    """Load the trained PCCModel in evaluation mode."""
     model = PCCModel().to(device)
     checkpoint = torch.load(model_path, map_location=device)
     model.load_state_dict(checkpoint['model'])
     model.eval()
+    return model
 
-    coords, ids = read_ply_with_id(input_ply_path)
+# Function to build the sparse input tensor of a point cloud
+def sparse_input_tensor(coords, device):
+    """Wrap integer voxel coordinates (batch 0) with unit features as a MinkowskiEngine sparse tensor."""
     features = torch.ones((coords.shape[0], 1)).to(device)
     batch_id = torch.zeros(coords.shape[0], dtype=torch.int32).unsqueeze(1)
     coords_with_batch = torch.cat([batch_id, coords.int()], dim=1)
-    sparse_input = ME.SparseTensor(features=features, coordinates=coords_with_batch, device=device)
+    return ME.SparseTensor(features=features, coordinates=coords_with_batch, device=device)
 
-    with torch.no_grad():
-        encoder_outputs = model.encoder(sparse_input)
-        out2 = encoder_outputs[0]  # Encoder's last layer output
-        num_points = [len(gt) for gt in encoder_outputs[1:] + [sparse_input]]
+# Function to give every encoder output voxel the ID of a distinct nearby input point
+def assign_encoder_ids(out2_coords, input_coords, ids, index_cache=None):
+    """
+    Assign each encoder output voxel the ID of its nearest input point not used yet.
 
-    save_compressed_data(filename_base, out2, num_points)
-
-    out2_coords = out2.C.cpu().numpy()[:, 1:]  # Remove batch_id
-    input_coords = coords.numpy()
-    kdtree = cKDTree(input_coords)
+    :return: Encoder output coordinates and their IDs, sorted by ID
+    """
+    kdtree = SpatialIndex.load_or_build(input_coords, index_cache)
 
     k = 10
     used_ids = set()
@@ -129,8 +126,38 @@ def encoder_process(model_path, input_ply_path, output_dir):
                 k += 1
 
     sorted_indices = np.argsort(id_mapping)
-    sorted_coords = out2_coords[sorted_indices]
-    sorted_ids = np.array(id_mapping)[sorted_indices]
+    return out2_coords[sorted_indices], np.array(id_mapping)[sorted_indices]
+
+# Function to move every input point to its nearest reconstructed voxel
+def match_reconstruction(reconstructed_coords, input_coords, index_cache=None):
+    """Return the reconstructed voxel nearest to every input point."""
+    kdtree = SpatialIndex.load_or_build(reconstructed_coords, index_cache)
+    distances, indices = kdtree.query(input_coords, k=1)
+    return reconstructed_coords[indices]
+
+# Function for encoding process
+def encoder_process(model_path, input_ply_path, output_dir, index_cache=None):
+    """Encoder process to compress point cloud data."""
+    os.makedirs(output_dir, exist_ok=True)  # Ensure output directory exists
+
+    filename_base = os.path.join(output_dir, os.path.basename(input_ply_path).split('.')[0])
+    encoder_output_ply_path = f"{filename_base}_encoder.ply"
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    model = load_model(model_path, device)
+
+    coords, ids = read_ply_with_id(input_ply_path)
+    sparse_input = sparse_input_tensor(coords, device)
+
+    with torch.no_grad():
+        encoder_outputs = model.encoder(sparse_input)
+        out2 = encoder_outputs[0]  # Encoder's last layer output
+        num_points = [len(gt) for gt in encoder_outputs[1:] + [sparse_input]]
+
+    save_compressed_data(filename_base, out2, num_points)
+
+    out2_coords = out2.C.cpu().numpy()[:, 1:]  # Remove batch_id
+    sorted_coords, sorted_ids = assign_encoder_ids(out2_coords, coords.numpy(), ids, index_cache)
 
     write_ply_with_id(encoder_output_ply_path, torch.tensor(sorted_coords),
                       torch.tensor(sorted_ids, dtype=torch.int32), input_ply_path)
@@ -139,13 +166,10 @@ def encoder_process(model_path, input_ply_path, output_dir):
     return filename_base
 
 # Function for decoding process
-def decoder_process(model_path, compressed_data_prefix, input_ply_path, output_ply_path, rho=1.0):
+def decoder_process(model_path, compressed_data_prefix, input_ply_path, output_ply_path, rho=1.0, index_cache=None):
     """Decoder process to reconstruct point cloud from compressed data."""
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-    model = PCCModel().to(device)
-    checkpoint = torch.load(model_path, map_location=device)
-    model.load_state_dict(checkpoint['model'])
-    model.eval()
+    model = load_model(model_path, device)
 
     coords, ids = read_ply_with_id(input_ply_path)
 
@@ -160,22 +184,89 @@ def decoder_process(model_path, compressed_data_prefix, input_ply_path, output_p
 
     reconstructed_coords = out.C.cpu().numpy()[:, 1:]  # Exclude batch_id column
 
-    input_coords = coords.numpy()
-    kdtree = cKDTree(reconstructed_coords)
-    distances, indices = kdtree.query(input_coords, k=1)
-
-    matched_coords = reconstructed_coords[indices]
+    matched_coords = match_reconstruction(reconstructed_coords, coords.numpy(), index_cache)
     matched_ids = ids
 
     write_ply_with_id(output_ply_path, torch.tensor(matched_coords), matched_ids, input_ply_path)
     print(f"Reconstructed point cloud saved to: {output_ply_path}")
 
+# Function to read one group for the pipelined run (reader thread)
+def load_group(paths):
+    """Parse the deduplicated group file; paths is (input PLY, reconstructed PLY)."""
+    input_ply_path, output_ply_path = paths
+    coords, ids = read_ply_with_id(input_ply_path)
+    return input_ply_path, output_ply_path, coords, ids
+
+# Function to encode and decode one group in memory (calling thread)
+def infer_group(model, device, loaded, rho=1.0):
+    """
+    Run the encoder and the decoder of one group without the round trip through the .npy files.
+
+    The decoder gets the encoder output tensor directly, which has the coordinates, features and
+    stride load_compressed_data would rebuild from the saved files.
+    """
+    input_ply_path, output_ply_path, coords, ids = loaded
+    sparse_input = sparse_input_tensor(coords, device)
+
+    with torch.no_grad():
+        encoder_outputs = model.encoder(sparse_input)
+        out2 = encoder_outputs[0]  # Encoder's last layer output
+        num_points = [len(gt) for gt in encoder_outputs[1:] + [sparse_input]]
+
+        decoder_num_points = list(num_points)
+        decoder_num_points[-1] = int(rho * decoder_num_points[-1])
+        y_q, _ = model.get_likelihood(out2, quantize_mode="symbols")
+        out_cls_list, out = model.decoder(y_q, [[num] for num in decoder_num_points],
+                                          ground_truth_list=[None] * 3, training=False)
+
+    reconstructed_coords = out.C.cpu().numpy()[:, 1:]  # Exclude batch_id column
+    return input_ply_path, output_ply_path, coords, ids, out2, num_points, reconstructed_coords
+
+# Function to write the outputs of one group (writer thread)
+def store_group(result, output_dir, index_cache=None):
+    """Write the compressed data, the encoder output and the reconstructed group, as the sequential run does."""
+    input_ply_path, output_ply_path, coords, ids, out2, num_points, reconstructed_coords = result
+    filename_base = os.path.join(output_dir, os.path.basename(input_ply_path).split('.')[0])
+
+    save_compressed_data(filename_base, out2, num_points)
+
+    out2_coords = out2.C.cpu().numpy()[:, 1:]  # Remove batch_id
+    sorted_coords, sorted_ids = assign_encoder_ids(out2_coords, coords.numpy(), ids, index_cache)
+    write_ply_with_id(f"{filename_base}_encoder.ply", torch.tensor(sorted_coords),
+                      torch.tensor(sorted_ids, dtype=torch.int32), input_ply_path)
+
+    matched_coords = match_reconstruction(reconstructed_coords, coords.numpy(), index_cache)
+    write_ply_with_id(output_ply_path, torch.tensor(matched_coords), ids, input_ply_path)
+    print(f"Reconstructed point cloud saved to: {output_ply_path}")
+
+# Function to process all groups with overlapped reading, inference and writing
+def pipelined_process(model_path, group_paths, output_dir, queue_slots=2, index_cache=None):
+    """
+    Reconstruct all groups with the model loaded once: while group i is in inference, group i+1
+    is parsed and group i-1 is written in background threads (see pipeline_executor.py).
+
+    :param group_paths: List of (deduplicated input PLY, reconstructed output PLY) pairs
+    :param queue_slots: Groups that may wait between two stages; bounds the memory
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    model = load_model(model_path, device)
+    times = run_pipelined(group_paths, load_group,
+                          lambda loaded: infer_group(model, device, loaded),
+                          lambda result: store_group(result, output_dir, index_cache),
+                          queue_slots)
+    print_stage_times(times)
+
 # Set up command line arguments
 def parse_args():
     parser = argparse.ArgumentParser(description="Point Cloud Compression and Reconstruction")
     parser.add_argument('--model_path', type=str, required=True, help="Path to the trained model file")
     parser.add_argument('--input_dir', type=str, required=True, help="Directory containing the input PLY files")
     parser.add_argument('--output_dir', type=str, required=True, help="Directory to save the processed files")
+    parser.add_argument('--schema', type=str, default=None, help="Attribute schema file (default: schema.json in the input directory)")
+    parser.add_argument('--index_cache', type=str, default=None, help="Directory of cached spatial indexes, reused by repeated runs on the same scene")
+    parser.add_argument('--pipelined', action='store_true', help="Overlap reading and writing of the neighbouring groups with the inference of the current one")
+    parser.add_argument('--queue_slots', type=int, default=2, help="Groups that may wait between two pipeline stages (default is 2); bounds the memory")
     return parser.parse_args()
 
 # Main function
@@ -186,22 +277,24 @@ def main():
     output_dir = args.output_dir
     model_path = args.model_path
 
-    file_suffixes = [
-        'xyz_ascii_voxeltopc.ply', 'fdc012_ascii_voxeltopc.ply', 'fre012_ascii_voxeltopc.ply', 
-        'fre345_ascii_voxeltopc.ply', 'fre678_ascii_voxeltopc.ply', 'fre91011_ascii_voxeltopc.ply',
-        'fre121314_ascii_voxeltopc.ply', 'fre151617_ascii_voxeltopc.ply', 'fre181920_ascii_voxeltopc.ply',
-        'fre212223_ascii_voxeltopc.ply', 'fre242526_ascii_voxeltopc.ply', 'fre272829_ascii_voxeltopc.ply',
-        'fre303132_ascii_voxeltopc.ply', 'fre333435_ascii_voxeltopc.ply', 'fre363738_ascii_voxeltopc.ply',
-        'fre394041_ascii_voxeltopc.ply', 'fre424344_ascii_voxeltopc.ply', 'opacity_ascii_voxeltopc.ply',
-        'scale012_ascii_voxeltopc.ply', 'rot012_ascii_voxeltopc.ply', 'rot3_ascii_voxeltopc.ply'
-    ]
-
-    for file_suffix in file_suffixes:
-        input_ply_path = os.path.join(input_prefix, file_suffix)
-        compressed_data_prefix = encoder_process(model_path, input_ply_path, output_dir)
-
-        output_ply_path = os.path.join(output_dir, f"{file_suffix.replace('.ply', '_reconstructed.ply')}")
-        decoder_process(model_path, compressed_data_prefix, input_ply_path, output_ply_path, rho=1.0)
+    # Attribute groups written by attributes_spilt.py
+    schema = AttributeSchema.locate(input_prefix, args.schema)
+    os.makedirs(output_dir, exist_ok=True)
+    schema.save(output_dir)
+
+    if args.pipelined:
+        group_paths = [(os.path.join(input_prefix, group.file_name('dedup')),
+                        os.path.join(output_dir, group.file_name('reconstructed'))) for group in schema.groups]
+        pipelined_process(model_path, group_paths, output_dir, args.queue_slots, args.index_cache)
+        return
+
+    for group in schema.groups:
+        input_ply_path = os.path.join(input_prefix, group.file_name('dedup'))
+        compressed_data_prefix = encoder_process(model_path, input_ply_path, output_dir, args.index_cache)
+
+        output_ply_path = os.path.join(output_dir, group.file_name('reconstructed'))
+        decoder_process(model_path, compressed_data_prefix, input_ply_path, output_ply_path, rho=1.0,
+                        index_cache=args.index_cache)
 
 if __name__ == "__main__":
     main()
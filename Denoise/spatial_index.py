@@ -0,0 +1,130 @@
+import os
+import shutil
+import pickle
+import hashlib
+import numpy as np
+from scipy.spatial import cKDTree
+
+# Bits per axis of the Morton (Z-order) codes; 3 x 21 bits fit in a uint64
+MORTON_BITS = 21
+
+# Function to hash the coordinates of a point cloud
+def coordinate_hash(coords):
+    """Hash the float32 coordinates of a point cloud; equal clouds share cached indexes."""
+    coords = np.ascontiguousarray(coords, dtype=np.float32)
+    digest = hashlib.sha1(str(coords.shape).encode('ascii'))
+    digest.update(memoryview(coords).cast('B'))
+    return digest.hexdigest()[:16]
+
+# Function to spread the lower 21 bits of an integer so two zero bits follow each bit
+def spread_bits(values):
+    """Insert two zero bits after each of the lower 21 bits (the 3D Morton 'part1by2' step)."""
+    v = values.astype(np.uint64) & np.uint64(0x1fffff)
+    v = (v | (v << np.uint64(32))) & np.uint64(0x1f00000000ffff)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x1f0000ff0000ff)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x100f00f00f00f00f)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x10c30c30c30c30c3)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x1249249249249249)
+    return v
+
+# Function to compute Morton (Z-order) codes of a point cloud
+def morton_codes(coords, bits=MORTON_BITS):
+    """
+    Compute the Morton code of every point.
+
+    The coordinates are quantized to 2^bits steps over their bounding box and the bits of x, y
+    and z are interleaved, so points that are close in space get close codes.
+
+    :param coords: (N, 3) coordinates
+    :param bits: Bits per axis (at most 21)
+    :return: (N,) uint64 codes
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    if len(coords) == 0:
+        return np.empty(0, dtype=np.uint64)
+    low = coords.min(axis=0)
+    extent = coords.max(axis=0) - low
+    scale = np.where(extent > 0, (2 ** bits - 1) / np.where(extent > 0, extent, 1.0), 0.0)
+    quantized = ((coords - low) * scale).astype(np.uint64)
+    return spread_bits(quantized[:, 0]) | (spread_bits(quantized[:, 1]) << np.uint64(1)) | (spread_bits(quantized[:, 2]) << np.uint64(2))
+
+# Function to compute the Morton order of a point cloud
+def morton_order(coords, bits=MORTON_BITS):
+    """Return the permutation that sorts the points by Morton code (stable for equal codes)."""
+    return np.argsort(morton_codes(coords, bits), kind='stable')
+
+# Spatial index of one point cloud, persisted on disk and shared between stages
+class SpatialIndex:
+    """
+    Morton order and a k-d tree of the Morton-sorted points.
+
+    Queries return indices into the original (unsorted) points, so the index can replace a
+    cKDTree built on the original coordinates.
+    """
+
+    def __init__(self, order, tree):
+        self.order = order
+        self.tree = tree
+
+    @classmethod
+    def build(cls, coords):
+        """Build the index of (N, 3) coordinates."""
+        coords = np.asarray(coords, dtype=np.float64)
+        order = np.argsort(morton_codes(coords), kind='stable')
+        return cls(order, cKDTree(coords[order]))
+
+    @property
+    def size(self):
+        return len(self.order)
+
+    def query(self, x, k=1, **kwargs):
+        """
+        Same as cKDTree.query, but the returned indices refer to the original points.
+
+        Missing neighbours (k larger than the cloud, or distance_upper_bound) keep the index N.
+        """
+        distances, indices = self.tree.query(x, k=k, **kwargs)
+        indices = np.asarray(indices)
+        mapped = np.where(indices < self.size, self.order[np.minimum(indices, self.size - 1)], self.size)
+        return distances, mapped
+
+    def save(self, directory):
+        """Save the index as order.npy and tree.pkl in directory."""
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, 'order.npy'), self.order)
+        with open(os.path.join(directory, 'tree.pkl'), 'wb') as f:
+            pickle.dump(self.tree, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, directory):
+        """Load a saved index; the order is memory-mapped, the pickled tree is read into memory."""
+        order = np.load(os.path.join(directory, 'order.npy'), mmap_mode='r')
+        with open(os.path.join(directory, 'tree.pkl'), 'rb') as f:
+            tree = pickle.load(f)
+        return cls(order, tree)
+
+    @classmethod
+    def load_or_build(cls, coords, cache_dir=None):
+        """
+        Return the index of a point cloud, loading it from cache_dir/<coordinate hash> when cached.
+
+        :param coords: (N, 3) coordinates
+        :param cache_dir: Directory of cached indexes, or None to always build
+        :return: SpatialIndex
+        """
+        if cache_dir is None:
+            return cls.build(coords)
+
+        directory = os.path.join(cache_dir, f"index_{coordinate_hash(coords)}")
+        if os.path.exists(os.path.join(directory, 'tree.pkl')):
+            return cls.load(directory)
+
+        index = cls.build(coords)
+        # Save into a temporary directory first, so a crashed or concurrent run never leaves a partial index
+        temp_directory = f"{directory}.tmp{os.getpid()}"
+        index.save(temp_directory)
+        try:
+            os.rename(temp_directory, directory)
+        except OSError:
+            shutil.rmtree(temp_directory, ignore_errors=True)  # Another run saved the same index first
+        return index
@@ -2,6 +2,7 @@ import numpy as np
 import pandas as pd
 import os
 import argparse
+from attribute_schema import AttributeSchema
 
 # Function to read PLY file and separate header and data
 def read_ply(file_path):
@@ -18,17 +19,22 @@ def read_ply(file_path):
     return header, data
 
 # Function to normalize coordinates and voxelize the data while keeping the IDs
-def normalize_and_voxelize(data, voxel_resolution):
-    """Normalize coordinates and voxelize the data while retaining IDs."""
+def normalize_and_voxelize(data, voxel_resolution, bounds=None):
+    """
+    Normalize coordinates and voxelize the data while retaining IDs.
+
+    :param bounds: Optional (xyz_min, xyz_max) to normalize with instead of the data's own range,
+                   e.g. the range of the full point cloud when only a subset is voxelized
+    """
     # Extract XYZ coordinates and ID column
     xyz = data.iloc[:, :3].values
     attributes = data.iloc[:, 3:-1].values  # Other attributes
     ids = data.iloc[:, -1].values.astype(int)  # Ensure IDs are integers
 
     # Normalize to [0, 1] range
-    xyz_min = xyz.min(axis=0)
-    xyz_max = xyz.max(axis=0)
-    xyz_normalized = (xyz - xyz_min) / (xyz_max - xyz_min)
+    xyz_min, xyz_max = bounds if bounds is not None else (xyz.min(axis=0), xyz.max(axis=0))
+    extent = np.where(xyz_max > xyz_min, xyz_max - xyz_min, 1.0)  # Constant (padding) columns map to 0
+    xyz_normalized = (xyz - xyz_min) / extent
 
     # Scale to voxel grid
     voxel_grid_coords = (xyz_normalized * voxel_resolution).astype(int)
@@ -37,6 +43,64 @@ def normalize_and_voxelize(data, voxel_resolution):
     voxelized_data = np.hstack((voxel_grid_coords, attributes, ids.reshape(-1, 1)))
     return voxelized_data
 
+# Function to compute the bounds of a stream of records
+def chunk_bounds(chunks):
+    """
+    Cheap pre-pass of the streaming voxelization: the min and max of the first three fields.
+
+    :param chunks: Iterable of structured records
+    :return: (xyz_min, xyz_max) as float64 arrays
+    """
+    xyz_min = np.full(3, np.inf)
+    xyz_max = np.full(3, -np.inf)
+    for records in chunks:
+        if len(records) == 0:
+            continue
+        xyz = np.stack([records[name] for name in records.dtype.names[:3]], axis=1).astype(np.float64)
+        xyz_min = np.minimum(xyz_min, xyz.min(axis=0))
+        xyz_max = np.maximum(xyz_max, xyz.max(axis=0))
+    return xyz_min, xyz_max
+
+# Function to compute the bounds of every group in one pass over the split
+def split_bounds(split_stream):
+    """
+    chunk_bounds of every group of an attributes_spilt.split_chunks stream, in a single pass.
+    Unlike chunk_bounds over each of group_streams(...), no split chunk is buffered.
+
+    :return: {group name: (xyz_min, xyz_max)}
+    """
+    bounds = {}
+    for groups in split_stream:
+        for name, records in groups.items():
+            xyz_min, xyz_max = chunk_bounds([records])
+            if name in bounds:
+                xyz_min, xyz_max = np.minimum(bounds[name][0], xyz_min), np.maximum(bounds[name][1], xyz_max)
+            bounds[name] = (xyz_min, xyz_max)
+    return bounds
+
+# Function to voxelize a stream of records
+def voxelize_chunks(chunks, voxel_resolution, bounds):
+    """
+    Streaming version of normalize_and_voxelize.
+
+    :param chunks: Iterable of structured records whose first three fields are the coordinates
+    :param voxel_resolution: Resolution of the voxel grid
+    :param bounds: (xyz_min, xyz_max) from a chunk_bounds pre-pass over the same records
+    :return: Generator of records with the first three fields as int32 voxel coordinates
+    """
+    xyz_min, xyz_max = bounds
+    extent = np.where(xyz_max > xyz_min, xyz_max - xyz_min, 1.0)  # Constant (padding) columns map to 0
+    for records in chunks:
+        names = records.dtype.names
+        dtype = np.dtype([(name, '<i4' if i < 3 else records.dtype.fields[name][0]) for i, name in enumerate(names)])
+        voxelized = np.empty(len(records), dtype=dtype)
+        for i, name in enumerate(names):
+            if i < 3:
+                voxelized[name] = ((records[name].astype(np.float64) - xyz_min[i]) / extent[i] * voxel_resolution).astype(int)
+            else:
+                voxelized[name] = records[name]
+        yield voxelized
+
 # Function to write the processed voxelized data to a PLY file
 def write_ply(output_path, header, voxelized_data):
     """Write processed voxelized data to a PLY file."""
@@ -56,6 +120,7 @@ def parse_args():
     parser.add_argument('--input_dir', type=str, required=True, help="Directory containing input PLY files")
     parser.add_argument('--output_dir', type=str, required=True, help="Directory to save voxelized PLY files")
     parser.add_argument('--voxel_resolution', type=int, default=7168, help="Resolution of the voxel grid")
+    parser.add_argument('--schema', type=str, default=None, help="Attribute schema file (default: schema.json in the input directory)")
     return parser.parse_args()
 
 # Main function
@@ -67,19 +132,15 @@ def main():
     output_dir = args.output_dir
     voxel_resolution = args.voxel_resolution
 
-    # List of input PLY file suffixes
-    file_suffixes = [
-        'xyz_ascii.ply', 'nxyz_ascii.ply', 'fdc012_ascii.ply', 'fre012_ascii.ply', 'fre345_ascii.ply',
-        'fre678_ascii.ply', 'fre91011_ascii.ply', 'fre121314_ascii.ply', 'fre151617_ascii.ply', 'fre181920_ascii.ply',
-        'fre212223_ascii.ply', 'fre242526_ascii.ply', 'fre272829_ascii.ply', 'fre303132_ascii.ply', 'fre333435_ascii.ply',
-        'fre363738_ascii.ply', 'fre394041_ascii.ply', 'fre424344_ascii.ply', 'fre4344op_ascii.ply', 'scale012_ascii.ply',
-        'rot012_ascii.ply', 'rot123_ascii.ply'
-    ]
+    # Attribute groups written by attributes_spilt.py
+    schema = AttributeSchema.locate(input_prefix, args.schema)
+    os.makedirs(output_dir, exist_ok=True)
+    schema.save(output_dir)
 
     # Process each file
-    for file_suffix in file_suffixes:
-        input_ply_path = os.path.join(input_prefix, file_suffix)
-        output_ply_path = os.path.join(output_dir, file_suffix.replace('.ply', '_voxel.ply'))
+    for group in schema.groups:
+        input_ply_path = os.path.join(input_prefix, group.file_name('split'))
+        output_ply_path = os.path.join(output_dir, group.file_name('voxel'))
 
         # Read, voxelize, and write output
         header, data = read_ply(input_ply_path)
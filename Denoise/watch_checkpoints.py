@@ -0,0 +1,304 @@
+import os
+import time
+import json
+import errno
+import queue
+import ctypes
+import select
+import struct
+import fnmatch
+import hashlib
+import argparse
+import threading
+import ctypes.util
+from binary_ply import read_ply_header, vertex_dtype, write_chunks
+from filter_server import DEFAULT_PARAMS, FilterEngines, filter_cloud
+
+# Checkpoints written by the gaussian-splatting trainer, relative to any directory of an output tree
+CHECKPOINT_PATTERN = os.path.join('*', 'point_cloud', 'iteration_*', 'point_cloud.ply')
+
+# Name of the state file (content hashes of the processed checkpoints) in the output directory
+STATE_FILE_NAME = 'watch_state.json'
+
+# inotify event flags (linux/inotify.h)
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_Q_OVERFLOW = 0x4000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0x800
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+# Header of an inotify event: watch descriptor, mask, cookie, length of the name
+EVENT_HEADER = struct.Struct('iIII')
+
+# Function to tell whether a path is a trainer checkpoint
+def is_checkpoint(path):
+    return fnmatch.fnmatch(path, CHECKPOINT_PATTERN)
+
+# Function to list the checkpoints under a directory tree
+def scan_checkpoints(root):
+    """Every point_cloud/iteration_*/point_cloud.ply below root."""
+    found = []
+    for directory, _, files in os.walk(root):
+        path = os.path.join(directory, 'point_cloud.ply')
+        if 'point_cloud.ply' in files and is_checkpoint(path):
+            found.append(path)
+    return found
+
+# Function to name the result of a checkpoint
+def result_name(path, root, prefix_root=False):
+    """
+    <scene>_iteration_<n>.ply from the path of the checkpoint relative to the watched directory.
+    The name of the watched directory is the scene when it is a model directory itself, and is
+    prefixed with prefix_root (several watched directories).
+    """
+    parts = os.path.relpath(os.path.dirname(path), root).split(os.sep)
+    scene = parts[:-2]  # Without point_cloud/iteration_<n>
+    if prefix_root or not scene:
+        scene = [os.path.basename(root)] + scene
+    return '_'.join(scene + [parts[-1]]) + '.ply'
+
+# Function to check that a checkpoint has been written completely
+def is_complete(path):
+    """
+    A binary PLY is complete once the file holds all the records its header announces; an ASCII
+    PLY (or a header still being written) is only trusted once it stopped changing.
+    """
+    try:
+        _, file_format, vertex_count, properties, data_offset = read_ply_header(path)
+    except (OSError, ValueError):
+        return False
+    if file_format == 'ascii':
+        return True
+    return os.path.getsize(path) >= data_offset + vertex_count * vertex_dtype(properties).itemsize
+
+# Function to hash the content of a file
+def content_hash(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Recursive directory watch through the Linux inotify API
+class InotifyWatcher:
+    """
+    Watch directory trees with inotify (through ctypes, no extra package). New sub-directories
+    are watched as they appear and scanned, so files created before their watch are not missed.
+    """
+
+    def __init__(self, roots):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.libc = libc
+        self.fd = libc.inotify_init1(IN_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}
+        self.roots = roots
+        for root in roots:
+            self.add_tree(root)
+
+    def add_tree(self, root):
+        """Watch root and every directory below it; return the checkpoints already there."""
+        for directory, _, _ in os.walk(root):
+            descriptor = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if descriptor < 0 and ctypes.get_errno() == errno.ENOENT:
+                continue  # Removed meanwhile
+            if descriptor < 0:
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed on {directory} (raise fs.inotify.max_user_watches?)")
+            self.directories[descriptor] = directory
+        return scan_checkpoints(root)
+
+    def changes(self, timeout):
+        """Paths of the checkpoints that changed within timeout seconds (all of them after an event overflow)."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        changed = []
+        buffer = os.read(self.fd, 1 << 16)
+        offset = 0
+        while offset < len(buffer):
+            descriptor, mask, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+            name = buffer[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                return [path for root in self.roots for path in scan_checkpoints(root)]
+            if descriptor not in self.directories:
+                continue
+            path = os.path.join(self.directories[descriptor], os.fsdecode(name))
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                changed += self.add_tree(path)
+            elif is_checkpoint(path):
+                changed.append(path)
+        return changed
+
+# Directory watch by periodic scans, for file systems or platforms without inotify
+class PollingWatcher:
+    """Report the checkpoints whose size or modification time changed since the previous scan."""
+
+    def __init__(self, roots, interval):
+        self.roots = roots
+        self.interval = interval
+        self.seen = {}
+
+    def changes(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        changed = []
+        for root in self.roots:
+            for path in scan_checkpoints(root):
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                signature = (stat.st_size, stat.st_mtime_ns)
+                if self.seen.get(path) != signature:
+                    self.seen[path] = signature
+                    changed.append(path)
+        return changed
+
+# Processed checkpoints, remembered across restarts
+class CheckpointState:
+    """
+    Content hashes of the checkpoints already filtered (or queued), saved in the output directory.
+    A checkpoint with the content of one seen before is skipped, e.g. a copy or a rewrite.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.results = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.results = json.load(f)
+
+    def claim(self, digest, source):
+        """Record a new hash; return False if the content was seen before."""
+        with self.lock:
+            if digest in self.results:
+                return False
+            self.results[digest] = {'source': source, 'output': None}
+            return True
+
+    def finish(self, digest, output_path, error=None):
+        with self.lock:
+            if error:
+                del self.results[digest]  # Retried if the checkpoint changes or the watcher restarts
+            else:
+                self.results[digest]['output'] = output_path
+            temporary = f"{self.path}.tmp"
+            with open(temporary, 'w') as f:
+                json.dump(dict((key, value) for key, value in self.results.items() if value['output']), f, indent=2)
+            os.replace(temporary, self.path)
+
+# Function to filter the queued checkpoints (worker thread)
+def filter_worker(work, engines, params, state, output_dir):
+    """Take (path, name, hash, first event time) items and write <output_dir>/<name>; None stops the worker."""
+    while True:
+        item = work.get()
+        if item is None:
+            return
+        path, name, digest, detected = item
+        output_path = os.path.join(output_dir, name)
+        temporary = f"{output_path}.partial"
+        start = time.time()
+        try:
+            total, kept_ids, records = filter_cloud(path, engines, params)
+            write_chunks(temporary, records)
+            os.replace(temporary, output_path)  # Readers never see a partial result
+            state.finish(digest, output_path)
+            print(f"{path}: kept {len(kept_ids)} of {total} points in {time.time() - start:.2f}s, "
+                  f"ready {time.time() - detected:.2f}s after the checkpoint appeared: {output_path}")
+        except Exception as error:
+            state.finish(digest, output_path, error)
+            print(f"{path}: failed: {type(error).__name__}: {error}")
+
+# Set up command line arguments
+def parse_args():
+    parser = argparse.ArgumentParser(description="Watch gaussian-splatting output trees and filter every new point_cloud/iteration_*/point_cloud.ply.")
+    parser.add_argument('--watch_dirs', type=str, nargs='+', required=True, help="Output trees of the trainer to watch")
+    parser.add_argument('--output_dir', type=str, required=True, help="Directory to save the filtered checkpoints as <scene>_iteration_<n>.ply")
+    parser.add_argument('--model_path', type=str, default=None, help="Trained model file, loaded once (default: occupancy engine)")
+    parser.add_argument('--voxel_resolution', type=int, default=7168, help="Resolution of the voxel grid")
+    parser.add_argument('--sh_degree', type=int, default=None, help="SH degree to keep (0-3)")
+    parser.add_argument('--settle', type=float, default=1.0, help="Seconds without changes before a complete checkpoint is queued (default is 1)")
+    parser.add_argument('--max_pending', type=int, default=8, help="Checkpoints that may wait for a worker; the watcher waits when full (default is 8)")
+    parser.add_argument('--workers', type=int, default=1, help="Checkpoints filtered at a time (default is 1)")
+    parser.add_argument('--polling', action='store_true', help="Scan periodically instead of using inotify (e.g. on network file systems)")
+    parser.add_argument('--poll_interval', type=float, default=2.0, help="Seconds between scans in polling mode (default is 2)")
+    parser.add_argument('--once', action='store_true', help="Filter the checkpoints already present and exit")
+    return parser.parse_args()
+
+# Main function
+def main():
+    args = parse_args()
+    roots = [os.path.abspath(root) for root in args.watch_dirs]
+    if len(set(os.path.basename(root) for root in roots)) < len(roots):
+        raise SystemExit("The watched directories must have different names, which prefix the result names")
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    engines = FilterEngines(args.model_path)
+    params = dict(DEFAULT_PARAMS, voxel_resolution=args.voxel_resolution, sh_degree=args.sh_degree)
+    state = CheckpointState(os.path.join(args.output_dir, STATE_FILE_NAME))
+    work = queue.Queue(maxsize=args.max_pending)
+    workers = [threading.Thread(target=filter_worker, args=(work, engines, params, state, args.output_dir), daemon=True)
+               for _ in range(args.workers)]
+    for worker in workers:
+        worker.start()
+
+    watcher = None
+    if not args.once and not args.polling:
+        try:
+            watcher = InotifyWatcher(roots)
+            print(f"Watching {len(watcher.directories)} directories with inotify")
+        except (OSError, AttributeError) as error:
+            print(f"inotify unavailable ({error}); polling every {args.poll_interval}s")
+    if watcher is None and not args.once:
+        watcher = PollingWatcher(roots, args.poll_interval)
+
+    # Path -> (time of the first and of the last change); the existing checkpoints count as settled
+    pending = dict((path, (time.time(), 0.0)) for root in roots for path in scan_checkpoints(root))
+    names = {}  # Result name -> checkpoint, so two checkpoints never write the same file
+    try:
+        while pending or not args.once:
+            if watcher is not None:
+                for path in watcher.changes(args.settle / 2 if pending else args.poll_interval):
+                    pending[path] = (pending.get(path, (time.time(), 0.0))[0], time.time())
+
+            # Debounce: queue the checkpoints that stopped changing and hold all their records
+            now = time.time()
+            for path, (detected, changed) in list(pending.items()):
+                if now - changed < args.settle:
+                    continue
+                if not os.path.exists(path):
+                    del pending[path]
+                    continue
+                if not is_complete(path):
+                    if args.once:
+                        print(f"Skipped {path}: incomplete")
+                        del pending[path]
+                    else:
+                        pending[path] = (detected, now)  # Still being written; check again later
+                    continue
+                del pending[path]
+                root = [root for root in roots if path.startswith(root + os.sep)][0]
+                name = result_name(path, root, len(roots) > 1)
+                if names.setdefault(name, path) != path:
+                    print(f"Skipped {path}: its result name {name} is already used by {names[name]}")
+                    continue
+                digest = content_hash(path)
+                if not state.claim(digest, path):
+                    print(f"Skipped {path}: same content as a checkpoint seen before")
+                    continue
+                work.put((path, name, digest, detected))  # Blocks while the queue is full
+                print(f"Queued {path} ({work.qsize()} waiting)")
+    except KeyboardInterrupt:
+        pass
+    for _ in workers:
+        work.put(None)
+    for worker in workers:
+        worker.join()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,430 @@
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import traceback
+import multiprocessing
+from attribute_schema import AttributeSchema, PAD_COLUMN
+from binary_ply import read_ply_header
+from batch_runner import collect_inputs
+
+# Stages of a scene in pipeline order; split and fusion run once per scene, the others once per group
+STAGES = ['split', 'voxelize', 'dedup', 'reconstruct', 'devoxelize', 'fusion']
+
+# Group name of the scene-level tasks
+SCENE_GROUP = 'all'
+
+# Error recorded for the tasks downstream of a failed task
+DEPENDENCY_FAILED = 'a dependency failed'
+
+# Sub-directories of a queue directory
+QUEUE_DIRS = ('tasks', 'claims', 'done', 'failed', 'errors', 'clock')
+
+# Models loaded by this worker process, by model path
+MODELS = {}
+
+# Function to get the ID of a task
+def task_id(scene, stage, group):
+    """File name stem of a task, e.g. chair.voxelize.fdc012 (the stage index keeps the files in pipeline order)."""
+    return f"{scene}.{STAGES.index(stage)}{stage}.{group}"
+
+# Function to write a JSON file so that readers never see it half-written
+def write_json_atomic(path, state):
+    """Write to a temporary file and rename it into place (atomic on POSIX and NFS)."""
+    temporary = f"{path}.{socket.gethostname()}.{os.getpid()}.tmp"
+    with open(temporary, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(temporary, path)
+
+# Function to load the model once per worker process
+def worker_model(model_path):
+    """Return (model, device), loading the model on the first reconstruct task of this process."""
+    if model_path not in MODELS:
+        import torch
+        from repc5 import load_model
+        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        MODELS[model_path] = (load_model(model_path, device), device)
+    return MODELS[model_path]
+
+# Function to build the task graph of one scene
+def scene_tasks(scene, input_path, scene_dir, output_path, params):
+    """
+    Tasks of the Denoise pipeline for one scene: split, then voxelize -> dedup -> reconstruct ->
+    devoxelize for every attribute group, then fusion once all groups are devoxelized.
+
+    :return: List of task dicts (id, scene, group, stage, deps, paths and parameters)
+    """
+    schema = AttributeSchema.from_ply(input_path, params['sh_degree'])
+    split = task_id(scene, 'split', SCENE_GROUP)
+    tasks = [{'id': split, 'stage': 'split', 'group': SCENE_GROUP, 'deps': []}]
+    last = []
+    for group in schema.groups:
+        previous = split
+        for stage in STAGES[1:-1]:
+            tasks.append({'id': task_id(scene, stage, group.name), 'stage': stage, 'group': group.name, 'deps': [previous]})
+            previous = tasks[-1]['id']
+        last.append(previous)
+    tasks.append({'id': task_id(scene, 'fusion', SCENE_GROUP), 'stage': 'fusion', 'group': SCENE_GROUP, 'deps': last})
+    for task in tasks:
+        task.update({'scene': scene, 'input': input_path, 'scene_dir': scene_dir, 'output': output_path, 'params': params})
+    return tasks
+
+# Function to run one task in the calling process
+def run_task(task):
+    """Run the stage of one task on its group; the file layout is scene_dir/<stage>/<group file>."""
+    scene_dir = task['scene_dir']
+    params = task['params']
+    layout = dict((stage, os.path.join(scene_dir, stage)) for stage in ('split', 'voxel', 'dedup', 'reconstructed', 'devoxel'))
+    schema_path = os.path.join(layout['split'], 'schema.json')
+
+    if task['stage'] == 'split':
+        from attributes_spilt import read_ply, add_unique_id, filter_ply_columns, write_ply
+        for directory in layout.values():
+            os.makedirs(directory, exist_ok=True)
+        input_path = task['input']
+        if read_ply_header(input_path)[1] != 'ascii':
+            from binary_to_ascii import convert_binary_ply_to_ascii
+            input_path = os.path.join(scene_dir, 'ascii.ply')
+            convert_binary_ply_to_ascii(task['input'], input_path)
+        schema = AttributeSchema.from_ply(input_path, params['sh_degree'])
+        header, data = read_ply(input_path)
+        data = add_unique_id(data)
+        for group in schema.groups:
+            columns_to_keep = [schema.column_index(column) if column != PAD_COLUMN else None for column in group.columns]
+            updated_header, filtered_data = filter_ply_columns(header, data, columns_to_keep)
+            write_ply(os.path.join(layout['split'], group.file_name('split')), updated_header, filtered_data)
+        # Saved last: the later stages of this scene only start once the split is done
+        schema.save(layout['split'])
+        return
+
+    schema = AttributeSchema.load(schema_path)
+    if task['stage'] == 'fusion':
+        from fusion import stream_fusion
+        file_paths = [os.path.join(layout['devoxel'], group.file_name('devoxel')) for group in schema.groups]
+        columns_list = [[schema.output_name(col) for col in group.columns] + ['ID'] for group in schema.groups]
+        os.makedirs(os.path.dirname(task['output']) or '.', exist_ok=True)
+        count = stream_fusion(file_paths, columns_list, task['output'], 1000000)
+        print(f"Merged point cloud ({count} points) saved to: {task['output']}")
+        return
+
+    group = [group for group in schema.groups if group.name == task['group']][0]
+    split_path = os.path.join(layout['split'], group.file_name('split'))
+    voxel_path = os.path.join(layout['voxel'], group.file_name('voxel'))
+    dedup_path = os.path.join(layout['dedup'], group.file_name('dedup'))
+    reconstructed_path = os.path.join(layout['reconstructed'], group.file_name('reconstructed'))
+    devoxel_path = os.path.join(layout['devoxel'], group.file_name('devoxel'))
+    if task['stage'] == 'voxelize':
+        from voxelization import read_ply, normalize_and_voxelize, write_ply
+        header, data = read_ply(split_path)
+        write_ply(voxel_path, header, normalize_and_voxelize(data, params['voxel_resolution']))
+    elif task['stage'] == 'dedup':
+        from delete_repeat_voxel import detect_and_remove_duplicates
+        detect_and_remove_duplicates(voxel_path, dedup_path.replace('_norp.ply', '_rp.txt'), dedup_path)
+    elif task['stage'] == 'reconstruct' and params['engine'] == 'occupancy':
+        from occupancy_filter import filter_process
+        filter_process(dedup_path, reconstructed_path)
+    elif task['stage'] == 'reconstruct':
+        if params.get('pcgv2_dir') and params['pcgv2_dir'] not in sys.path:
+            sys.path.insert(0, params['pcgv2_dir'])
+        from repc5 import load_group, infer_group, store_group
+        model, device = worker_model(params['model_path'])
+        store_group(infer_group(model, device, load_group((dedup_path, reconstructed_path))), layout['reconstructed'])
+    elif task['stage'] == 'devoxelize':
+        from devoxelization import process_files
+        process_files(split_path, reconstructed_path, devoxel_path, params['voxel_resolution'])
+
+# Queue of pipeline tasks kept as plain files in a shared directory
+class WorkQueue:
+    """
+    Task queue on a shared file system (NFS, Lustre, ...), with no broker and no database.
+
+    - tasks/<id>.json: the task, written once by submit
+    - claims/<id>.<attempt>: a worker's lease on the task, created with O_CREAT | O_EXCL so exactly
+      one worker wins each attempt. The owner touches it every heartbeat; a claim whose mtime is
+      older than the lease is expired, and the next attempt may be claimed by any worker
+    - done/<id>.json, failed/<id>.json: final states; errors/<id>.<attempt>.txt: tracebacks
+
+    A task is run at most max_attempts times (crashes, expired leases and exceptions all count).
+    Lease ages are measured against the file system's own clock (the mtime of a freshly touched
+    file), so the clocks of the machines need not agree.
+    """
+
+    def __init__(self, queue_dir, lease=60.0, max_attempts=3):
+        self.queue_dir = queue_dir
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.tasks = {}
+        for name in QUEUE_DIRS:
+            os.makedirs(os.path.join(queue_dir, name), exist_ok=True)
+
+    def path(self, kind, name):
+        return os.path.join(self.queue_dir, kind, name)
+
+    def submit(self, tasks):
+        """Add tasks; tasks already in the queue keep their state and parameters. Return the number added."""
+        added = 0
+        kept = {}
+        for task in tasks:
+            path = self.path('tasks', f"{task['id']}.json")
+            if not os.path.exists(path):
+                write_json_atomic(path, task)
+                added += 1
+                continue
+            with open(path, 'r') as f:
+                queued_params = json.load(f)['params']
+            for key in sorted(task['params']):
+                if queued_params.get(key) != task['params'][key]:
+                    kept.setdefault(task['id'], []).append(f"{key}={queued_params.get(key)!r}")
+        if kept:
+            first = sorted(kept)[0]
+            print(f"Warning: {len(kept)} tasks were submitted before with different parameters and keep them "
+                  f"(e.g. {first}: {', '.join(kept[first])}); use a new queue directory to run with the new ones")
+        return added
+
+    def load_tasks(self):
+        """Read the task files not seen before (tasks never change once written)."""
+        for name in os.listdir(os.path.join(self.queue_dir, 'tasks')):
+            if name.endswith('.json') and name[:-5] not in self.tasks:
+                with open(self.path('tasks', name), 'r') as f:
+                    self.tasks[name[:-5]] = json.load(f)
+        return self.tasks
+
+    def finished(self, kind):
+        """IDs of the tasks in done/ or failed/."""
+        return set(name[:-5] for name in os.listdir(os.path.join(self.queue_dir, kind)) if name.endswith('.json'))
+
+    def claims(self):
+        """Latest attempt number of every claimed task."""
+        latest = {}
+        for name in os.listdir(os.path.join(self.queue_dir, 'claims')):
+            identifier, _, attempt = name.rpartition('.')
+            if attempt.isdigit():
+                latest[identifier] = max(latest.get(identifier, 0), int(attempt))
+        return latest
+
+    def fs_now(self, worker):
+        """Current time of the shared file system, read from the mtime of a file touched now."""
+        path = self.path('clock', worker)
+        with open(path, 'w'):
+            pass
+        return os.stat(path).st_mtime
+
+    def claim_age(self, identifier, attempt, now):
+        """Seconds since the last heartbeat of a claim (infinite if the claim was released)."""
+        try:
+            return now - os.stat(self.path('claims', f"{identifier}.{attempt}")).st_mtime
+        except FileNotFoundError:
+            return float('inf')
+
+    def try_claim(self, identifier, attempt, worker):
+        """Create the claim file of an attempt; return False if another worker created it first."""
+        try:
+            fd = os.open(self.path('claims', f"{identifier}.{attempt}"), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            f.write(json.dumps({'worker': worker, 'attempt': attempt}))
+        return True
+
+    def release(self, identifier, attempt):
+        """Give up a claim by making it expired, so the next attempt can be claimed right away."""
+        try:
+            os.utime(self.path('claims', f"{identifier}.{attempt}"), (0, 0))
+        except FileNotFoundError:
+            pass
+
+    def superseded(self, identifier, attempt):
+        """Whether a later attempt of the task was claimed, i.e. this claim's lease was lost."""
+        return os.path.exists(self.path('claims', f"{identifier}.{attempt + 1}"))
+
+    def mark(self, kind, identifier, state):
+        write_json_atomic(self.path(kind, f"{identifier}.json"), state)
+
+    def next_task(self, worker):
+        """
+        Claim the first runnable task: all of its dependencies done, not finished, and unclaimed or
+        with an expired claim. Tasks whose dependencies failed are marked failed too.
+
+        :return: (task, attempt), None if runnable tasks may still appear, or False if every task is finished
+        """
+        tasks = self.load_tasks()
+        done = self.finished('done')
+        failed = self.finished('failed')
+        latest = self.claims()
+        now = self.fs_now(worker)
+        pending = False
+        for identifier in sorted(tasks, key=lambda key: (STAGES.index(tasks[key]['stage']), key)):
+            if identifier in done or identifier in failed:
+                continue
+            task = tasks[identifier]
+            if any(dep in failed for dep in task['deps']):
+                self.mark('failed', identifier, {'worker': worker, 'error': DEPENDENCY_FAILED})
+                failed.add(identifier)
+                continue
+            pending = True
+            if not all(dep in done for dep in task['deps']):
+                continue
+            attempt = latest.get(identifier, 0)
+            if attempt and self.claim_age(identifier, attempt, now) <= self.lease:
+                continue  # Held by a live worker
+            if attempt >= self.max_attempts:
+                self.mark('failed', identifier, {'worker': worker, 'error': f"gave up after {attempt} attempts"})
+                failed.add(identifier)
+                continue
+            if self.try_claim(identifier, attempt + 1, worker):
+                return task, attempt + 1
+        return None if pending else False
+
+    def status(self):
+        """Number of tasks per state ('done', 'failed', 'running' or 'waiting') of every scene."""
+        tasks = self.load_tasks()
+        done = self.finished('done')
+        failed = self.finished('failed')
+        latest = self.claims()
+        now = self.fs_now(f"status-{socket.gethostname()}-{os.getpid()}")
+        counts = {}
+        for identifier, task in tasks.items():
+            if identifier in done:
+                state = 'done'
+            elif identifier in failed:
+                state = 'failed'
+            elif identifier in latest and self.claim_age(identifier, latest[identifier], now) <= self.lease:
+                state = 'running'
+            else:
+                state = 'waiting'
+            scene = counts.setdefault(task['scene'], {'done': 0, 'failed': 0, 'running': 0, 'waiting': 0})
+            scene[state] += 1
+        return counts
+
+# Function to keep a claim alive while its task runs
+def heartbeat(queue, identifier, attempt, interval, stop, lost):
+    """Touch the claim file every interval seconds; set lost if the lease was taken over."""
+    while not stop.wait(interval):
+        try:
+            os.utime(queue.path('claims', f"{identifier}.{attempt}"))
+        except FileNotFoundError:
+            lost.set()
+        if queue.superseded(identifier, attempt):
+            lost.set()
+
+# Function to run tasks until the queue is finished
+def worker_loop(queue_dir, lease, heartbeat_interval, max_attempts, poll_interval, wait):
+    """
+    Claim and run tasks one at a time. Exit when every task is done or failed, unless wait is set.
+
+    :return: Number of tasks this worker completed
+    """
+    queue = WorkQueue(queue_dir, lease, max_attempts)
+    worker = f"{socket.gethostname()}-{os.getpid()}"
+    completed = 0
+    while True:
+        claimed = queue.next_task(worker)
+        if not claimed:
+            if claimed is False and not wait:
+                return completed
+            time.sleep(poll_interval)
+            continue
+
+        task, attempt = claimed
+        stop, lost = threading.Event(), threading.Event()
+        beating = threading.Thread(target=heartbeat, args=(queue, task['id'], attempt, heartbeat_interval, stop, lost), daemon=True)
+        beating.start()
+        start = time.time()
+        try:
+            run_task(task)
+            error = None
+        except Exception:
+            error = traceback.format_exc()
+        stop.set()
+        beating.join()
+        seconds = time.time() - start
+
+        if lost.is_set() or queue.superseded(task['id'], attempt):
+            # Another worker re-claimed the task after our lease expired; its result counts
+            print(f"[{worker}] {task['id']}: lease lost, result discarded")
+        elif error is None:
+            queue.mark('done', task['id'], {'worker': worker, 'attempt': attempt, 'seconds': round(seconds, 3)})
+            completed += 1
+            print(f"[{worker}] {task['id']}: done in {seconds:.2f}s")
+        else:
+            with open(queue.path('errors', f"{task['id']}.{attempt}.txt"), 'w') as f:
+                f.write(error)
+            if attempt >= max_attempts:
+                queue.mark('failed', task['id'], {'worker': worker, 'attempt': attempt, 'error': error.strip().splitlines()[-1]})
+            queue.release(task['id'], attempt)
+            print(f"[{worker}] {task['id']}: attempt {attempt} failed: {error.strip().splitlines()[-1]}")
+
+# Set up command line arguments
+def parse_args():
+    parser = argparse.ArgumentParser(description="Distributed Denoise pipeline on a task queue kept in a shared directory.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    submit = subparsers.add_parser('submit', help="Add the (scene, group, stage) tasks of scenes to the queue")
+    submit.add_argument('--queue_dir', type=str, required=True, help="Queue directory on the shared file system")
+    submit.add_argument('--manifest', type=str, default=None, help="Text file with one 'path' or 'name path' per line")
+    submit.add_argument('--inputs', type=str, nargs='*', default=[], help="Glob patterns of point_cloud.ply files")
+    submit.add_argument('--work_dir', type=str, required=True, help="Shared directory for the per-scene intermediate folders")
+    submit.add_argument('--output_dir', type=str, required=True, help="Shared directory to save the denoised point clouds as <scene>.ply")
+    submit.add_argument('--engine', type=str, choices=['model', 'occupancy'], default='model', help="Reconstruction step: repc5.py (model) or occupancy_filter.py")
+    submit.add_argument('--model_path', type=str, default=None, help="Path to the trained model file (for --engine model)")
+    submit.add_argument('--pcgv2_dir', type=str, default=None, help="PCGv2 directory with repc5.py and pcc_model, added to the workers' sys.path (for --engine model)")
+    submit.add_argument('--voxel_resolution', type=int, default=7168, help="Resolution of the voxel grid")
+    submit.add_argument('--sh_degree', type=int, default=None, help="SH degree to keep (0-3)")
+
+    worker = subparsers.add_parser('worker', help="Run tasks from the queue; start any number on any machine")
+    worker.add_argument('--queue_dir', type=str, required=True, help="Queue directory on the shared file system")
+    worker.add_argument('--processes', type=int, default=1, help="Worker processes to start on this machine (default is 1)")
+    worker.add_argument('--lease', type=float, default=60.0, help="Seconds without a heartbeat after which a claim expires (default is 60)")
+    worker.add_argument('--heartbeat', type=float, default=10.0, help="Seconds between heartbeats (default is 10)")
+    worker.add_argument('--max_attempts', type=int, default=3, help="Attempts of a task before it is marked failed (default is 3)")
+    worker.add_argument('--poll_interval', type=float, default=2.0, help="Seconds between checks for runnable tasks (default is 2)")
+    worker.add_argument('--wait', action='store_true', help="Keep waiting for new tasks once the queue is finished")
+
+    status = subparsers.add_parser('status', help="Print the task states of every scene")
+    status.add_argument('--queue_dir', type=str, required=True, help="Queue directory on the shared file system")
+    status.add_argument('--lease', type=float, default=60.0, help="Lease used by the workers (default is 60)")
+    return parser.parse_args()
+
+# Main function
+def main():
+    args = parse_args()
+
+    if args.command == 'submit':
+        if args.engine == 'model' and not args.model_path:
+            raise ValueError("--engine model needs --model_path")
+        params = {'engine': args.engine, 'model_path': args.model_path and os.path.abspath(args.model_path),
+                  'pcgv2_dir': args.pcgv2_dir and os.path.abspath(args.pcgv2_dir),
+                  'voxel_resolution': args.voxel_resolution, 'sh_degree': args.sh_degree}
+        queue = WorkQueue(args.queue_dir)
+        for scene, input_path in collect_inputs(args.manifest, args.inputs):
+            scene_dir = os.path.abspath(os.path.join(args.work_dir, scene))
+            output_path = os.path.abspath(os.path.join(args.output_dir, f"{scene}.ply"))
+            tasks = scene_tasks(scene, input_path, scene_dir, output_path, params)
+            print(f"{scene}: {queue.submit(tasks)} of {len(tasks)} tasks added")
+
+    elif args.command == 'worker':
+        worker_args = (args.queue_dir, args.lease, args.heartbeat, args.max_attempts, args.poll_interval, args.wait)
+        if args.processes == 1:
+            worker_loop(*worker_args)
+            return
+        processes = [multiprocessing.Process(target=worker_loop, args=worker_args) for _ in range(args.processes)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+    else:
+        counts = WorkQueue(args.queue_dir, args.lease).status()
+        for scene in sorted(counts):
+            print(f"{scene}: " + ', '.join(f"{counts[scene][state]} {state}" for state in ('done', 'running', 'waiting', 'failed')))
+        for name in sorted(os.listdir(os.path.join(args.queue_dir, 'failed'))):
+            with open(os.path.join(args.queue_dir, 'failed', name), 'r') as f:
+                error = json.load(f)['error']
+            if error != DEPENDENCY_FAILED:
+                print(f"failed {name[:-5]}: {error}")
+
+if __name__ == "__main__":
+    main()